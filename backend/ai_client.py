@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+
+from metrics import upstream_timer
+
+CHAT_MODEL = os.getenv('AZURE_OPENAI_DEPLOYMENT', 'gpt-35-turbo')
+API_VERSION = os.getenv('AZURE_OPENAI_API_VERSION', '2024-02-15-preview')
+
+SYSTEM_PROMPT = (
+    "You are a helpful agricultural assistant. You can update farm data in the database if the user "
+    "provides details like crop name, quantity, and location. If data is missing (e.g. location), "
+    "ask for it before updating. Be concise."
+)
+
+# Tools (functions) the AI can call
+CHAT_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "update_farm_data",
+            "description": "Update farm data (crop, quantity, location) in the database based on user input",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "crop_name": {
+                        "type": "string",
+                        "description": "Name of the crop (e.g., Wheat, Rice)"
+                    },
+                    "quantity": {
+                        "type": "number",
+                        "description": "Quantity in kg or quintals (convert to kg)"
+                    },
+                    "location": {
+                        "type": "string",
+                        "description": "Location of the farm"
+                    },
+                    "harvest_date": {
+                        "type": "string",
+                        "description": "Harvest date in YYYY-MM-DD format"
+                    }
+                },
+                "required": ["crop_name"]
+            }
+        }
+    }
+]
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_openai_client():
+    """Return the process-wide Azure OpenAI client.
+
+    The client owns a keep-alive connection pool, so reusing it saves a TCP and
+    TLS handshake per request. It is rebuilt after fork() because pooled
+    sockets must not be shared between processes.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                # Imported here: openai is slow to import and most requests never need it
+                from openai import AzureOpenAI
+                _client = AzureOpenAI(
+                    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                    api_version=API_VERSION,
+                    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                    timeout=float(os.getenv('AZURE_OPENAI_TIMEOUT', '60')),
+                    max_retries=int(os.getenv('AZURE_OPENAI_MAX_RETRIES', '2')),
+                )
+                _client_pid = os.getpid()
+    return _client
+
+
+def reset_openai_client():
+    # Drop the cached client, e.g. after the endpoint settings changed
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+def build_messages(user_message, system_prompt_addition='', history=None):
+    system_message = SYSTEM_PROMPT
+    if system_prompt_addition:
+        system_message += f" {system_prompt_addition}"
+    return [
+        {"role": "system", "content": system_message},
+        *(history or ()),
+        {"role": "user", "content": user_message}
+    ]
+
+
+def stream_completion(messages, tools=None):
+    """Stream one chat completion.
+
+    Yields ('content', text) for each token as it arrives and, if the model
+    asked for tools, a final ('tool_calls', calls) with the call fragments
+    reassembled into plain message dicts ready to append to ``messages``.
+    """
+    kwargs = {"model": CHAT_MODEL, "messages": messages, "stream": True}
+    if tools:
+        kwargs.update(tools=tools, tool_choice="auto")
+    # Until the response headers arrive, then the whole streamed body
+    with upstream_timer('openai_chat_connect'):
+        stream = get_openai_client().chat.completions.create(**kwargs)
+
+    calls = {}
+    with upstream_timer('openai_chat_stream'):
+        try:
+            for chunk in stream:
+                # Azure sends a prompt-filter chunk with no choices first
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    yield 'content', delta.content
+                for fragment in delta.tool_calls or ():
+                    call = calls.setdefault(fragment.index, {
+                        "id": None, "type": "function", "function": {"name": "", "arguments": ""}
+                    })
+                    if fragment.id:
+                        call["id"] = fragment.id
+                    if fragment.function is not None:
+                        call["function"]["name"] += fragment.function.name or ''
+                        call["function"]["arguments"] += fragment.function.arguments or ''
+        finally:
+            stream.close()
+
+    if calls:
+        yield 'tool_calls', [calls[i] for i in sorted(calls)]
+
+
+def tool_call_args(call):
+    arguments = call["function"]["arguments"] or '{}'
+    return json.loads(arguments)
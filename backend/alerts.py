@@ -0,0 +1,243 @@
+import argparse
+import bisect
+import datetime
+import time
+from collections import namedtuple
+
+from db import copy_rows, db_connection
+from refdata import refdata
+
+WATCH_KINDS = ('above', 'below', 'forecast_up', 'forecast_down')
+MAX_WATCHES_PER_USER = 100
+# Days of forecast after the latest actual price that a forecast alert looks at
+FORECAST_ALERT_DAYS = 7
+# price_changes rows handled per transaction
+ALERT_BATCH_ROWS = 5000
+
+NOTIFICATION_COLUMNS = ('user_id', 'watch_id', 'type', 'priority', 'title', 'message',
+                        'crop_id', 'market_id', 'price_date')
+
+Watch = namedtuple('Watch', 'id user_id crop_id market_id kind threshold')
+
+
+# -- matching -----------------------------------------------------------------
+
+class WatchIndex:
+    """Watches grouped by (crop, market, kind), thresholds sorted within each group.
+
+    A price change only looks at its own (crop, market) group and the
+    crop's any-market group, and a binary search finds the thresholds it
+    crossed, so matching costs O(log watches) per change plus the alerts
+    it produces, however many users watch other series.
+    """
+
+    def __init__(self, watches):
+        groups = {}
+        for watch in watches:
+            groups.setdefault((watch.crop_id, watch.market_id, watch.kind), []).append(watch)
+        self.groups = {}
+        for key, members in groups.items():
+            members.sort(key=lambda w: w.threshold)
+            self.groups[key] = ([w.threshold for w in members], members)
+
+    def __len__(self):
+        return sum(len(members) for _, members in self.groups.values())
+
+    def _groups(self, crop_id, market_id, kind):
+        for key in ((crop_id, market_id, kind), (crop_id, None, kind)):
+            group = self.groups.get(key)
+            if group is not None:
+                yield group
+
+    def crossed(self, crop_id, market_id, previous, current):
+        """Watches whose threshold ``current`` reached and ``previous`` had not.
+
+        With no previous price, every threshold already reached counts.
+        """
+        for thresholds, members in self._groups(crop_id, market_id, 'above'):
+            lo = 0 if previous is None else bisect.bisect_right(thresholds, previous)
+            yield from members[lo:bisect.bisect_right(thresholds, current)]
+        for thresholds, members in self._groups(crop_id, market_id, 'below'):
+            hi = len(thresholds) if previous is None else bisect.bisect_left(thresholds, previous)
+            yield from members[bisect.bisect_left(thresholds, current):hi]
+
+    def forecast_moves(self, crop_id, market_id, rise_pct, fall_pct):
+        """forecast_up watches at or below ``rise_pct``, forecast_down ones at or below ``fall_pct``."""
+        for kind, move in (('forecast_up', rise_pct), ('forecast_down', fall_pct)):
+            if move <= 0:
+                continue
+            for thresholds, members in self._groups(crop_id, market_id, kind):
+                yield from members[:bisect.bisect_right(thresholds, move)]
+
+
+def _rupees(value):
+    return f"₹{value:,.2f}".rstrip('0').rstrip('.')
+
+
+def threshold_notification(watch, crop, market, market_id, day, price, previous):
+    verb = "crossed" if watch.kind == 'above' else "fell below"
+    was = f" (previously {_rupees(previous)}/kg)" if previous is not None else ""
+    return (watch.user_id, watch.id, 'price', 'high',
+            f"{crop} in {market} {verb} {_rupees(watch.threshold)}/kg",
+            f"{crop} at {market} was {_rupees(price)}/kg on {day:%d %b %Y}{was}.",
+            watch.crop_id, market_id, day)
+
+
+def forecast_notification(watch, crop, market, market_id, week, last_price, target_price, target_day, move_pct):
+    direction = "up" if watch.kind == 'forecast_up' else "down"
+    return (watch.user_id, watch.id, 'price', 'medium',
+            f"{crop} forecast {direction} {move_pct:.0f}% this week in {market}",
+            f"{crop} at {market} is forecast at {_rupees(target_price)}/kg on {target_day:%d %b}, "
+            f"{direction} from {_rupees(last_price)}/kg.",
+            watch.crop_id, market_id, week)
+
+
+def match_actuals(index, rows, crop_name=refdata.crop_name, market_name=refdata.market_name):
+    """rows: (market_id, crop_id, date, price, previous price or None) per changed actual price."""
+    for market_id, crop_id, day, price, previous in rows:
+        for watch in index.crossed(crop_id, market_id, previous, price):
+            yield threshold_notification(watch, crop_name(crop_id), market_name(market_id),
+                                         market_id, day, price, previous)
+
+
+def match_forecasts(index, rows, week, crop_name=refdata.crop_name, market_name=refdata.market_name):
+    """rows: (market_id, crop_id, last actual price, (min price, day), (max price, day)) per re-forecast series."""
+    for market_id, crop_id, last_price, (low, low_day), (high, high_day) in rows:
+        if not last_price or last_price <= 0:
+            continue
+        rise = (high - last_price) / last_price * 100.0
+        fall = (last_price - low) / last_price * 100.0
+        for watch in index.forecast_moves(crop_id, market_id, rise, fall):
+            base = (watch, crop_name(crop_id), market_name(market_id), market_id, week, last_price)
+            if watch.kind == 'forecast_up':
+                yield forecast_notification(*base, high, high_day, rise)
+            else:
+                yield forecast_notification(*base, low, low_day, fall)
+
+
+# -- data access --------------------------------------------------------------
+
+def load_watches(cur, crop_ids):
+    cur.execute("""
+        SELECT id, user_id, crop_id, market_id, kind, threshold
+        FROM price_watches WHERE crop_id = ANY(%s)
+    """, (list(crop_ids),))
+    return WatchIndex(Watch(*row) for row in cur.fetchall())
+
+
+def changed_actuals(cur, change_ids):
+    # Current price of each changed day and the actual price just before it
+    cur.execute("""
+        SELECT c.market_id, c.crop_id, c.date, mp.price_per_kg, prev.price_per_kg
+        FROM (SELECT DISTINCT market_id, crop_id, date FROM price_changes
+              WHERE id = ANY(%s) AND NOT is_predicted) c
+        JOIN market_prices mp
+          ON mp.market_id = c.market_id AND mp.crop_id = c.crop_id AND mp.date = c.date AND NOT mp.is_predicted
+        LEFT JOIN LATERAL (
+            SELECT p.price_per_kg FROM market_prices p
+            WHERE p.market_id = c.market_id AND p.crop_id = c.crop_id AND NOT p.is_predicted AND p.date < c.date
+            ORDER BY p.date DESC LIMIT 1
+        ) prev ON TRUE
+        ORDER BY c.date
+    """, (change_ids,))
+    return cur.fetchall()
+
+
+def changed_forecasts(cur, change_ids):
+    # Latest actual price and the forecast low/high over the following week
+    cur.execute("""
+        SELECT s.market_id, s.crop_id, last.price_per_kg,
+               MIN(f.price_per_kg), (array_agg(f.date ORDER BY f.price_per_kg, f.date))[1],
+               MAX(f.price_per_kg), (array_agg(f.date ORDER BY f.price_per_kg DESC, f.date))[1]
+        FROM (SELECT DISTINCT market_id, crop_id FROM price_changes
+              WHERE id = ANY(%s) AND is_predicted) s
+        JOIN LATERAL (
+            SELECT p.date, p.price_per_kg FROM market_prices p
+            WHERE p.market_id = s.market_id AND p.crop_id = s.crop_id AND NOT p.is_predicted
+            ORDER BY p.date DESC LIMIT 1
+        ) last ON TRUE
+        JOIN market_prices f
+          ON f.market_id = s.market_id AND f.crop_id = s.crop_id AND f.is_predicted
+         AND f.date > last.date AND f.date <= last.date + %s
+        GROUP BY s.market_id, s.crop_id, last.price_per_kg
+    """, (change_ids, FORECAST_ALERT_DAYS))
+    return [(m, c, last, (low, low_day), (high, high_day))
+            for m, c, last, low, low_day, high, high_day in cur.fetchall()]
+
+
+def write_notifications(cur, rows):
+    """Insert notification tuples, skipping any already sent; returns the number written."""
+    cur.execute("""
+        CREATE TEMP TABLE notification_staging (
+            user_id INTEGER, watch_id INTEGER, type VARCHAR(20), priority VARCHAR(10),
+            title TEXT, message TEXT, crop_id INTEGER, market_id INTEGER, price_date DATE
+        ) ON COMMIT DROP
+    """)
+    copy_rows(cur, 'notification_staging', NOTIFICATION_COLUMNS, rows)
+    cur.execute(f"""
+        INSERT INTO notifications ({', '.join(NOTIFICATION_COLUMNS)})
+        SELECT {', '.join(NOTIFICATION_COLUMNS)} FROM notification_staging
+        ON CONFLICT (watch_id, market_id, price_date) DO NOTHING
+    """)
+    written = cur.rowcount
+    cur.execute("DROP TABLE notification_staging")
+    return written
+
+
+def process_batch(cur, today, batch_rows=ALERT_BATCH_ROWS):
+    """Match one batch of logged price changes; returns (changes, notifications), (0, 0) when drained.
+
+    SKIP LOCKED lets several engines share the log without handling a change twice.
+    """
+    cur.execute("""
+        SELECT id, crop_id FROM price_changes ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+    """, (batch_rows,))
+    changes = cur.fetchall()
+    if not changes:
+        return 0, 0
+    change_ids = [row[0] for row in changes]
+
+    written = 0
+    index = load_watches(cur, {row[1] for row in changes})
+    if len(index):
+        week = today - datetime.timedelta(days=today.weekday())
+        notifications = list(match_actuals(index, changed_actuals(cur, change_ids)))
+        notifications.extend(match_forecasts(index, changed_forecasts(cur, change_ids), week))
+        if notifications:
+            written = write_notifications(cur, notifications)
+    cur.execute("DELETE FROM price_changes WHERE id = ANY(%s)", (change_ids,))
+    return len(changes), written
+
+
+# -- jobs ---------------------------------------------------------------------
+
+def run_alerts(batch_rows=ALERT_BATCH_ROWS, today=None):
+    """Drain price_changes, one committed batch at a time. Returns (changes, notifications)."""
+    today = today or datetime.date.today()
+    started = time.perf_counter()
+    total_changes = total_written = 0
+    with db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            while True:
+                changes, written = process_batch(cur, today, batch_rows)
+                conn.commit()
+                if not changes:
+                    break
+                total_changes += changes
+                total_written += written
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+    print(f"Matched {total_changes} price changes into {total_written} notifications "
+          f"in {time.perf_counter() - started:.2f}s.")
+    return total_changes, total_written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Turn new and re-forecast prices into watchlist notifications")
+    parser.add_argument('--batch-rows', type=int, default=ALERT_BATCH_ROWS, help="Change-log rows per transaction")
+    args = parser.parse_args()
+    run_alerts(args.batch_rows)
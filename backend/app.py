@@ -1,29 +1,116 @@
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask import Flask, jsonify, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+from flask import Blueprint, Flask, Response, current_app, jsonify, request
 from flask_cors import CORS
-from db import get_db_connection
+from db import db_connection, close_pool, copy_out_binary, get_pool, pool_stats, DatabaseUnavailable
+from refdata import refdata, notify_refdata_changed
+from crop_resolver import get_crop_resolver, resolve_crop_id
+from farm_ingest import bulk_format, read_farm_records, load_farm_data
+from price_ingest import FEED_FORMATS, read_price_feed, load_price_feed
+from geo_index import get_market_index
+from profit import user_recommendations
+from alerts import MAX_WATCHES_PER_USER, WATCH_KINDS
+from price_columns import (DAY_COLUMNS_SQL, ROLLUP_COLUMNS_SQL, MSGPACK_MIMETYPE, decode_rows,
+                           encode_price_columns, row_cursor, wants_msgpack)
+from metrics import init_metrics, logger, metrics_response
+from auth import (AdminRequired, HasherBusy, SessionInvalid, ThrottleExceeded, UserMismatch, SESSION_TTL,
+                  account_key, account_throttle, ip_throttle, is_admin, issue_token, password_hasher,
+                  token_user_id)
+from http_cache import (price_version, make_etag, is_not_modified, add_validators,
+                        not_modified_response, init_compression)
+import base64
+import csv
+import datetime
+import json
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
+api = Blueprint('api', __name__)
+
+@api.app_errorhandler(DatabaseUnavailable)
+def handle_database_unavailable(e):
+    logger.error("Database unavailable: %s", e)
+    return jsonify({"error": "Database connection failed"}), 500
+
+@api.app_errorhandler(ThrottleExceeded)
+def handle_throttled(e):
+    response = jsonify({"error": str(e)})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+@api.app_errorhandler(HasherBusy)
+def handle_hasher_busy(e):
+    logger.warning("Password hashing saturated: %s", e)
+    response = jsonify({"error": "Server busy, please try again"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@api.app_errorhandler(SessionInvalid)
+def handle_session_invalid(e):
+    return jsonify({"error": str(e)}), 401
+
+@api.app_errorhandler(UserMismatch)
+def handle_user_mismatch(e):
+    return jsonify({"error": str(e)}), 403
 
-@app.route('/')
+@api.app_errorhandler(AdminRequired)
+def handle_admin_required(e):
+    return jsonify({"error": str(e)}), 403
+
+def request_user_id(requested=None):
+    """The logged-in user's id; every user-scoped route needs a session token.
+
+    ``requested`` is a user_id the client sent along, which older clients
+    still do; it must name that same user.
+    """
+    user_id = token_user_id(request.headers)
+    if user_id is None:
+        raise SessionInvalid("Please log in to continue")
+    if requested is not None and str(requested).strip() != str(user_id):
+        raise UserMismatch("user_id does not match the logged-in user")
+    return user_id
+
+def request_admin_id():
+    """The logged-in user's id, provided ADMIN_USER_IDS lists them."""
+    user_id = request_user_id()
+    if not is_admin(user_id):
+        raise AdminRequired("This needs an administrator session")
+    return user_id
+
+@api.route('/')
 def index():
-    conn = get_db_connection()
-    if conn:
-        conn.close()
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
         return jsonify({"message": "Successfully connected to PostgreSQL!"}), 200
-    else:
+    except Exception:
+        logger.exception("Health check failed")
         return jsonify({"error": "Failed to connect to database."}), 500
 
-@app.route('/signup', methods=['POST'])
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text format; counters are per process
+    return metrics_response()
+
+@api.route('/stats', methods=['GET'])
+def get_stats():
+    tokens = get_speech_token_cache()
+    return jsonify({
+        "db_pool": pool_stats(),
+        "refdata": refdata.stats(),
+        "speech_token": tokens.stats() if tokens else None,
+        "chat_cache": chat_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+    }), 200
+
+@api.route('/signup', methods=['POST'])
 def signup():
-    print("Received signup request")
     data = request.json
-    print(f"Signup Data: {data}")
+    logger.info("Signup request", extra={"fields": {"email": data.get('email')}})
     name = data.get('name')
     email = data.get('email')
     phone = data.get('phone')
@@ -31,333 +118,1014 @@ def signup():
 
     if not all([name, email, password]):
         return jsonify({"error": "Missing required fields"}), 400
+    ip_throttle.hit(request.remote_addr)
 
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
+    with db_connection() as conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT id FROM users WHERE email = %s", (email,))
+            exists = cur.fetchone() is not None
+            cur.close()
+        except Exception as e:
+            logger.exception("Error creating user")
+            return jsonify({"error": str(e)}), 500
+    if exists:
+        return jsonify({"error": "Email already registered"}), 409
 
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT id FROM users WHERE email = %s", (email,))
-        if cur.fetchone():
-            return jsonify({"error": "Email already registered"}), 409
-        
-        password_hash = generate_password_hash(password)
-        cur.execute(
-            "INSERT INTO users (name, email, phone, password_hash) VALUES (%s, %s, %s, %s) RETURNING id",
-            (name, email, phone, password_hash)
-        )
-        user_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
-        return jsonify({"message": "User created successfully", "user_id": user_id}), 201
-    except Exception as e:
-        print(e)
-        return jsonify({"error": str(e)}), 500
+    # Hashed in the hashing pool with no connection checked out
+    password_hash = password_hasher.hash(password)
 
-@app.route('/login', methods=['POST'])
+    with db_connection() as conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO users (name, email, phone, password_hash) VALUES (%s, %s, %s, %s)
+                ON CONFLICT (email) DO NOTHING RETURNING id
+            """, (name, email, phone, password_hash))
+            row = cur.fetchone()
+            conn.commit()
+            cur.close()
+        except Exception as e:
+            logger.exception("Error creating user")
+            return jsonify({"error": str(e)}), 500
+    if row is None:
+        return jsonify({"error": "Email already registered"}), 409
+    return jsonify({"message": "User created successfully", "user_id": row[0]}), 201
+
+@api.route('/login', methods=['POST'])
 def login():
-    print("Received login request")
     data = request.json
-    print(f"Login Data: {data}")
+    logger.info("Login request", extra={"fields": {"email": data.get('email')}})
     email = data.get('email')
     password = data.get('password')
 
     if not all([email, password]):
         return jsonify({"error": "Missing email or password"}), 400
+    # Both throttles are checked before any hashing is done
+    ip_throttle.hit(request.remote_addr)
+    account = account_key(email)
+    retry_after = account_throttle.retry_after(account)
+    if retry_after:
+        raise ThrottleExceeded(retry_after)
 
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
+    with db_connection() as conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT id, name, password_hash FROM users WHERE email = %s", (email,))
+            user = cur.fetchone()
+            cur.close()
+        except Exception as e:
+            logger.exception("Error logging in")
+            return jsonify({"error": str(e)}), 500
 
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, password_hash FROM users WHERE email = %s", (email,))
-        user = cur.fetchone()
-        cur.close()
-        conn.close()
+    # The connection is back in the pool before the (slow) hash check runs
+    if not user or not password_hasher.check(user[2], password):
+        account_throttle.hit(account)
+        return jsonify({"error": "Invalid email or password"}), 401
 
-        if user and check_password_hash(user[2], password):
-            return jsonify({"message": "Login successful", "user": {"id": user[0], "name": user[1], "email": email}}), 200
-        else:
-            return jsonify({"error": "Invalid email or password"}), 401
-    except Exception as e:
-        print(e)
-        return jsonify({"error": str(e)}), 500
+    account_throttle.reset(account)
+    # Later requests send this token instead of the password
+    return jsonify({
+        "message": "Login successful",
+        "user": {"id": user[0], "name": user[1], "email": email},
+        "token": issue_token(user[0]),
+        "expires_in": SESSION_TTL,
+    }), 200
 
-@app.route('/prices', methods=['GET'])
-def get_prices():
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
-    crop = request.args.get('crop')
-    market = request.args.get('market')
-    
+PRICE_PAGE_MAX = 10000
+PRICE_STREAM_BATCH = 2000
+
+def encode_price_cursor(day, row_id):
+    return base64.urlsafe_b64encode(f"{day.isoformat()}:{row_id}".encode()).decode().rstrip('=')
+
+def decode_price_cursor(token):
     try:
-        cur = conn.cursor()
-        
-        # Build query dynamically based on filters
-        query = """
-            SELECT mp.date, mp.price_per_kg, mp.is_predicted, c.name, m.name
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        day, row_id = raw.split(':')
+        return datetime.date.fromisoformat(day), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def parse_bool_arg(value):
+    lowered = value.lower()
+    if lowered in ('1', 'true', 'yes'):
+        return True
+    if lowered in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f"Invalid boolean: {value}")
+
+PRICE_RESOLUTIONS = ('day', 'week', 'month')
+
+def build_price_query(args, columnar=False):
+    # Names are resolved through the reference-data cache, so the query only
+    # touches market_prices (or price_rollups for resolution=week|month);
+    # an unknown crop or market raises LookupError. columnar=True selects
+    # the fixed-width columns price_columns reads from a binary COPY.
+    resolution = args.get('resolution', 'day')
+    if resolution not in PRICE_RESOLUTIONS:
+        raise ValueError("resolution must be one of day, week, month")
+
+    if resolution == 'day':
+        query = (DAY_COLUMNS_SQL if columnar else """
+            SELECT mp.date, mp.price_per_kg, mp.is_predicted, mp.crop_id, mp.market_id, mp.id
+        """) + """
             FROM market_prices mp
-            JOIN crops c ON mp.crop_id = c.id
-            JOIN markets m ON mp.market_id = m.id
             WHERE 1=1
         """
         params = []
-        
-        if crop:
-            query += " AND c.name ILIKE %s"
-            params.append(crop)
-        
-        if market:
-            query += " AND m.name ILIKE %s"
-            params.append(market)
-            
-        query += " ORDER BY mp.date ASC"
-        
-        cur.execute(query, tuple(params))
-        rows = cur.fetchall()
-        
-        # Format response
-        data = []
-        for row in rows:
-            data.append({
-                "date": row[0].strftime('%Y-%m-%d'),
-                "price": float(row[1]),
-                "is_predicted": row[2],
-                "crop": row[3],
-                "market": row[4]
-            })
-            
-        cur.close()
-        conn.close()
-        return jsonify(data), 200
+        date_col, end_col, key_col = 'mp.date', 'mp.date', 'mp.id'
+        prefix = 'mp'
+    else:
+        # Rollups have no id; (market_id, is_predicted) packed into one integer
+        # orders rows within a period and doubles as the cursor tie-breaker
+        query = (ROLLUP_COLUMNS_SQL if columnar else """
+            SELECT r.period_start, r.avg_price, r.is_predicted, r.crop_id, r.market_id,
+                   r.market_id * 2 + r.is_predicted::int,
+                   r.open_price, r.high_price, r.low_price, r.close_price, r.num_days
+        """) + """
+            FROM price_rollups r
+            WHERE r.resolution = %s
+        """
+        params = [resolution]
+        date_col, end_col, key_col = 'r.period_start', 'r.period_end', 'r.market_id * 2 + r.is_predicted::int'
+        prefix = 'r'
+
+    if args.get('crop'):
+        crop_id = resolve_crop_id(args['crop'])
+        if crop_id is None:
+            raise LookupError(args['crop'])
+        query += f" AND {prefix}.crop_id = %s"
+        params.append(crop_id)
+
+    if args.get('market'):
+        market_id = refdata.market_id(args['market'])
+        if market_id is None:
+            raise LookupError(args['market'])
+        query += f" AND {prefix}.market_id = %s"
+        params.append(market_id)
+
+    try:
+        # A period is included if any of its days fall inside [from, to]
+        if args.get('from'):
+            query += f" AND {end_col} {'>=' if resolution == 'day' else '>'} %s"
+            params.append(datetime.date.fromisoformat(args['from']))
+        if args.get('to'):
+            query += f" AND {date_col} <= %s"
+            params.append(datetime.date.fromisoformat(args['to']))
+    except ValueError:
+        raise ValueError("Dates must be YYYY-MM-DD")
+
+    if args.get('is_predicted'):
+        query += f" AND {prefix}.is_predicted = %s"
+        params.append(parse_bool_arg(args['is_predicted']))
+
+    # Keyset pagination: resume strictly after the last (date, id) already seen
+    if args.get('cursor'):
+        query += f" AND ({date_col}, {key_col}) > (%s, %s)"
+        params.extend(decode_price_cursor(args['cursor']))
+
+    query += f" ORDER BY {date_col} ASC, {key_col} ASC"
+    return query, params
+
+def format_price_row(row):
+    item = {
+        "date": row[0].strftime('%Y-%m-%d'),
+        "price": float(row[1]),
+        "is_predicted": row[2],
+        "crop": refdata.crop_name(row[3]),
+        "market": refdata.market_name(row[4])
+    }
+    if len(row) > 6:
+        # Rollup candle: "date" is the period start and "price" its average
+        item.update({"open": row[6], "high": row[7], "low": row[8], "close": row[9], "days": row[10]})
+    return item
+
+def stream_prices(query, params):
+    # A named (server-side) cursor keeps only one batch of rows in memory.
+    # The first value yielded is a placeholder: priming the generator checks
+    # out a connection and runs the query while errors can still become a 500.
+    with db_connection() as conn:
+        cur = conn.cursor(name='prices_stream')
+        try:
+            cur.execute(query, params)
+            yield None
+            try:
+                yield '['
+                first = True
+                while True:
+                    rows = cur.fetchmany(PRICE_STREAM_BATCH)
+                    if not rows:
+                        break
+                    chunk = ','.join(json.dumps(format_price_row(row)) for row in rows)
+                    yield chunk if first else ',' + chunk
+                    first = False
+                yield ']'
+            except Exception:
+                # Headers are already sent, so all we can do is log and cut the body short
+                logger.exception("Error streaming prices")
+        finally:
+            cur.close()
+
+def price_columns_response(rows, resolution):
+    response = Response(encode_price_columns(rows, resolution), mimetype=MSGPACK_MIMETYPE)
+    response.vary.add('Accept')
+    return response
+
+@api.route('/prices', methods=['GET'])
+def get_prices():
+    # Accept: application/x-msgpack gets parallel binary columns instead of
+    # one JSON object per row
+    columnar = wants_msgpack(request.accept_mimetypes)
+    resolution = request.args.get('resolution', 'day')
+    try:
+        query, params = build_price_query(request.args, columnar)
+    except LookupError:
+        # Nothing can match a crop or market we have never heard of
+        if columnar:
+            return price_columns_response(decode_rows(b'', resolution), resolution), 200
+        return jsonify([]), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        limit = request.args.get('limit', type=int)
+        if limit is None and request.args.get('cursor'):
+            limit = 1000
+        if limit is not None:
+            if limit < 1:
+                raise ValueError("limit must be positive")
+            limit = min(limit, PRICE_PAGE_MAX)
+        stream = parse_bool_arg(request.args.get('stream', 'false'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    crop_id = resolve_crop_id(request.args['crop']) if request.args.get('crop') else None
+
+    with db_connection() as conn:
+        try:
+            cur = conn.cursor()
+
+            # Cheap validator first: a matching If-None-Match skips the real query
+            version, last_modified = price_version(cur, crop_id)
+            etag = make_etag('prices', version, 'msgpack') if columnar else make_etag('prices', version)
+            if is_not_modified(etag, last_modified):
+                cur.close()
+                return not_modified_response(current_app, etag, last_modified)
+
+            if columnar:
+                # Always one buffer: the columns are a fraction of the JSON size
+                if limit is not None:
+                    query += " LIMIT %s"
+                    params.append(limit + 1)
+                data = copy_out_binary(cur, cur.mogrify(query, tuple(params)).decode('utf-8'))
+                cur.close()
+                rows = decode_rows(data, resolution)
+
+                next_cursor = None
+                if limit is not None and len(rows) > limit:
+                    rows = rows[:limit]
+                    next_cursor = encode_price_cursor(*row_cursor(rows, limit - 1))
+
+                response = price_columns_response(rows, resolution)
+                if next_cursor:
+                    response.headers['X-Next-Cursor'] = next_cursor
+                return add_validators(response, etag, last_modified), 200
+
+            if not stream:
+                if limit is not None:
+                    # Fetch one extra row to learn whether another page exists
+                    query += " LIMIT %s"
+                    params.append(limit + 1)
+
+                cur.execute(query, tuple(params))
+                rows = cur.fetchall()
+                cur.close()
+
+                next_cursor = None
+                if limit is not None and len(rows) > limit:
+                    rows = rows[:limit]
+                    next_cursor = encode_price_cursor(rows[-1][0], rows[-1][5])
+
+                # Format response
+                data = [format_price_row(row) for row in rows]
+
+                response = jsonify(data)
+                response.vary.add('Accept')
+                if next_cursor:
+                    response.headers['X-Next-Cursor'] = next_cursor
+                return add_validators(response, etag, last_modified), 200
+            cur.close()
+        except Exception as e:
+            logger.exception("Error fetching prices")
+            return jsonify({"error": str(e)}), 500
+
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    body = stream_prices(query, tuple(params))
+    try:
+        next(body)
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
-        print(e)
+        logger.exception("Error fetching prices")
         return jsonify({"error": str(e)}), 500
+    response = Response(body, mimetype='application/json')
+    response.vary.add('Accept')
+    return add_validators(response, etag, last_modified)
+
+# Everything the dashboards need per market in one pass: the ranks pick the
+# trailing history / leading forecast windows and the per-market aggregates
+# ride along in the same GROUP BY.
+PRICE_SUMMARY_SQL = """
+    WITH ranked AS (
+        SELECT mp.market_id, mp.date, mp.price_per_kg, mp.is_predicted,
+               ROW_NUMBER() OVER (PARTITION BY mp.market_id, mp.is_predicted ORDER BY mp.date DESC) AS rn_desc,
+               ROW_NUMBER() OVER (PARTITION BY mp.market_id, mp.is_predicted ORDER BY mp.date ASC) AS rn_asc
+        FROM market_prices mp
+        WHERE mp.crop_id = %s
+    )
+    SELECT r.market_id,
+           MAX(r.price_per_kg) FILTER (WHERE NOT r.is_predicted AND r.rn_desc = 1) AS current_price,
+           MAX(r.price_per_kg) FILTER (WHERE NOT r.is_predicted AND r.rn_desc = 2) AS previous_price,
+           MAX(r.price_per_kg) FILTER (WHERE r.is_predicted) AS max_predicted,
+           MIN(r.price_per_kg) AS low,
+           MAX(r.price_per_kg) AS high,
+           AVG(r.price_per_kg) AS avg,
+           COALESCE(json_agg(json_build_object('date', to_char(r.date, 'YYYY-MM-DD'), 'price', r.price_per_kg) ORDER BY r.date)
+                    FILTER (WHERE NOT r.is_predicted AND r.rn_desc <= %s), '[]') AS history,
+           COALESCE(json_agg(json_build_object('date', to_char(r.date, 'YYYY-MM-DD'), 'price', r.price_per_kg) ORDER BY r.date)
+                    FILTER (WHERE r.is_predicted AND r.rn_asc <= %s), '[]') AS forecast
+    FROM ranked r
+    GROUP BY r.market_id
+"""
+
+@api.route('/prices/summary', methods=['GET'])
+def get_price_summary():
+    crop = request.args.get('crop')
+    if not crop:
+        return jsonify({"error": "crop is required"}), 400
+
+    history_days = min(request.args.get('history', 15, type=int), 365)
+    forecast_days = min(request.args.get('forecast', 15, type=int), 365)
 
-@app.route('/markets', methods=['GET'])
+    crop_id = resolve_crop_id(crop)
+    if crop_id is None:
+        return jsonify([]), 200
+
+    with db_connection() as conn:
+        try:
+            cur = conn.cursor()
+
+            version, last_modified = price_version(cur, crop_id)
+            etag = make_etag('summary', version)
+            if is_not_modified(etag, last_modified):
+                cur.close()
+                return not_modified_response(current_app, etag, last_modified)
+
+            cur.execute(PRICE_SUMMARY_SQL, (crop_id, history_days, forecast_days))
+            rows = cur.fetchall()
+
+            summary = []
+            for row in rows:
+                market = refdata.market(row[0])
+                current_price = float(row[1]) if row[1] is not None else 0.0
+                summary.append({
+                    "market": market[1],
+                    "location": market[2],
+                    "current_price": current_price,
+                    "previous_price": float(row[2]) if row[2] is not None else current_price,
+                    "max_predicted": float(row[3]) if row[3] is not None else current_price,
+                    "low": float(row[4]),
+                    "high": float(row[5]),
+                    "avg": round(float(row[6]), 2),
+                    "history": row[7],
+                    "forecast": row[8]
+                })
+            summary.sort(key=lambda s: s["market"])
+
+            cur.close()
+            return add_validators(jsonify(summary), etag, last_modified), 200
+        except Exception as e:
+            logger.exception("Error building price summary")
+            return jsonify({"error": str(e)}), 500
+
+def format_market(row):
+    return {
+        "id": row[0],
+        "name": row[1],
+        "location": row[2],
+        "coordinates": {"lat": float(row[3]), "lng": float(row[4])},
+        "spoilageRisk": row[5]
+    }
+
+@api.route('/markets', methods=['GET'])
 def get_markets():
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
     try:
+        etag = make_etag('markets', refdata.markets_digest())
+        if is_not_modified(etag):
+            return not_modified_response(current_app, etag)
+
+        markets = [format_market(row) for row in refdata.markets()]
+        return add_validators(jsonify(markets), etag), 200
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logger.exception("Error fetching markets")
+        return jsonify({"error": str(e)}), 500
+
+NEAREST_MAX_K = 100
+
+def latest_prices(crop_id, market_ids):
+    # One backward index probe per market on (crop_id, market_id, date)
+    with db_connection() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT id, name, location, lat, lng, spoilage_risk FROM markets")
+        cur.execute("""
+            SELECT m.id, p.date, p.price_per_kg
+            FROM unnest(%s::int[]) AS m(id)
+            CROSS JOIN LATERAL (
+                SELECT date, price_per_kg FROM market_prices
+                WHERE crop_id = %s AND market_id = m.id AND NOT is_predicted
+                ORDER BY date DESC
+                LIMIT 1
+            ) p
+        """, (market_ids, crop_id))
         rows = cur.fetchall()
-        
-        markets = []
-        for row in rows:
-            markets.append({
-                "id": row[0],
-                "name": row[1],
-                "location": row[2],
-                "coordinates": {"lat": float(row[3]), "lng": float(row[4])},
-                "spoilageRisk": row[5]
-            })
-            
         cur.close()
-        conn.close()
+    return {market_id: {"date": day.strftime('%Y-%m-%d'), "price": float(price)} for market_id, day, price in rows}
+
+@api.route('/markets/nearest', methods=['GET'])
+def get_nearest_markets():
+    try:
+        lat = float(request.args['lat'])
+        lng = float(request.args['lng'])
+        k = min(request.args.get('k', 10, type=int), NEAREST_MAX_K)
+        radius_km = float(request.args['radius_km']) if request.args.get('radius_km') else None
+    except (KeyError, ValueError):
+        return jsonify({"error": "lat and lng are required and must be numbers"}), 400
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return jsonify({"error": "lat must be within [-90, 90] and lng within [-180, 180]"}), 400
+    if k <= 0 or (radius_km is not None and not radius_km > 0):
+        return jsonify({"error": "k and radius_km must be positive"}), 400
+
+    try:
+        nearest = get_market_index().nearest(lat, lng, k, radius_km)
+        crop = request.args.get('crop')
+        prices = {}
+        if crop and nearest:
+            crop_id = resolve_crop_id(crop)
+            if crop_id is not None:
+                prices = latest_prices(crop_id, [market_id for market_id, _ in nearest])
+
+        markets = []
+        for market_id, distance in nearest:
+            item = format_market(refdata.market(market_id))
+            item["distanceKm"] = round(distance, 2)
+            if crop:
+                # Unknown crop or no prices yet: the market is still near
+                item["latestPrice"] = prices.get(market_id)
+            markets.append(item)
         return jsonify(markets), 200
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
-        print(e)
+        logger.exception("Error finding nearest markets")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/crops', methods=['GET'])
+@api.route('/crops', methods=['GET'])
 def get_crops():
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT id, name FROM crops ORDER BY name")
-        rows = cur.fetchall()
-        
-        crops = [{"id": r[0], "name": r[1]} for r in rows]
-            
-        cur.close()
-        conn.close()
-        return jsonify(crops), 200
+        etag = make_etag('crops', refdata.crops_digest())
+        if is_not_modified(etag):
+            return not_modified_response(current_app, etag)
+
+        crops = [{"id": r[0], "name": r[1]} for r in refdata.crops()]
+        return add_validators(jsonify(crops), etag), 200
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
-        print(e)
+        logger.exception("Error fetching crops")
         return jsonify({"error": str(e)}), 500
 
-# ... existing code ...
+@api.route('/farm-data/bulk', methods=['POST'])
+def bulk_farm_data():
+    # CSV or JSON lines, read straight off the request stream; invalid rows
+    # are reported per line and never abort the rest of the batch
+    user_id = request_user_id(request.args.get('user_id'))
+    fmt = bulk_format(request.args.get('format'), request.mimetype)
+    if fmt is None:
+        return jsonify({"error": "Send text/csv or application/x-ndjson (or ?format=csv|jsonl)"}), 415
 
-import requests
-from openai import AzureOpenAI
-import json
+    with db_connection() as conn:
+        try:
+            records = read_farm_records(request.stream, fmt)
+            # Administrators may file rows for other users, e.g. a cooperative's members
+            result = load_farm_data(conn, records, user_id, any_user=is_admin(user_id))
+            conn.commit()
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            conn.rollback()
+            return jsonify({"error": str(e)}), 400
+        except DatabaseUnavailable:
+            raise
+        except Exception as e:
+            conn.rollback()
+            logger.exception("Error loading farm data")
+            return jsonify({"error": str(e)}), 500
+    return jsonify(result), 200
 
-# Initialize Azure OpenAI Client
-def get_openai_client():
-    return AzureOpenAI(
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        api_version="2024-02-15-preview",
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-    )
+@api.route('/prices/ingest', methods=['POST'])
+def ingest_prices():
+    # Daily feed upsert; history outside the feed is never touched and
+    # re-posting the same file is a no-op. Prices are shared by everyone,
+    # so only administrators may load them
+    request_admin_id()
+    fmt = bulk_format(request.args.get('format'), request.mimetype, FEED_FORMATS)
+    if fmt is None:
+        return jsonify({"error": "Send text/csv, application/x-ndjson or application/json (or ?format=csv|jsonl|json)"}), 415
 
-@app.route('/api/ai/speech-token', methods=['GET'])
-def get_speech_token():
+    with db_connection() as conn:
+        try:
+            result = load_price_feed(conn, read_price_feed(request.stream, fmt))
+            conn.commit()
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            conn.rollback()
+            return jsonify({"error": str(e)}), 400
+        except DatabaseUnavailable:
+            raise
+        except Exception as e:
+            conn.rollback()
+            logger.exception("Error ingesting price feed")
+            return jsonify({"error": str(e)}), 500
+    return jsonify(result), 200
+
+@api.route('/profit/recommendations', methods=['GET'])
+def get_profit_recommendations():
+    # Best market and sell date per farm lot: tonight's batch when it covers
+    # every lot, otherwise evaluated on the spot
+    user_id = request_user_id(request.args.get('user_id'))
     try:
-        speech_key = os.getenv('AZURE_SPEECH_KEY')
-        speech_region = os.getenv('AZURE_SPEECH_REGION')
+        return jsonify(user_recommendations(user_id)), 200
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logger.exception("Error computing profit recommendations")
+        return jsonify({"error": str(e)}), 500
 
-        if not speech_key or not speech_region:
-            return jsonify({"error": "Speech key or region not configured"}), 500
+def format_watch(row):
+    # row: (id, crop_id, market_id, kind, threshold, created_at)
+    return {
+        "id": row[0],
+        "crop": refdata.crop_name(row[1]),
+        "market": refdata.market_name(row[2]) if row[2] is not None else None,
+        "kind": row[3],
+        "threshold": row[4],
+        "created_at": row[5].isoformat(),
+    }
 
-        headers = {
-            'Ocp-Apim-Subscription-Key': speech_key,
-            'Content-Type': 'application/x-www-form-urlencoded'
-        }
+@api.route('/watchlist', methods=['GET'])
+def get_watchlist():
+    user_id = request_user_id(request.args.get('user_id'))
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT id, crop_id, market_id, kind, threshold, created_at
+                FROM price_watches WHERE user_id = %s ORDER BY id
+            """, (user_id,))
+            rows = cur.fetchall()
+            cur.close()
+        return jsonify([format_watch(row) for row in rows]), 200
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logger.exception("Error fetching watchlist")
+        return jsonify({"error": str(e)}), 500
 
-        response = requests.post(
-            f'https://{speech_region}.api.cognitive.microsoft.com/sts/v1.0/issueToken',
-            headers=headers
-        )
+@api.route('/watchlist', methods=['POST'])
+def add_watch():
+    # {"crop": "Tomato", "market": "Vashi Market" (optional: any market),
+    #  "kind": "above" | "below" | "forecast_up" | "forecast_down", "threshold": 50}
+    data = request.get_json(silent=True) or {}
+    user_id = request_user_id(data.get('user_id'))
+    kind = data.get('kind')
+    if kind not in WATCH_KINDS:
+        return jsonify({"error": f"kind must be one of {', '.join(WATCH_KINDS)}"}), 400
+    try:
+        threshold = float(data['threshold'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "threshold is required and must be a number"}), 400
+    if not 0 < threshold < float('inf'):
+        return jsonify({"error": "threshold must be positive"}), 400
+
+    crop_id = resolve_crop_id(data['crop']) if data.get('crop') else None
+    if crop_id is None:
+        return jsonify({"error": f"Unknown crop: {data.get('crop')}"}), 400
+    market_id = None
+    if data.get('market'):
+        market_id = refdata.market_id(data['market'])
+        if market_id is None:
+            return jsonify({"error": f"Unknown market: {data['market']}"}), 400
+
+    with db_connection() as conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*) FROM price_watches WHERE user_id = %s", (user_id,))
+            if cur.fetchone()[0] >= MAX_WATCHES_PER_USER:
+                conn.rollback()
+                return jsonify({"error": f"At most {MAX_WATCHES_PER_USER} watches per user"}), 400
+            cur.execute("""
+                INSERT INTO price_watches (user_id, crop_id, market_id, kind, threshold)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id, crop_id, market_id, kind, threshold, created_at
+            """, (user_id, crop_id, market_id, kind, threshold))
+            watch = cur.fetchone()
+            conn.commit()
+            cur.close()
+        except DatabaseUnavailable:
+            raise
+        except Exception as e:
+            conn.rollback()
+            logger.exception("Error adding watch")
+            return jsonify({"error": str(e)}), 500
+    return jsonify(format_watch(watch)), 201
+
+@api.route('/watchlist/<int:watch_id>', methods=['DELETE'])
+def delete_watch(watch_id):
+    user_id = request_user_id(request.args.get('user_id'))
+    with db_connection() as conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM price_watches WHERE id = %s AND user_id = %s", (watch_id, user_id))
+            deleted = cur.rowcount
+            conn.commit()
+            cur.close()
+        except DatabaseUnavailable:
+            raise
+        except Exception as e:
+            conn.rollback()
+            logger.exception("Error deleting watch")
+            return jsonify({"error": str(e)}), 500
+    if not deleted:
+        return jsonify({"error": "Watch not found"}), 404
+    return jsonify({"deleted": watch_id}), 200
+
+NOTIFICATION_PAGE_MAX = 200
+
+@api.route('/notifications', methods=['GET'])
+def get_notifications():
+    # Newest first; X-Next-Cursor continues below the last id returned
+    user_id = request_user_id(request.args.get('user_id'))
+    limit = min(request.args.get('limit', 50, type=int), NOTIFICATION_PAGE_MAX)
+    if limit <= 0:
+        return jsonify({"error": "limit must be positive"}), 400
+    query = """
+        SELECT id, type, priority, title, message, crop_id, market_id, price_date, created_at, read_at
+        FROM notifications WHERE user_id = %s
+    """
+    params = [user_id]
+    try:
+        if request.args.get('unread') and parse_bool_arg(request.args['unread']):
+            query += " AND read_at IS NULL"
+        if request.args.get('cursor'):
+            query += " AND id < %s"
+            params.append(int(request.args['cursor']))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    query += " ORDER BY id DESC LIMIT %s"
+    params.append(limit)
 
-        if response.status_code == 200:
-            return jsonify({
-                "token": response.text,
-                "region": speech_region
-            })
-        else:
-            return jsonify({"error": "Failed to get token"}), response.status_code
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            cur.close()
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
-        print(f"Error getting speech token: {e}")
+        logger.exception("Error fetching notifications")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/ai/chat', methods=['POST'])
+    notifications = [{
+        "id": row[0],
+        "type": row[1],
+        "priority": row[2],
+        "title": row[3],
+        "message": row[4],
+        "crop": refdata.crop_name(row[5]) if row[5] is not None else None,
+        "marketId": row[6],
+        "priceDate": row[7].isoformat() if row[7] else None,
+        "timestamp": row[8].isoformat(),
+        "read": row[9] is not None,
+    } for row in rows]
+    response = jsonify(notifications)
+    if len(rows) == limit:
+        response.headers['X-Next-Cursor'] = str(rows[-1][0])
+    return response, 200
+
+@api.route('/notifications/<int:notification_id>/read', methods=['POST'])
+def mark_notification_read(notification_id):
+    user_id = request_user_id(request.args.get('user_id'))
+    with db_connection() as conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE notifications SET read_at = COALESCE(read_at, now())
+                WHERE id = %s AND user_id = %s
+            """, (notification_id, user_id))
+            updated = cur.rowcount
+            conn.commit()
+            cur.close()
+        except DatabaseUnavailable:
+            raise
+        except Exception as e:
+            conn.rollback()
+            logger.exception("Error marking notification read")
+            return jsonify({"error": str(e)}), 500
+    if not updated:
+        return jsonify({"error": "Notification not found"}), 404
+    return jsonify({"read": notification_id}), 200
+
+# ... existing code ...
+
+from speech_token import SpeechTokenError, get_speech_token_cache
+from ai_client import (CHAT_MODEL, CHAT_TOOLS, build_messages, get_openai_client, reset_openai_client,
+                       stream_completion, tool_call_args)
+from conversations import load_conversation, shutdown_compactor
+from response_cache import chat_cache
+
+@api.route('/api/ai/speech-token', methods=['GET'])
+def get_speech_token():
+    try:
+        tokens = get_speech_token_cache()
+        if tokens is None:
+            return jsonify({"error": "Speech key or region not configured"}), 500
+
+        # Served from the cache; only the first call (or an expired token) waits on Azure
+        token, expires_in = tokens.get()
+        return jsonify({
+            "token": token,
+            "region": tokens.region,
+            "expires_in": int(expires_in)
+        })
+    except SpeechTokenError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except Exception as e:
+        logger.exception("Error getting speech token")
+        return jsonify({"error": str(e)}), 500
+
+def save_farm_data(user_id, function_args, resolver=None, connection=db_connection):
+    # Execute the database update
+    crop_name = function_args.get('crop_name')
+    # Resolve spelling variants and local names ("tamatar", "tomatoes") to a
+    # known crop; only a name nothing resembles becomes a new crop
+    resolver = resolver or get_crop_resolver()
+    crop_id = resolver.resolve_id(crop_name)
+    inserted_crop = crop_id is None
+
+    with connection() as conn:
+        cur = conn.cursor()
+
+        if inserted_crop:
+            # Auto-insert crop if not exists? Or tell user.
+            # For now, let's insert it (and tell every worker's cache)
+            cur.execute("""
+                INSERT INTO crops (name) VALUES (%s)
+                ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+                RETURNING id
+            """, (crop_name,))
+            crop_id = cur.fetchone()[0]
+            notify_refdata_changed(cur)
+
+        # Insert/Update farm data
+        # Default values if missing
+        qty = function_args.get('quantity', 0)
+        loc = function_args.get('location', 'Unknown')
+        date = function_args.get('harvest_date', '2024-01-01')
+
+        cur.execute("""
+            INSERT INTO farm_data (user_id, crop_id, quantity_kg, location, harvest_date)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (user_id, crop_id, qty, loc, date))
+
+        conn.commit()
+        cur.close()
+
+    if inserted_crop:
+        refdata.invalidate()
+        return "Successfully updated database with farm data."
+    return f"Successfully updated database with farm data for {resolver.names[crop_id]}."
+
+CHAT_TOOL_HANDLERS = {
+    "update_farm_data": save_farm_data,
+}
+
+def run_tool_calls(messages, tool_calls, user_id):
+    """Execute the requested tools and append the round trip to ``messages``."""
+    messages.append({"role": "assistant", "content": None, "tool_calls": tool_calls})
+    for call in tool_calls:
+        name = call["function"]["name"]
+        handler = CHAT_TOOL_HANDLERS.get(name)
+        content = handler(user_id, tool_call_args(call)) if handler else f"Unknown tool: {name}"
+        # Report back to AI
+        messages.append({
+            "tool_call_id": call["id"],
+            "role": "tool",
+            "name": name,
+            "content": content
+        })
+
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop proxies (nginx) from buffering the event stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def stream_chat(messages, user_id, conversation=None, cache_key=None):
+    # Events: unnamed {"delta": text} per token, "tool" when a tool ran,
+    # then "done" - or "error", since the status line is long gone by then
+    user_message = messages[-1]["content"]
+    try:
+        started = time.perf_counter()
+        reply = []
+        tool_calls = None
+        for kind, value in stream_completion(messages, CHAT_TOOLS):
+            if kind == 'content':
+                reply.append(value)
+                yield sse_event({"delta": value})
+            else:
+                tool_calls = value
+
+        if tool_calls:
+            run_tool_calls(messages, tool_calls, user_id)
+            yield sse_event({"names": [c["function"]["name"] for c in tool_calls]}, event='tool')
+            # Stream the final answer too, so the wait after a tool call is just as short
+            for kind, value in stream_completion(messages):
+                if kind == 'content':
+                    reply.append(value)
+                    yield sse_event({"delta": value})
+
+        reply = ''.join(reply)
+        remember_reply(cache_key, reply, tool_calls, time.perf_counter() - started)
+        if conversation is not None:
+            # Stored before "done" so a quick follow-up already sees this turn
+            conversation.record(user_message, reply)
+        yield sse_event({}, event='done')
+    except Exception as e:
+        logger.exception("AI Error")
+        yield sse_event({"error": str(e)}, event='error')
+
+def stream_cached_reply(reply, user_message, conversation=None):
+    yield sse_event({"delta": reply})
+    if conversation is not None:
+        conversation.record(user_message, reply)
+    yield sse_event({"cached": True}, event='done')
+
+def remember_reply(cache_key, reply, tool_calls, latency):
+    if cache_key is None or not reply:
+        return
+    if tool_calls:
+        # The reply reports on a write (update_farm_data) - replaying it would skip the write
+        chat_cache.skip()
+        return
+    chat_cache.set(cache_key, reply, latency)
+
+@api.route('/api/ai/chat', methods=['POST'])
 def chat_with_ai():
     data = request.json
     user_message = data.get('message')
-    user_id = data.get('user_id', 1) # Default to admin for now
+    user_id = request_user_id(data.get('user_id'))
     system_prompt_addition = data.get('system_prompt_addition', '')
+    # With a session id the server keeps the history; without one each call stands alone
+    session_id = data.get('session_id')
+    stream = bool(data.get('stream'))
 
     if not user_message:
         return jsonify({"error": "Message is required"}), 400
 
-    client = get_openai_client()
-
-    # Define tools (functions) the AI can call
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "update_farm_data",
-                "description": "Update farm data (crop, quantity, location) in the database based on user input",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "crop_name": {
-                            "type": "string",
-                            "description": "Name of the crop (e.g., Wheat, Rice)"
-                        },
-                        "quantity": {
-                            "type": "number",
-                            "description": "Quantity in kg or quintals (convert to kg)"
-                        },
-                        "location": {
-                            "type": "string",
-                            "description": "Location of the farm"
-                        },
-                        "harvest_date": {
-                            "type": "string",
-                            "description": "Harvest date in YYYY-MM-DD format"
-                        }
-                    },
-                    "required": ["crop_name"]
-                }
-            }
-        }
-    ]
+    conversation = load_conversation(user_id, str(session_id)[:64]) if session_id else None
 
-    try:
-        # 1. Call OpenAI
-        base_system_message = "You are a helpful agricultural assistant. You can update farm data in the database if the user provides details like crop name, quantity, and location. If data is missing (e.g. location), ask for it before updating. Be concise."
-        
-        if system_prompt_addition:
-            base_system_message += f" {system_prompt_addition}"
+    # Only turns with no history are cacheable: with context the same words can mean something else
+    cache_key = None
+    if conversation is None or conversation.is_new():
+        cache_key = chat_cache.key(user_message, system_prompt_addition)
+        cached = chat_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            if stream:
+                return sse_response(stream_cached_reply(cached, user_message, conversation))
+            if conversation is not None:
+                conversation.record(user_message, cached)
+            return jsonify({"response": cached, "cached": True})
+
+    messages = build_messages(user_message, system_prompt_addition,
+                              conversation.messages() if conversation else None)
 
-        messages = [
-            {"role": "system", "content": base_system_message},
-            {"role": "user", "content": user_message}
-        ]
+    if stream:
+        return sse_response(stream_chat(messages, user_id, conversation, cache_key))
 
+    try:
+        started = time.perf_counter()
+        client = get_openai_client()
+
+        # 1. Call OpenAI
         response = client.chat.completions.create(
-            model="gpt-35-turbo", # OR your deployment name from env if variable
+            model=CHAT_MODEL,
             messages=messages,
-            tools=tools,
+            tools=CHAT_TOOLS,
             tool_choice="auto"
         )
 
         response_message = response.choices[0].message
-        
+        reply = response_message.content
+        tool_calls = None
+
         # 2. Check if AI wants to call a function
         if response_message.tool_calls:
-            tool_call = response_message.tool_calls[0]
-            function_name = tool_call.function.name
-            function_args = json.loads(tool_call.function.arguments)
-
-            if function_name == "update_farm_data":
-                # Execute the database update
-                conn = get_db_connection()
-                if conn:
-                    cur = conn.cursor()
-                    
-                    # Find crop ID
-                    cur.execute("SELECT id FROM crops WHERE name ILIKE %s", (function_args.get('crop_name'),))
-                    crop_res = cur.fetchone()
-                    
-                    if not crop_res:
-                        # Auto-insert crop if not exists? Or tell user.
-                        # For now, let's insert it
-                        cur.execute("INSERT INTO crops (name) VALUES (%s) RETURNING id", (function_args.get('crop_name'),))
-                        crop_id = cur.fetchone()[0]
-                    else:
-                        crop_id = crop_res[0]
-
-                    # Insert/Update farm data
-                    # Default values if missing
-                    qty = function_args.get('quantity', 0)
-                    loc = function_args.get('location', 'Unknown')
-                    date = function_args.get('harvest_date', '2024-01-01')
-
-                    cur.execute("""
-                        INSERT INTO farm_data (user_id, crop_id, quantity_kg, location, harvest_date)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, (user_id, crop_id, qty, loc, date))
-                    
-                    conn.commit()
-                    cur.close()
-                    conn.close()
-
-                    # Report back to AI
-                    messages.append(response_message)
-                    messages.append({
-                        "tool_call_id": tool_call.id,
-                        "role": "tool",
-                        "name": function_name,
-                        "content": "Successfully updated database with farm data."
-                    })
-
-                    # Get final response from AI
-                    second_response = client.chat.completions.create(
-                        model="gpt-35-turbo",
-                        messages=messages
-                    )
-                    return jsonify({"response": second_response.choices[0].message.content})
-
-        # Normal response
-        return jsonify({"response": response_message.content})
+            tool_calls = [
+                {"id": c.id, "type": "function",
+                 "function": {"name": c.function.name, "arguments": c.function.arguments}}
+                for c in response_message.tool_calls
+            ]
+            run_tool_calls(messages, tool_calls, user_id)
+
+            # Get final response from AI
+            second_response = client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages
+            )
+            reply = second_response.choices[0].message.content
+
+        remember_reply(cache_key, reply, tool_calls, time.perf_counter() - started)
+        if conversation is not None:
+            conversation.record(user_message, reply or '')
+        return jsonify({"response": reply})
 
     except Exception as e:
-        print(f"AI Error: {e}")
+        logger.exception("AI Error")
         return jsonify({"error": str(e)}), 500
 
+def create_app():
+    """Build the Flask app.
+
+    Opens no connections, so a preloading server can call it once before
+    forking; everything per-process happens in init_worker().
+    """
+    app = Flask(__name__)
+    # Behind Azure's front end the client address arrives in X-Forwarded-For;
+    # trust only as many hops as there are proxies, or throttles can be dodged.
+    # gunicorn.conf.py defaults this to 1; the development server sees clients directly
+    proxy_hops = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+    if proxy_hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops)
+    CORS(app, expose_headers=['X-Next-Cursor', 'ETag', 'Server-Timing', 'X-Request-ID'])
+    # Registered first so its after_request hook runs last and times compression too
+    init_metrics(app)
+    init_compression(app)
+    app.register_blueprint(api)
+    return app
+
+def init_worker():
+    """Per-process setup, run after fork: DB pool, OpenAI client and warm reference data.
+
+    Failures are logged rather than raised; a worker that starts while the
+    database is down builds these lazily on the first request instead.
+    """
+    started = time.perf_counter()
+    steps = [
+        ('db_pool', get_pool),
+        ('password_hasher', password_hasher.start),
+        ('crops', refdata.crops),
+        ('markets', refdata.markets),
+        ('crop_resolver', get_crop_resolver),
+        ('market_index', get_market_index),
+    ]
+    if os.getenv('AZURE_OPENAI_ENDPOINT'):
+        steps.append(('openai_client', get_openai_client))
+    failed = []
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            logger.warning("Worker warm-up step failed", extra={"fields": {"step": name, "error": str(e)}})
+            failed.append(name)
+    logger.info("Worker ready", extra={"fields": {
+        "pid": os.getpid(), "seconds": round(time.perf_counter() - started, 3), "failed": failed}})
+
+def shutdown_worker():
+    # In-flight requests have finished by now; let background summaries
+    # complete, then release connections
+    shutdown_compactor()
+    password_hasher.shutdown()
+    reset_openai_client()
+    close_pool()
+
+app = create_app()
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    # Development server; production runs gunicorn -c gunicorn.conf.py
+    app.run(debug=os.getenv('FLASK_DEBUG', '1') == '1', port=int(os.getenv('PORT', '5000')))
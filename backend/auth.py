@@ -0,0 +1,292 @@
+import base64
+import hashlib
+import hmac
+import math
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from metrics import logger, registry
+
+# Hashing runs in separate processes so a burst of logins can't hold the
+# GIL; only this many wait in line before new attempts are turned away
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+HASH_QUEUE_MAX = int(os.getenv('PASSWORD_HASH_QUEUE', '16'))
+HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', '10'))
+
+SESSION_TTL = int(os.getenv('SESSION_TTL', str(12 * 3600)))
+
+# Users whose sessions may change shared data such as market prices,
+# e.g. ADMIN_USER_IDS="1,7"; nobody by default
+ADMIN_USER_IDS = frozenset(int(i) for i in os.getenv('ADMIN_USER_IDS', '').replace(',', ' ').split())
+
+
+class HasherBusy(Exception):
+    """The hashing pool is full or too slow; the client should retry shortly."""
+
+
+class SessionInvalid(Exception):
+    """No usable bearer token: missing, forged or expired; the client must log in (again)."""
+
+
+class UserMismatch(Exception):
+    """The request names a user other than the one its session belongs to."""
+
+
+class AdminRequired(Exception):
+    """The session is valid but its user is not an administrator."""
+
+
+class ThrottleExceeded(Exception):
+    def __init__(self, retry_after):
+        self.retry_after = max(math.ceil(retry_after), 1)
+        super().__init__(f"Too many attempts; retry in {self.retry_after}s")
+
+
+# -- password hashing ---------------------------------------------------------
+
+hash_latency = registry.histogram(
+    'password_hash_duration_seconds', "Queue wait plus KDF time per hash or check", ('op',))
+hash_rejected = registry.counter(
+    'password_hash_rejected_total', "Hash requests refused because the queue was full", ('op',))
+
+
+def _spawn_pool(workers):
+    # spawn, not fork: the caller is a multithreaded server process
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+class PasswordHasher:
+    """Runs werkzeug's KDF on a bounded pool of processes.
+
+    At most ``workers + queue_max`` hashes are pending; beyond that
+    ``HasherBusy`` is raised at once rather than letting request threads pile
+    up behind the KDF. The executor is built per process, on first use.
+    """
+
+    def __init__(self, workers=HASH_WORKERS, queue_max=HASH_QUEUE_MAX, timeout=HASH_TIMEOUT,
+                 executor_factory=_spawn_pool):
+        self.workers = workers
+        self.queue_max = queue_max
+        self.timeout = timeout
+        self._executor_factory = executor_factory
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = self._executor_factory(self.workers)
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _run(self, op, fn, *args):
+        executor = self._get_executor()
+        with self._lock:
+            if self._pending >= self.workers + self.queue_max:
+                self.rejected += 1
+                hash_rejected.inc(op)
+                raise HasherBusy("Password hashing queue is full")
+            self._pending += 1
+        started = time.perf_counter()
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        # Released when the hash finishes, even if we stop waiting for it
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HasherBusy("Password hashing timed out")
+        finally:
+            hash_latency.observe(time.perf_counter() - started, op)
+
+    def hash(self, password):
+        return self._run('hash', generate_password_hash, password)
+
+    def check(self, password_hash, password):
+        return self._run('check', check_password_hash, password_hash, password)
+
+    def stats(self):
+        with self._lock:
+            pending = self._pending
+        return {
+            "workers": self.workers,
+            "queue_max": self.queue_max,
+            "in_flight": min(pending, self.workers),
+            "queued": max(pending - self.workers, 0),
+            "rejected": self.rejected,
+        }
+
+    def start(self):
+        # Spawns the worker processes now instead of on the first login
+        executor = self._get_executor()
+        for future in [executor.submit(int, 0) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._executor_pid == os.getpid():
+            executor.shutdown(wait=wait)
+
+
+password_hasher = PasswordHasher()
+
+
+def _hasher_metrics():
+    stats = password_hasher.stats()
+    return [
+        "# HELP password_hash_queue_depth Hashes waiting for a free hashing process",
+        "# TYPE password_hash_queue_depth gauge",
+        f"password_hash_queue_depth {stats['queued']}",
+        "# HELP password_hash_in_flight Hashes currently running",
+        "# TYPE password_hash_in_flight gauge",
+        f"password_hash_in_flight {stats['in_flight']}",
+    ]
+
+
+registry.add_collector(_hasher_metrics)
+
+
+# -- throttling ---------------------------------------------------------------
+
+class Throttle:
+    """Sliding-window limit of ``limit`` hits per ``window`` seconds per key.
+
+    Keeps at most ``limit`` timestamps per key; keys idle for a whole window
+    are pruned once more than ``max_keys`` are tracked. Per process, so with
+    several workers the effective limit is a small multiple of ``limit``.
+    """
+
+    def __init__(self, limit, window, max_keys=100000, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._clock = clock
+        self._hits = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        stale = [key for key, hits in self._hits.items() if now - hits[-1] >= self.window]
+        for key in stale:
+            del self._hits[key]
+
+    def retry_after(self, key):
+        """Seconds until ``key`` may try again, 0 if it may now."""
+        now = self._clock()
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None or len(hits) < self.limit:
+                return 0.0
+            return max(self.window - (now - hits[0]), 0.0)
+
+    def hit(self, key):
+        """Record an attempt; raises ThrottleExceeded if the key is over its limit."""
+        now = self._clock()
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                if len(self._hits) >= self.max_keys:
+                    self._prune(now)
+                hits = self._hits[key] = deque(maxlen=self.limit)
+            elif len(hits) == self.limit and now - hits[0] < self.window:
+                raise ThrottleExceeded(self.window - (now - hits[0]))
+            hits.append(now)
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+# Every login or signup attempt counts against the client address; only
+# failed logins count against the account, and a success clears them
+ip_throttle = Throttle(int(os.getenv('AUTH_IP_LIMIT', '30')), float(os.getenv('AUTH_IP_WINDOW', '60')))
+account_throttle = Throttle(int(os.getenv('AUTH_ACCOUNT_LIMIT', '5')), float(os.getenv('AUTH_ACCOUNT_WINDOW', '900')))
+
+
+def account_key(email):
+    return str(email).strip().lower()
+
+
+# -- session tokens -----------------------------------------------------------
+
+def _session_secret():
+    secret = os.getenv('SESSION_SECRET')
+    if secret:
+        return secret.encode('utf-8')
+    # Imported once in the master under gunicorn's preload, so every worker
+    # shares it; sessions still end when the server restarts
+    logger.warning("SESSION_SECRET is not set; using a random per-server secret")
+    return secrets.token_bytes(32)
+
+
+SESSION_SECRET = _session_secret()
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _signature(payload, secret):
+    return _b64(hmac.new(secret, payload.encode('ascii'), hashlib.sha256).digest())
+
+
+def issue_token(user_id, ttl=SESSION_TTL, secret=SESSION_SECRET, now=None):
+    """Signed "v1.<user id>.<expiry>.<sig>" token; checking it needs only an HMAC."""
+    expires = int((time.time() if now is None else now) + ttl)
+    payload = f"v1.{int(user_id)}.{expires}"
+    return f"{payload}.{_signature(payload, secret)}"
+
+
+def verify_token(token, secret=SESSION_SECRET, now=None):
+    """The token's user id, or None if it is malformed, forged or expired."""
+    try:
+        version, user_id, expires, signature = str(token).split('.')
+        payload = f"{version}.{user_id}.{expires}"
+        if version != 'v1' or not hmac.compare_digest(signature, _signature(payload, secret)):
+            return None
+        if int(expires) <= (time.time() if now is None else now):
+            return None
+        return int(user_id)
+    except (ValueError, TypeError, UnicodeEncodeError):
+        return None
+
+
+def bearer_token(headers):
+    scheme, _, token = headers.get('Authorization', '').partition(' ')
+    return token.strip() if scheme.lower() == 'bearer' and token.strip() else None
+
+
+def is_admin(user_id, admins=None):
+    return user_id in (ADMIN_USER_IDS if admins is None else admins)
+
+
+def token_user_id(headers):
+    """User id from an ``Authorization: Bearer`` header, None if there is none.
+
+    Raises SessionInvalid for a token that doesn't verify.
+    """
+    token = bearer_token(headers)
+    if token is None:
+        return None
+    user_id = verify_token(token)
+    if user_id is None:
+        raise SessionInvalid("Session expired or invalid; please log in again")
+    return user_id
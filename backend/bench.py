@@ -0,0 +1,270 @@
+"""Reproducible load benchmark for the API.
+
+Seeds the database at fixed sizes with a fixed seed, starts the backend
+against a fake completions server, drives the main endpoints at a given
+concurrency and writes latency percentiles, throughput and the server's
+peak RSS as JSON:
+
+    python bench.py --sizes 10 500 5000 --concurrency 16 --out bench.json
+    python bench.py --sizes 500 --baseline bench.json    # exits 1 on a regression
+
+Seeding truncates market_prices, so point DB_* at a scratch database.
+Sizes run smallest first: markets are only ever added, and with the same
+seed each size's markets are a prefix of the next size's.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from fake_openai import FakeOpenAIServer
+
+BENCH_SEED = 42
+BENCH_DAYS = 90
+BENCH_SIZES = (10, 500, 5000)
+BENCH_EMAIL = "bench@example.com"
+BENCH_PASSWORD = "bench-password"
+# Relative change in p95 latency or requests/sec that counts as a regression
+REGRESSION_TOLERANCE = 0.20
+PERCENTILES = (50, 95, 99)
+
+SCENARIOS = ('crops', 'markets', 'prices', 'prices_filtered', 'login', 'chat')
+
+
+# -- statistics ---------------------------------------------------------------
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list; None when empty."""
+    if not ordered:
+        return None
+    rank = max(int(-(-pct * len(ordered) // 100)), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize_run(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    summary = {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+    }
+    for pct in PERCENTILES:
+        value = percentile(ordered, pct)
+        summary[f"p{pct}_ms"] = round(value * 1000, 2) if value is not None else None
+    return summary
+
+
+def compare(report, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Regressions of ``report`` against ``baseline`` as readable strings.
+
+    Only sizes and scenarios present in both are compared; p95 may grow and
+    requests/sec may drop by ``tolerance`` before it counts.
+    """
+    regressions = []
+    for size, scenarios in report["results"].items():
+        before_scenarios = baseline.get("results", {}).get(size, {})
+        for name, now in scenarios.items():
+            before = before_scenarios.get(name)
+            if not before:
+                continue
+            if before.get("p95_ms") and now.get("p95_ms") is not None \
+                    and now["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{size} markets / {name}: p95 {before['p95_ms']}ms -> {now['p95_ms']}ms")
+            if before.get("rps") and now.get("rps") is not None \
+                    and now["rps"] < before["rps"] * (1 - tolerance):
+                regressions.append(f"{size} markets / {name}: {before['rps']} -> {now['rps']} req/s")
+            if now.get("errors", 0) > before.get("errors", 0):
+                regressions.append(f"{size} markets / {name}: {before.get('errors', 0)} -> {now['errors']} errors")
+    return regressions
+
+
+# -- load ---------------------------------------------------------------------
+
+def scenario_request(name, i, market):
+    """(method, path, json body) for request ``i`` of a scenario."""
+    if name == 'crops':
+        return 'GET', '/crops', None
+    if name == 'markets':
+        return 'GET', '/markets', None
+    if name == 'prices':
+        # One page, as the dashboards fetch it; the full table is millions of rows
+        return 'GET', '/prices?limit=1000', None
+    if name == 'prices_filtered':
+        return 'GET', f'/prices?crop=Tomato&market={requests.utils.quote(market)}', None
+    if name == 'login':
+        return 'POST', '/login', {"email": BENCH_EMAIL, "password": BENCH_PASSWORD}
+    if name == 'chat':
+        # A different message each time so the reply cache doesn't answer it
+        return 'POST', '/api/ai/chat', {"message": f"Should I sell my tomatoes this week? ({i})"}
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def drive(base_url, name, total, concurrency, market, headers=None, warmup=5):
+    """Send ``total`` requests over ``concurrency`` keep-alive connections."""
+    local = threading.local()
+
+    def send(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+            session.headers.update(headers or {})
+        method, path, body = scenario_request(name, i, market)
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, json=body, timeout=60)
+            response.content
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        return ok, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(-warmup, 0)))
+        started = time.perf_counter()
+        results = list(pool.map(send, range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies = [seconds for ok, seconds in results if ok]
+    return summarize_run(latencies, len(results) - len(latencies), elapsed)
+
+
+# -- server -------------------------------------------------------------------
+
+def peak_rss_mb(pid):
+    # VmHWM is the resident-set high-water mark; Linux only
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def start_server(port, env):
+    # No debug reloader, so the pid we measure is the one serving requests
+    process = subprocess.Popen(
+        [sys.executable, '-c', f"from app import app; app.run(port={port}, threaded=True)"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with status {process.returncode}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Backend did not start within 30s")
+
+
+def ensure_bench_user():
+    from werkzeug.security import generate_password_hash
+    from db import db_connection
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM users WHERE email = %s", (BENCH_EMAIL,))
+        if cur.fetchone() is None:
+            cur.execute("INSERT INTO users (name, email, phone, password_hash) VALUES (%s, %s, %s, %s)",
+                        ("Bench User", BENCH_EMAIL, "0000000000", generate_password_hash(BENCH_PASSWORD)))
+        conn.commit()
+        cur.close()
+
+
+def bench_size(size, args, fake):
+    from seed_db import seed_db
+
+    if not args.no_seed:
+        seed_db(num_markets=size, days=args.days, seed=args.seed, forecast=not args.no_forecast)
+        ensure_bench_user()
+
+    # Every login comes from one address; the throttle would turn most away
+    env = dict(os.environ, AZURE_OPENAI_ENDPOINT=fake.endpoint, AZURE_OPENAI_API_KEY='fake',
+               LOG_LEVEL='WARNING', AUTH_IP_LIMIT='1000000000')
+    process = start_server(args.port, env)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        markets = requests.get(base_url + '/markets', timeout=30).json()
+        market = markets[0]['name'] if markets else 'Azadpur Mandi'
+        # Chat is per user, so it runs under the bench user's session
+        login = requests.post(base_url + '/login', json={"email": BENCH_EMAIL, "password": BENCH_PASSWORD},
+                              timeout=30).json()
+        headers = {"Authorization": f"Bearer {login['token']}"} if login.get('token') else None
+        results = {}
+        for name in args.scenarios:
+            results[name] = drive(base_url, name, args.requests, args.concurrency, market, headers)
+            print(f"{size:>6} markets  {name:<16} p50 {results[name]['p50_ms']}ms  "
+                  f"p95 {results[name]['p95_ms']}ms  p99 {results[name]['p99_ms']}ms  "
+                  f"{results[name]['rps']} req/s  {results[name]['errors']} errors")
+        return results, peak_rss_mb(process.pid)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def run_bench(args):
+    report = {
+        "meta": {
+            "started": datetime.datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "seed": args.seed,
+            "days": args.days,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+        },
+        "results": {},
+        "peak_rss_mb": {},
+    }
+    with FakeOpenAIServer(token_delay=args.token_delay) as fake:
+        for size in sorted(args.sizes):
+            results, rss = bench_size(size, args, fake)
+            report["results"][str(size)] = results
+            report["peak_rss_mb"][str(size)] = rss
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed fixed-size datasets and benchmark the API")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(BENCH_SIZES), help="Market counts to seed and test")
+    parser.add_argument('--days', type=int, default=BENCH_DAYS, help="Days of price history per size")
+    parser.add_argument('--seed', type=int, default=BENCH_SEED, help="Random seed for the datasets")
+    parser.add_argument('--no-seed', action='store_true', help="Benchmark the database as it is")
+    parser.add_argument('--no-forecast', action='store_true', help="Skip generating forecast rows when seeding")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent client connections")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per scenario")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--token-delay', type=float, default=0.0, help="Fake completion delay between tokens")
+    parser.add_argument('--port', type=int, default=5055, help="Port for the benchmarked backend")
+    parser.add_argument('--out', help="Write the JSON report here (default: stdout)")
+    parser.add_argument('--baseline', help="Earlier report to compare against")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE, help="Allowed relative slowdown")
+    args = parser.parse_args()
+
+    report = run_bench(args)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
@@ -1,4 +1,4 @@
-from db import get_db_connection
+from db import db_connection, DatabaseUnavailable
 import os
 from dotenv import load_dotenv
 
@@ -6,9 +6,8 @@ from dotenv import load_dotenv
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 
 def check_data():
-    conn = get_db_connection()
-    if conn:
-        try:
+    try:
+        with db_connection() as conn:
             cur = conn.cursor()
             cur.execute("SELECT * FROM users")
             rows = cur.fetchall()
@@ -16,11 +15,10 @@ def check_data():
             for row in rows:
                 print(row)
             cur.close()
-            conn.close()
-        except Exception as e:
-            print(f"Error querying database: {e}")
-    else:
+    except DatabaseUnavailable:
         print("Failed to connect to database.")
+    except Exception as e:
+        print(f"Error querying database: {e}")
 
 if __name__ == "__main__":
     check_data()
@@ -1,8 +1,7 @@
-from db import get_db_connection
+from db import db_connection
 
 def check_expanded_db():
-    conn = get_db_connection()
-    if conn:
+    with db_connection() as conn:
         try:
             cur = conn.cursor()
             
@@ -26,7 +25,6 @@ def check_expanded_db():
                 print(row)
 
             cur.close()
-            conn.close()
         except Exception as e:
             print(f"Error checking DB: {e}")
 
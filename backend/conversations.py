@@ -0,0 +1,185 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_client import CHAT_MODEL, get_openai_client
+from db import db_connection
+from metrics import logger, upstream_timer
+
+# Tokens of history (summary + verbatim turns) sent with each request
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', '1200'))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv('CHAT_SUMMARY_MAX_TOKENS', '250'))
+# Per-message framing the API adds on top of the content
+MESSAGE_OVERHEAD = 4
+
+SUMMARY_PROMPT = (
+    "Summarize this conversation between a farmer and an agricultural assistant for the assistant's "
+    "own memory. Keep concrete facts: crops, quantities, locations, dates, prices, markets and any "
+    "decisions or open questions. Reply with the summary only, in the conversation's language."
+)
+
+# Compaction makes an extra model call; it runs off the request path
+_compactor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='chat-summary')
+_compacting = set()
+_compacting_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    # ~4 characters per token is close enough for budgeting without a tokenizer
+    return MESSAGE_OVERHEAD + (len(text) + 3) // 4
+
+
+class Conversation:
+    def __init__(self, conversation_id, summary, turns, pending_tokens, budget):
+        self.id = conversation_id
+        self.summary = summary
+        self.turns = turns  # (role, content), oldest first, within budget
+        self.pending_tokens = pending_tokens  # all turns not yet summarized
+        self.budget = budget
+
+    def is_new(self):
+        return not self.summary and not self.pending_tokens
+
+    def messages(self):
+        history = []
+        if self.summary:
+            history.append({"role": "system", "content": f"Summary of the conversation so far: {self.summary}"})
+        history.extend({"role": role, "content": content} for role, content in self.turns)
+        return history
+
+    def context_tokens(self):
+        return sum(estimate_tokens(m["content"]) for m in self.messages())
+
+    def record(self, user_message, reply):
+        """Store one exchange and schedule compaction once history outgrows the budget."""
+        turns = [('user', user_message), ('assistant', reply)]
+        tokens = [estimate_tokens(content) for _, content in turns]
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.executemany("""
+                INSERT INTO conversation_turns (conversation_id, role, content, tokens)
+                VALUES (%s, %s, %s, %s)
+            """, [(self.id, role, content, n) for (role, content), n in zip(turns, tokens)])
+            cur.execute("UPDATE conversations SET updated_at = now() WHERE id = %s", (self.id,))
+            conn.commit()
+            cur.close()
+        if self.pending_tokens + sum(tokens) > self.budget:
+            schedule_compaction(self.id, self.budget)
+
+
+def load_conversation(user_id, session_id, budget=CHAT_HISTORY_TOKEN_BUDGET):
+    """Return the conversation for (user, session), creating it on first use.
+
+    Only the newest unsummarized turns that fit in ``budget`` (after the
+    summary) are loaded, so the prompt stays the same size however long the
+    conversation runs.
+    """
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO conversations (user_id, session_id) VALUES (%s, %s)
+            ON CONFLICT (user_id, session_id) DO UPDATE SET updated_at = now()
+            RETURNING id, summary, summarized_through
+        """, (user_id, session_id))
+        conversation_id, summary, summarized_through = cur.fetchone()
+        room = budget - (estimate_tokens(summary) if summary else 0)
+
+        # Running totals from the newest turn back pick what fits in one pass
+        cur.execute("""
+            SELECT role, content, running, pending FROM (
+                SELECT id, role, content,
+                       SUM(tokens) OVER (ORDER BY id DESC) AS running,
+                       SUM(tokens) OVER () AS pending
+                FROM conversation_turns
+                WHERE conversation_id = %s AND id > %s
+            ) t
+            ORDER BY id
+        """, (conversation_id, summarized_through))
+        rows = cur.fetchall()
+        conn.commit()
+        cur.close()
+
+    turns = [(role, content) for role, content, running, _ in rows if running <= room]
+    pending = rows[0][3] if rows else 0
+    return Conversation(conversation_id, summary, turns, pending, budget)
+
+
+def summarize(summary, turns):
+    transcript = '\n'.join(f"{role.capitalize()}: {content}" for role, content in turns)
+    prompt = f"Summary so far: {summary}\n\nNew turns:\n{transcript}" if summary else transcript
+    with upstream_timer('openai_summary'):
+        response = get_openai_client().chat.completions.create(
+            model=CHAT_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=CHAT_SUMMARY_MAX_TOKENS
+        )
+    return (response.choices[0].message.content or summary).strip()
+
+
+def compact_conversation(conversation_id, budget=CHAT_HISTORY_TOKEN_BUDGET):
+    """Fold the oldest unsummarized turns into the rolling summary.
+
+    The newest turns worth half the budget stay verbatim, so compaction runs
+    every few exchanges rather than on every one. No connection is held during
+    the model call; the update only applies if nobody compacted meanwhile.
+    """
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT summary, summarized_through FROM conversations WHERE id = %s", (conversation_id,))
+        row = cur.fetchone()
+        if row is None:
+            conn.rollback()
+            return False
+        summary, summarized_through = row
+        cur.execute("""
+            SELECT id, role, content, SUM(tokens) OVER (ORDER BY id DESC) AS running
+            FROM conversation_turns
+            WHERE conversation_id = %s AND id > %s
+            ORDER BY id
+        """, (conversation_id, summarized_through))
+        rows = cur.fetchall()
+        conn.rollback()
+        cur.close()
+
+    old = [(turn_id, role, content) for turn_id, role, content, running in rows if running > budget // 2]
+    if not old:
+        return False
+    new_summary = summarize(summary, [(role, content) for _, role, content in old])
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE conversations SET summary = %s, summarized_through = %s
+            WHERE id = %s AND summarized_through = %s
+        """, (new_summary, old[-1][0], conversation_id, summarized_through))
+        updated = cur.rowcount == 1
+        conn.commit()
+        cur.close()
+    return updated
+
+
+def _compact_and_release(conversation_id, budget):
+    try:
+        compact_conversation(conversation_id, budget)
+    except Exception:
+        # The next request simply sends fewer verbatim turns until this succeeds
+        logger.exception("Error compacting conversation %s", conversation_id)
+    finally:
+        with _compacting_lock:
+            _compacting.discard(conversation_id)
+
+
+def schedule_compaction(conversation_id, budget=CHAT_HISTORY_TOKEN_BUDGET):
+    with _compacting_lock:
+        if conversation_id in _compacting:
+            return None
+        _compacting.add(conversation_id)
+    return _compactor.submit(_compact_and_release, conversation_id, budget)
+
+
+def shutdown_compactor(wait=True):
+    # Called as a worker exits, so summaries already running get written
+    _compactor.shutdown(wait=wait)
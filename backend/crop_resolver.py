@@ -0,0 +1,303 @@
+import os
+import threading
+import unicodedata
+from collections import Counter, namedtuple
+
+from refdata import refdata
+
+# Matches scoring below this are treated as unknown crops
+CROP_MATCH_THRESHOLD = float(os.getenv('CROP_MATCH_THRESHOLD', '0.75'))
+# ... and so are matches that beat the best other crop by less than this:
+# "dal" is as close to "toor dal" as to "urad dal"
+CROP_MATCH_MARGIN = float(os.getenv('CROP_MATCH_MARGIN', '0.1'))
+
+# Local and everyday names farmers actually use, romanized and in script.
+# English, Hindi, Tamil and Telugu names come first in each entry, then
+# Kannada and Malayalam, so every language the frontend offers is covered.
+# Keys must match crops.name; the parenthesised names in seed_db.CROPS_DATA
+# ("Chana", "Tur", ...) are picked up automatically.
+CROP_ALIASES = {
+    'Wheat': ['gehun', 'gehu', 'गेहूं', 'गेहूँ', 'godhumai', 'கோதுமை', 'గోధుమ',
+        'godhi', 'ಗೋಧಿ', 'gothambu', 'ഗോതമ്പ്'],
+    'Rice (Common)': ['rice', 'chawal', 'chaval', 'चावल', 'dhan', 'धान', 'paddy', 'arisi', 'அரிசி', 'biyyam', 'బియ్యం',
+        'akki', 'ಅಕ್ಕಿ', 'ಭತ್ತ', 'ari', 'അരി', 'nellu', 'നെല്ല്'],
+    'Rice (Basmati)': ['basmati', 'बासमती',
+        'ಬಾಸ್ಮತಿ', 'ബസ്മതി'],
+    'Maize': ['corn', 'makka', 'makkai', 'मक्का', 'மக்காச்சோளம்', 'mokkajonna', 'మొక్కజొన్న',
+        'mekkejola', 'ಮೆಕ್ಕೆಜೋಳ', 'ചോളം'],
+    'Jowar': ['sorghum', 'ज्वार', 'cholam', 'சோளம்', 'jonna', 'జొన్న',
+        'jola', 'ಜೋಳ', 'മണിച്ചോളം'],
+    'Bajra': ['pearl millet', 'बाजरा', 'kambu', 'கம்பு', 'sajjalu', 'సజ్జలు',
+        'sajje', 'ಸಜ್ಜೆ', 'കമ്പ്'],
+    'Ragi': ['finger millet', 'nachni', 'रागी', 'kezhvaragu', 'கேழ்வரகு',
+        'ರಾಗಿ', 'muthari', 'മുത്താറി', 'റാഗി'],
+    'Bengal Gram (Chana)': ['chickpea', 'chole', 'चना', 'kadalai', 'கடலை', 'senagalu', 'శనగలు',
+        'kadale', 'ಕಡಲೆ', 'kadala', 'കടല'],
+    'Red Gram (Tur)': ['toor', 'toor dal', 'arhar', 'pigeon pea', 'तूर', 'अरहर', 'thuvaram paruppu', 'kandi pappu',
+        'togari', 'ತೊಗರಿ', 'thuvara', 'തുവര'],
+    'Green Gram (Moong)': ['mung', 'moong dal', 'मूंग', 'pasi payaru', 'pesalu',
+        'hesaru', 'ಹೆಸರು', 'cherupayar', 'ചെറുപയർ'],
+    'Black Gram (Urad)': ['urad dal', 'उड़द', 'ulundu', 'உளுந்து', 'minumulu', 'మినుములు',
+        'uddu', 'ಉದ್ದು', 'uzhunnu', 'ഉഴുന്ന്'],
+    'Lentil (Masur)': ['masoor', 'masoor dal', 'मसूर',
+        'ಮಸೂರ್', 'മസൂർ'],
+    'Groundnut': ['peanut', 'moongphali', 'mungfali', 'मूंगफली', 'verkadalai', 'வேர்க்கடலை', 'palli',
+        'kadalekai', 'shenga', 'ಕಡಲೆಕಾಯಿ', 'ಶೇಂಗಾ', 'nilakkadala', 'നിലക്കടല'],
+    'Mustard': ['sarson', 'सरसों', 'rai',
+        'sasive', 'ಸಾಸಿವೆ', 'kaduku', 'കടുക്'],
+    'Soybean': ['soya', 'soyabean', 'सोयाबीन',
+        'ಸೋಯಾಬೀನ್', 'സോയാബീൻ'],
+    'Sunflower': ['surajmukhi', 'सूरजमुखी',
+        'suryakanti', 'ಸೂರ್ಯಕಾಂತಿ', 'സൂര്യകാന്തി'],
+    'Sesame': ['til', 'तिल', 'gingelly', 'ellu', 'எள்ளு',
+        'ಎಳ್ಳು', 'എള്ള്'],
+    'Tomato': ['tamatar', 'टमाटर', 'thakkali', 'takkali', 'தக்காளி', 'టమాటా',
+        'ಟೊಮೆಟೊ', 'ಟೊಮ್ಯಾಟೊ', 'തക്കാളി'],
+    'Onion': ['pyaz', 'pyaaz', 'kanda', 'प्याज', 'प्याज़', 'vengayam', 'வெங்காயம்', 'ullipaya', 'ఉల్లిపాయ',
+        'eerulli', 'ಈರುಳ್ಳಿ', 'ulli', 'savala', 'ഉള്ളി', 'സവാള'],
+    'Potato': ['aloo', 'alu', 'आलू', 'urulaikizhangu', 'உருளைக்கிழங்கு', 'bangaladumpa',
+        'alugadde', 'ಆಲೂಗಡ್ಡೆ', 'urulakizhangu', 'ഉരുളക്കിഴങ്ങ്'],
+    'Brinjal': ['eggplant', 'aubergine', 'baingan', 'बैंगन', 'kathirikai', 'கத்தரிக்காய்', 'vankaya', 'వంకాయ',
+        'badanekai', 'ಬದನೆಕಾಯಿ', 'vazhuthananga', 'വഴുതനങ്ങ'],
+    'Cabbage': ['patta gobhi', 'band gobhi', 'पत्ता गोभी', 'muttaikose',
+        'elekosu', 'ಎಲೆಕೋಸು', 'കാബേജ്'],
+    'Cauliflower': ['gobhi', 'phool gobhi', 'gobi', 'फूलगोभी', 'गोभी',
+        'hookosu', 'ಹೂಕೋಸು', 'കോളിഫ്ലവർ'],
+    'Okra': ['bhindi', 'lady finger', 'ladies finger', 'भिंडी', 'vendakkai', 'வெண்டைக்காய்', 'bendakaya',
+        'bendekai', 'ಬೆಂಡೆಕಾಯಿ', 'vendakka', 'വെണ്ടയ്ക്ക'],
+    'Spinach': ['palak', 'पालक', 'keerai', 'கீரை',
+        'ಪಾಲಕ್', 'cheera', 'ചീര'],
+    'Carrot': ['gajar', 'गाजर',
+        'gajjari', 'ಗಜ್ಜರಿ', 'ಕ್ಯಾರೆಟ್', 'കാരറ്റ്'],
+    'Green Chilli': ['chilli', 'chili', 'mirchi', 'hari mirch', 'हरी मिर्च', 'मिर्च', 'milagai', 'மிளகாய்', 'mirapakaya',
+        'menasinakai', 'ಮೆಣಸಿನಕಾಯಿ', 'ಹಸಿಮೆಣಸಿನಕಾಯಿ', 'pachamulaku', 'പച്ചമുളക്', 'മുളക്'],
+    'Ginger': ['adrak', 'अदरक', 'inji', 'இஞ்சி', 'allam', 'అల్లం',
+        'shunti', 'ಶುಂಠಿ', 'ഇഞ്ചി'],
+    'Garlic': ['lahsun', 'lehsun', 'लहसुन', 'poondu', 'பூண்டு', 'vellulli',
+        'bellulli', 'ಬೆಳ್ಳುಳ್ಳಿ', 'veluthulli', 'വെളുത്തുള്ളി'],
+    'Apple': ['seb', 'सेब',
+        'sebu', 'ಸೇಬು', 'ആപ്പിൾ'],
+    'Banana': ['kela', 'केला', 'vazhaipazham', 'வாழைப்பழம்', 'arati pandu',
+        'balehannu', 'ಬಾಳೆಹಣ್ಣು', 'vazhappazham', 'വാഴപ്പഴം'],
+    'Mango': ['aam', 'आम', 'mambazham', 'மாம்பழம்', 'mamidi',
+        'mavinahannu', 'ಮಾವಿನಹಣ್ಣು', 'manga', 'മാങ്ങ', 'മാമ്പഴം'],
+    'Orange': ['santra', 'santara', 'संतरा', 'narangi',
+        'kittale', 'ಕಿತ್ತಳೆ', 'ഓറഞ്ച്'],
+    'Grapes': ['angoor', 'angur', 'अंगूर', 'drakshai',
+        'drakshi', 'ದ್ರಾಕ್ಷಿ', 'munthiri', 'മുന്തിരി'],
+    'Papaya': ['papita', 'पपीता',
+        'parangi', 'ಪರಂಗಿ', 'ಪಪ್ಪಾಯ', 'പപ്പായ'],
+    'Pomegranate': ['anar', 'अनार', 'mathulai',
+        'dalimbe', 'ದಾಳಿಂಬೆ', 'mathalam', 'മാതളം'],
+    'Sugarcane': ['ganna', 'गन्ना', 'karumbu', 'கரும்பு', 'cheruku',
+        'kabbu', 'ಕಬ್ಬು', 'karimbu', 'കരിമ്പ്'],
+    'Cotton': ['kapas', 'कपास', 'paruthi', 'பருத்தி',
+        'hatti', 'ಹತ್ತಿ', 'പരുത്തി'],
+    'Jute': ['patsan', 'पटसन',
+        'senabu', 'ಸೆಣಬು', 'chanam', 'ചണം'],
+    'Coconut': ['nariyal', 'नारियल', 'thengai', 'தேங்காய்', 'kobbari',
+        'tenginakai', 'ತೆಂಗಿನಕಾಯಿ', 'thenga', 'തേങ്ങ'],
+    'Turmeric': ['haldi', 'हल्दी', 'manjal', 'மஞ்சள்', 'pasupu',
+        'arishina', 'ಅರಿಶಿನ', 'മഞ്ഞൾ'],
+    'Coriander': ['dhania', 'dhaniya', 'धनिया', 'kothamalli', 'கொத்தமல்லி',
+        'kottambari', 'ಕೊತ್ತಂಬರಿ', 'malli', 'മല്ലി'],
+    'Cumin': ['jeera', 'jira', 'जीरा', 'seeragam', 'சீரகம்',
+        'jeerige', 'ಜೀರಿಗೆ', 'jeerakam', 'ജീരകം'],
+    'Black Pepper': ['pepper', 'kali mirch', 'काली मिर्च', 'milagu', 'மிளகு', 'miriyalu',
+        'kalumenasu', 'ಕಾಳುಮೆಣಸು', 'kurumulaku', 'കുരുമുളക്'],
+}
+
+# runner_up: the best score of any other crop, 0.0 for an exact match
+CropMatch = namedtuple('CropMatch', ['crop_id', 'name', 'score', 'matched', 'runner_up'])
+
+
+def _singular(token):
+    # Plural folding for romanized words only; applied to names and queries alike
+    if len(token) <= 3 or not token.isascii() or not token.isalpha():
+        return token
+    if token.endswith('oes'):
+        return token[:-2]
+    if token.endswith('ies'):
+        return token[:-2]
+    if token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def crop_name_words(text):
+    # NFKC, lower case, punctuation dropped, plurals folded; word order kept
+    text = unicodedata.normalize('NFKC', text).lower()
+    cleaned = ''.join(' ' if unicodedata.category(c)[0] in 'PSZ' else c for c in text)
+    return [_singular(t) for t in cleaned.split()]
+
+
+def normalize_crop_name(text):
+    """Canonical lookup key: the folded words, sorted.
+
+    Sorting makes "Rice basmati", "basmati rice" and "Rice (Basmati)" one key.
+    """
+    return ' '.join(sorted(crop_name_words(text)))
+
+
+def edit_similarity(a, b):
+    """1 - optimal string alignment distance / longer length.
+
+    Catches swapped letters ("onoin") that share too few trigrams to score well.
+    """
+    if a == b:
+        return 1.0
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], prev2[j - 2] + 1)
+        prev2, prev = prev, row
+    return 1.0 - prev[len(b)] / max(len(a), len(b))
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CropResolver:
+    """In-memory crop name index: exact normalized keys plus a trigram index.
+
+    resolve() tries the exact key first (score 1.0), then ranks candidate keys
+    by trigram Dice similarity, only scoring keys that share a trigram with
+    the query; the few best candidates are re-scored by edit similarity.
+    resolve_id() only accepts a match that also leads the best other crop by
+    a margin, so a name halfway between two crops resolves to neither.
+    """
+
+    RERANK = 5
+
+    def __init__(self, crops, aliases=CROP_ALIASES):
+        self.names = {}
+        self.exact = {}
+        self.keys = []  # (key, crop_id, trigram count)
+        self.postings = {}
+        self.max_words = 1
+
+        crops = list(crops)
+        # "Rice" is the base of two crops, so it only resolves through an alias
+        bases = Counter(normalize_crop_name(name.split('(')[0]) for _, name in crops)
+        for crop_id, name in crops:
+            self.names[crop_id] = name
+            self._add(name, crop_id)
+            if '(' in name:
+                base, _, local = name.partition('(')
+                self._add(local, crop_id)
+                self._add(f"{local} {base}", crop_id)
+                if bases[normalize_crop_name(base)] == 1:
+                    self._add(base, crop_id)
+
+        ids = {name.lower(): crop_id for crop_id, name in crops}
+        for canonical, names in aliases.items():
+            crop_id = ids.get(canonical.lower())
+            if crop_id is not None:
+                for alias in names:
+                    self._add(alias, crop_id)
+
+    def _add(self, text, crop_id):
+        key = normalize_crop_name(text)
+        # First writer wins: real names are added before aliases
+        if not key or key in self.exact:
+            return
+        self.exact[key] = crop_id
+        grams = trigrams(key)
+        index = len(self.keys)
+        self.keys.append((key, crop_id, len(grams)))
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(index)
+        self.max_words = max(self.max_words, key.count(' ') + 1)
+
+    def resolve(self, text):
+        """Best match for ``text`` as a CropMatch, or None if nothing is similar."""
+        key = normalize_crop_name(text or '')
+        if not key:
+            return None
+        crop_id = self.exact.get(key)
+        if crop_id is not None:
+            return CropMatch(crop_id, self.names[crop_id], 1.0, key, 0.0)
+
+        grams = trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        if not shared:
+            return None
+        scored = sorted(((2.0 * count / (len(grams) + self.keys[index][2]), index)
+                         for index, count in shared.items()), reverse=True)
+        # Best score per crop: the top few are re-scored by edit similarity,
+        # the rest keep their trigram score
+        best = {}
+        for rank, (score, index) in enumerate(scored):
+            candidate, crop_id, _ = self.keys[index]
+            if rank < self.RERANK:
+                # Skip the edit distance when the length gap alone rules out a better score
+                bound = 1.0 - abs(len(key) - len(candidate)) / max(len(key), len(candidate))
+                if bound > score:
+                    score = max(score, edit_similarity(key, candidate))
+            if score > best.get(crop_id, (0.0,))[0]:
+                best[crop_id] = (score, candidate)
+        ranked = sorted(((score, crop_id, candidate) for crop_id, (score, candidate) in best.items()),
+                        reverse=True)
+        score, crop_id, matched = ranked[0]
+        runner_up = ranked[1][0] if len(ranked) > 1 else 0.0
+        return CropMatch(crop_id, self.names[crop_id], round(score, 3), matched, round(runner_up, 3))
+
+    def resolve_id(self, text, threshold=CROP_MATCH_THRESHOLD, margin=CROP_MATCH_MARGIN):
+        """Crop id for ``text``, or None if no crop is both close and clearly closest."""
+        match = self.resolve(text)
+        if match is None or match.score < threshold or match.score - match.runner_up < margin:
+            return None
+        return match.crop_id
+
+    def lookup_id(self, text):
+        """Crop id for a known name or alias only; spelling is normalized, never guessed."""
+        return self.exact.get(normalize_crop_name(text or ''))
+
+    def mentions(self, text):
+        """Crop ids named anywhere in free text.
+
+        Exact keys only, longest first, so "basmati rice" is one mention of
+        Rice (Basmati) rather than also counting as plain "rice".
+        """
+        words = crop_name_words(text)
+        found = set()
+        i = 0
+        while i < len(words):
+            for size in range(min(self.max_words, len(words) - i), 0, -1):
+                crop_id = self.exact.get(' '.join(sorted(words[i:i + size])))
+                if crop_id is not None:
+                    found.add(crop_id)
+                    i += size
+                    break
+            else:
+                i += 1
+        return sorted(found)
+
+
+_resolver = None
+_resolver_digest = None
+_resolver_lock = threading.Lock()
+
+
+def get_crop_resolver():
+    """Resolver over the current crops table, rebuilt whenever refdata reloads it."""
+    global _resolver, _resolver_digest
+    digest = refdata.crops_digest()
+    if _resolver is None or _resolver_digest != digest:
+        with _resolver_lock:
+            if _resolver is None or _resolver_digest != digest:
+                _resolver = CropResolver(refdata.crops())
+                _resolver_digest = digest
+    return _resolver
+
+
+def resolve_crop_id(name, threshold=CROP_MATCH_THRESHOLD, margin=CROP_MATCH_MARGIN):
+    return get_crop_resolver().resolve_id(name, threshold, margin)
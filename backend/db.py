@@ -1,9 +1,63 @@
 import psycopg2
+import psycopg2.extensions
+import datetime
+import io
 import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
+from metrics import logger, observe_pool_wait, observe_query, registry
+
 load_dotenv()
 
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """Cursor that reports each statement's duration and row count to metrics.
+
+    A named (server-side) cursor does its work while fetching, so for those
+    each fetch is timed instead of the DECLARE.
+    """
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            if self.name is None:
+                observe_query(query, time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            observe_query(query, time.perf_counter() - started, self.rowcount)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            observe_query(sql, time.perf_counter() - started, self.rowcount)
+
+    def _timed_fetch(self, fetch, *args):
+        if self.name is None:
+            return fetch(*args)
+        started = time.perf_counter()
+        rows = fetch(*args)
+        observe_query('fetch', time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchmany(self, *args):
+        return self._timed_fetch(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
 def get_db_connection():
     try:
         conn = psycopg2.connect(
@@ -11,9 +65,328 @@ def get_db_connection():
             database=os.environ['DB_NAME'],
             user=os.environ['DB_USER'],
             password=os.environ['DB_PASSWORD'],
-            port=os.environ['DB_PORT']
+            port=os.environ['DB_PORT'],
+            cursor_factory=TimedCursor,
         )
         return conn
     except Exception as e:
-        print(f"Error connecting to database: {e}")
+        logger.warning("Error connecting to database: %s", e)
         return None
+
+
+class DatabaseUnavailable(Exception):
+    """Raised when no pooled connection can be handed out."""
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections.
+
+    Idle connections are kept in LIFO order so the hottest ones get reused,
+    and any connection that has been idle longer than ``validate_after``
+    seconds is pinged with ``SELECT 1`` before it is handed out again.
+    """
+
+    def __init__(self, minconn=1, maxconn=10, timeout=5.0, validate_after=30.0, connect=get_db_connection):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool size: min=%s max=%s" % (minconn, maxconn))
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.validate_after = validate_after
+        self._connect = connect
+        self._idle = []  # list of (conn, last_used)
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "connects": 0,
+            "connect_failures": 0,
+            "timeouts": 0,
+            "discarded": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+        for _ in range(minconn):
+            conn = self._new_connection()
+            if conn is None:
+                break
+            self._idle.append((conn, time.monotonic()))
+
+    def _new_connection(self):
+        # Connects outside the lock; only the counters are updated under it
+        conn = self._connect()
+        with self._cond:
+            self._stats["connect_failures" if conn is None else "connects"] += 1
+        return conn
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.validate_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        # The condition's lock is reentrant, so putconn may call this holding it
+        with self._cond:
+            self._stats["discarded"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise DatabaseUnavailable("Connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    reserve_new = False
+                elif self._in_use + len(self._idle) < self.maxconn:
+                    conn, last_used = None, None
+                    reserve_new = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise DatabaseUnavailable(
+                            "Timed out after %.1fs waiting for a database connection" % self.timeout
+                        )
+                    self._cond.wait(remaining)
+                    continue
+                # Reserve the slot before doing any network I/O outside the lock
+                self._in_use += 1
+                break
+
+        try:
+            if not reserve_new and not self._is_healthy(conn, last_used):
+                self._discard(conn)
+                reserve_new = True
+            if reserve_new:
+                conn = self._new_connection()
+                if conn is None:
+                    raise DatabaseUnavailable("Failed to connect to database")
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["wait_time_total"] += waited
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        # Never hand the next caller a connection stuck inside a transaction
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            self._in_use -= 1
+            if discard or conn.closed or self._closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "min": self.minconn,
+                "max": self.maxconn,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "size": self._in_use + len(self._idle),
+            })
+        checkouts = stats["checkouts"]
+        stats["wait_time_avg"] = stats["wait_time_total"] / checkouts if checkouts else 0.0
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    minconn=int(os.getenv('DB_POOL_MIN', '1')),
+                    maxconn=int(os.getenv('DB_POOL_MAX', '10')),
+                    timeout=float(os.getenv('DB_POOL_TIMEOUT', '5')),
+                    validate_after=float(os.getenv('DB_POOL_VALIDATE_AFTER', '30')),
+                )
+    return _pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+def pool_stats():
+    return get_pool().stats()
+
+def _pool_metrics():
+    if _pool is None:
+        return []
+    stats = _pool.stats()
+    return [
+        "# HELP db_pool_connections Pooled connections by state",
+        "# TYPE db_pool_connections gauge",
+        f'db_pool_connections{{state="in_use"}} {stats["in_use"]}',
+        f'db_pool_connections{{state="idle"}} {stats["idle"]}',
+        "# HELP db_pool_checkouts_total Connections handed out",
+        "# TYPE db_pool_checkouts_total counter",
+        f"db_pool_checkouts_total {stats['checkouts']}",
+        "# HELP db_pool_timeouts_total Checkouts that gave up waiting",
+        "# TYPE db_pool_timeouts_total counter",
+        f"db_pool_timeouts_total {stats['timeouts']}",
+        "# HELP db_pool_wait_seconds_total Time spent waiting for a connection",
+        "# TYPE db_pool_wait_seconds_total counter",
+        f"db_pool_wait_seconds_total {stats['wait_time_total']}",
+    ]
+
+registry.add_collector(_pool_metrics)
+
+@contextmanager
+def db_connection():
+    """Check a connection out of the pool and always give it back.
+
+    Uncommitted work is rolled back on the way out, and a connection that
+    errored at the driver level is dropped instead of being reused.
+    """
+    pool = get_pool()
+    started = time.perf_counter()
+    conn = pool.getconn()
+    observe_pool_wait(time.perf_counter() - started)
+    discard = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        discard = True
+        raise
+    finally:
+        pool.putconn(conn, discard=discard)
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class _CopyStream:
+    """File-like adapter over an iterator of byte chunks, for COPY FROM STDIN.
+
+    Only about one ``read()`` worth of data is materialised at a time, so a
+    generator of millions of rows streams through in bounded memory.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+        self._done = False
+
+    def read(self, size=-1):
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while not self._done and (size < 0 or length < size):
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self._done = True
+                break
+            chunks.append(chunk)
+            length += len(chunk)
+        data = b''.join(chunks)
+        if size < 0:
+            self._buffer = b''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+    readline = read
+
+
+def copy_rows(cur, table, columns, rows, chunk_size=65536):
+    """Stream an iterable of tuples into ``table`` with COPY FROM STDIN.
+
+    Returns the number of rows written.
+    """
+    lines = (('\t'.join(_copy_value(v) for v in row) + '\n').encode('utf-8') for row in rows)
+    sql = "COPY %s (%s) FROM STDIN" % (table, ', '.join(columns))
+    cur.copy_expert(sql, _CopyStream(lines), size=chunk_size)
+    return cur.rowcount
+
+
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + b'\x00\x00\x00\x00' + b'\x00\x00\x00\x00'
+PGCOPY_TRAILER = b'\xff\xff'
+
+def copy_binary(cur, table, columns, chunks, chunk_size=1 << 20):
+    """COPY pre-encoded binary tuples into ``table``.
+
+    ``chunks`` yields tuple data in PostgreSQL's binary COPY layout (no
+    header or trailer); this lets callers build whole blocks with NumPy.
+    Returns the number of rows written.
+    """
+    def stream():
+        yield PGCOPY_HEADER
+        for chunk in chunks:
+            yield chunk
+        yield PGCOPY_TRAILER
+
+    sql = "COPY %s (%s) FROM STDIN WITH (FORMAT binary)" % (table, ', '.join(columns))
+    cur.copy_expert(sql, _CopyStream(stream()), size=chunk_size)
+    return cur.rowcount
+
+
+def copy_out_binary(cur, query):
+    """Run ``COPY (query) TO STDOUT`` in binary format and return the tuple data.
+
+    The header and trailer are stripped, so fixed-width results can be read
+    straight into a NumPy structured array.
+    """
+    buf = io.BytesIO()
+    cur.copy_expert("COPY (%s) TO STDOUT WITH (FORMAT binary)" % query, buf)
+    data = buf.getvalue()
+    if not data:
+        return b''
+    ext_len = struct.unpack('!i', data[15:19])[0]
+    return data[19 + ext_len:-2]
@@ -0,0 +1,94 @@
+from db import db_connection
+from app import build_price_query, encode_price_cursor, PRICE_SUMMARY_SQL
+from refdata import refdata
+import argparse
+import datetime
+import json
+import sys
+
+PAGE_CURSOR = encode_price_cursor(datetime.date(2024, 1, 1), 0)
+
+# (label, /prices query args, index names any one of which must appear in the plan)
+PRICE_CHECKS = [
+    ("prices by crop", {'crop': 'Tomato'},
+     {'idx_market_prices_crop_market_date', 'idx_market_prices_crop_predicted_date'}),
+    ("prices by crop and market", {'crop': 'Tomato', 'market': 'Azadpur Mandi'},
+     {'idx_market_prices_crop_market_date'}),
+    ("prices by crop, history only", {'crop': 'Tomato', 'is_predicted': 'false'},
+     {'idx_market_prices_crop_predicted_date'}),
+    ("prices by crop and date range", {'crop': 'Tomato', 'from': '2024-01-01', 'to': '2024-03-31'},
+     {'idx_market_prices_crop_market_date', 'idx_market_prices_crop_predicted_date'}),
+    ("weekly rollups by crop and market", {'crop': 'Tomato', 'market': 'Azadpur Mandi', 'resolution': 'week'},
+     {'price_rollups_pkey', 'idx_price_rollups_crop_period'}),
+    ("monthly rollups by crop", {'crop': 'Tomato', 'resolution': 'month'},
+     {'price_rollups_pkey', 'idx_price_rollups_crop_period'}),
+    # Keyset pages: the index has to deliver (date, id) order so LIMIT stops early
+    ("prices first page", {'limit': '1000'},
+     {'idx_market_prices_date_id'}),
+    ("prices next page", {'cursor': PAGE_CURSOR, 'limit': '1000'},
+     {'idx_market_prices_date_id'}),
+    ("prices next page by crop", {'crop': 'Tomato', 'cursor': PAGE_CURSOR, 'limit': '1000'},
+     {'idx_market_prices_crop_date_id'}),
+]
+
+
+def plan_indexes(node, found=None):
+    found = set() if found is None else found
+    if 'Index Name' in node:
+        found.add(node['Index Name'])
+    for child in node.get('Plans', []):
+        plan_indexes(child, found)
+    return found
+
+
+def explain(cur, query, params):
+    cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def price_check_query(args):
+    query, params = build_price_query(args)
+    if 'limit' in args:
+        # Same extra row /prices fetches to find the next page
+        query += " LIMIT %s"
+        params.append(int(args['limit']) + 1)
+    return query, params
+
+
+def run_checks(force_index=False, verbose=False):
+    checks = [(label, *price_check_query(args), expected) for label, args, expected in PRICE_CHECKS]
+    checks.append(("price summary", PRICE_SUMMARY_SQL, [refdata.crop_id('Tomato'), 15, 15],
+                   {'idx_market_prices_crop_market_date', 'idx_market_prices_crop_predicted_date'}))
+    # Names normally resolve through the reference-data cache; direct lookups still need the index
+    checks.append(("crop lookup by name", "SELECT id FROM crops WHERE lower(name) = lower(%s)", ['Tomato'],
+                   {'idx_crops_lower_name'}))
+
+    failures = 0
+    with db_connection() as conn:
+        cur = conn.cursor()
+        if force_index:
+            # Tiny dev datasets make sequential scans cheaper than any index;
+            # this asks "can the planner use the index" rather than "does it today"
+            cur.execute("SET LOCAL enable_seqscan = off")
+        for label, query, params, expected in checks:
+            plan = explain(cur, query, tuple(params))
+            used = plan_indexes(plan)
+            ok = bool(used & expected)
+            failures += not ok
+            print(f"[{'ok' if ok else 'FAIL'}] {label}: {', '.join(sorted(used)) or 'no indexes'}")
+            if verbose or not ok:
+                print(json.dumps(plan, indent=2))
+        cur.close()
+        conn.rollback()
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that /prices queries are served by the expected indexes")
+    parser.add_argument('--force-index', action='store_true', help="Disable sequential scans (useful on small datasets)")
+    parser.add_argument('--verbose', action='store_true', help="Print every plan, not just failing ones")
+    args = parser.parse_args()
+    sys.exit(1 if run_checks(args.force_index, args.verbose) else 0)
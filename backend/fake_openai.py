@@ -0,0 +1,171 @@
+"""Local stand-in for the Azure OpenAI chat completions API.
+
+Speaks just enough of the wire format (JSON and streamed SSE chunks, including
+tool calls split across fragments) to exercise /api/ai/chat offline:
+
+    python fake_openai.py --port 8089 --delay 0.05
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8089 AZURE_OPENAI_API_KEY=fake python app.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "Tomato prices in Azadpur are rising this week, so holding stock for a few days may pay off."
+
+
+class FakeOpenAIServer:
+    """Threaded fake completions server.
+
+    ``reply`` is streamed word by word with ``token_delay`` seconds between
+    tokens. When ``tool_args`` is set and the request offers tools, the first
+    completion asks for update_farm_data with those arguments instead.
+    Every request body is kept in ``requests`` for assertions.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, reply=DEFAULT_REPLY, tool_args=None, token_delay=0.0):
+        self.reply = reply
+        self.tool_args = tool_args
+        self.token_delay = token_delay
+        self.requests = []
+        self.connections = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # -- responses ----------------------------------------------------------
+
+    def wants_tool(self, body):
+        last = body.get('messages', [{}])[-1]
+        return bool(self.tool_args and body.get('tools') and last.get('role') == 'user')
+
+    def tokens(self):
+        words = self.reply.split(' ')
+        return [w if i == 0 else ' ' + w for i, w in enumerate(words)]
+
+    def completion(self, body):
+        message = {"role": "assistant", "content": self.reply}
+        finish = "stop"
+        if self.wants_tool(body):
+            message = {"role": "assistant", "content": None, "tool_calls": [{
+                "id": "call_fake_1", "type": "function",
+                "function": {"name": "update_farm_data", "arguments": json.dumps(self.tool_args)},
+            }]}
+            finish = "tool_calls"
+        return {
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get('model', 'fake'),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(self.tokens()), "total_tokens": len(self.tokens())},
+        }
+
+    def chunks(self, body):
+        base = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": body.get('model', 'fake')}
+
+        def chunk(delta, finish=None):
+            return dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": finish}])
+
+        # Azure opens every stream with a content-filter chunk that has no choices
+        yield dict(base, choices=[], prompt_filter_results=[])
+        if self.wants_tool(body):
+            arguments = json.dumps(self.tool_args)
+            half = len(arguments) // 2
+            yield chunk({"role": "assistant", "tool_calls": [{
+                "index": 0, "id": "call_fake_1", "type": "function",
+                "function": {"name": "update_farm_data", "arguments": ""}}]})
+            for part in (arguments[:half], arguments[half:]):
+                yield chunk({"tool_calls": [{"index": 0, "function": {"arguments": part}}]})
+            yield chunk({}, "tool_calls")
+            return
+        yield chunk({"role": "assistant", "content": ""})
+        for token in self.tokens():
+            yield chunk({"content": token})
+        yield chunk({}, "stop")
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, so client-side pooling is visible
+
+            def setup(self):
+                super().setup()
+                server.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if not self.path.split('?')[0].endswith('/chat/completions'):
+                    self.send_error(404)
+                    return
+                server.requests.append(body)
+
+                if not body.get('stream'):
+                    data = json.dumps(server.completion(body)).encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for chunk in server.chunks(body):
+                    self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                    if server.token_delay:
+                        time.sleep(server.token_delay)
+                self._write_chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, text):
+                data = text.encode('utf-8')
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake Azure OpenAI chat completions server")
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--delay', type=float, default=0.05, help="Seconds between streamed tokens")
+    parser.add_argument('--reply', default=DEFAULT_REPLY)
+    parser.add_argument('--tool-crop', help="Answer the first turn with an update_farm_data call for this crop")
+    args = parser.parse_args()
+
+    tool_args = {"crop_name": args.tool_crop, "quantity": 500, "location": "Nashik"} if args.tool_crop else None
+    fake = FakeOpenAIServer(port=args.port, reply=args.reply, tool_args=tool_args, token_delay=args.delay)
+    print(f"Fake OpenAI listening on {fake.endpoint}")
+    print(f"Run the backend with AZURE_OPENAI_ENDPOINT={fake.endpoint} AZURE_OPENAI_API_KEY=fake")
+    try:
+        fake._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
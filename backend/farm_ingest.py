@@ -0,0 +1,266 @@
+import csv
+import datetime
+import io
+import json
+import math
+import time
+
+from crop_resolver import CROP_MATCH_THRESHOLD, get_crop_resolver
+from db import copy_rows
+
+# Per-row errors returned in the response; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+MAX_LOCATION_LENGTH = 200
+MAX_USER_ID = 2 ** 31 - 1
+
+BULK_FORMATS = {
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl',
+    'application/json-lines': 'jsonl',
+    'application/json': 'json',
+}
+
+STAGING_COLUMNS = ('line', 'user_id', 'crop_id', 'quantity_kg', 'harvest_date', 'location', 'storage_details',
+                   'lat', 'lng')
+
+
+def bulk_format(fmt, mimetype, formats=('csv', 'jsonl')):
+    """One of ``formats`` from an explicit ?format= or the request's content type."""
+    fmt = fmt.lower() if fmt else BULK_FORMATS.get(mimetype)
+    return fmt if fmt in formats else None
+
+
+def text_stream(stream):
+    # utf-8-sig drops the BOM spreadsheet exports put in front of the header
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+
+def read_csv_records(stream):
+    """Yield (line, record, problem) for each CSV data row.
+
+    The header is read up front so a file without a crop column is rejected
+    before anything is loaded.
+    """
+    reader = csv.DictReader(text_stream(stream))
+    fields = {name.strip().lower() for name in reader.fieldnames or ()}
+    if not fields & {'crop', 'crop_name'}:
+        raise ValueError("CSV header must include a crop (or crop_name) column")
+
+    def records():
+        for row in reader:
+            record = {key.strip().lower(): value for key, value in row.items() if key is not None}
+            yield reader.line_num, record, None
+    return records()
+
+
+def read_jsonl_records(stream):
+    """Yield (line, record, problem) for each non-blank JSON line."""
+    for line, raw in enumerate(text_stream(stream), 1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except json.JSONDecodeError as e:
+            yield line, None, f"invalid JSON: {e.msg}"
+            continue
+        if not isinstance(record, dict):
+            yield line, None, "expected a JSON object"
+            continue
+        yield line, {str(key).lower(): value for key, value in record.items()}, None
+
+
+def read_farm_records(stream, fmt):
+    return read_csv_records(stream) if fmt == 'csv' else read_jsonl_records(stream)
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _coordinates(record):
+    # Optional farm position; both or neither, so a lone lat can't pass as a location
+    lat, lng = _text(record.get('lat')), _text(record.get('lng'))
+    if lat is None and lng is None:
+        return None, None
+    if lat is None or lng is None:
+        raise ValueError("lat and lng must be given together")
+    try:
+        lat, lng = float(lat), float(lng)
+    except ValueError:
+        raise ValueError(f"lat and lng must be numbers, got '{lat}', '{lng}'")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("lat must be within [-90, 90] and lng within [-180, 180]")
+    return lat, lng
+
+
+class FarmRowValidator:
+    """Turns raw records into farm_data staging rows, collecting per-row errors.
+
+    Crop names are resolved once per distinct spelling, so a file of ten
+    thousand "Tomato" rows costs one resolver lookup. Only exact names and
+    aliases are accepted; a near miss is an error that suggests the close
+    crop, since "sugar" or "mustard oil" is not the crop it resembles.
+    Unlike the assistant's update_farm_data, unknown crops are reported
+    rather than created: one typo would otherwise add a crop for every row
+    that repeats it. Rows belong to the uploading user unless the upload
+    may file rows for ``any_user`` (an administrator loading a cooperative's
+    member records); otherwise a user_id column may only repeat that id.
+    """
+
+    def __init__(self, user_id, resolver=None, max_errors=MAX_REPORTED_ERRORS, any_user=False):
+        self.user_id = user_id
+        self.any_user = any_user
+        self.resolver = resolver
+        self.max_errors = max_errors
+        self.crop_ids = {}
+        self.received = 0
+        self.staged = 0
+        self.errors = []
+        self.error_count = 0
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": message})
+
+    def crop_id(self, name):
+        """(crop id, None) for a known name, else (None, closest crop name or None)."""
+        key = name.lower()
+        if key not in self.crop_ids:
+            if self.resolver is None:
+                self.resolver = get_crop_resolver()
+            crop_id = self.resolver.lookup_id(name)
+            suggestion = None
+            if crop_id is None:
+                match = self.resolver.resolve(name)
+                if match is not None and match.score >= CROP_MATCH_THRESHOLD:
+                    suggestion = match.name
+            self.crop_ids[key] = crop_id, suggestion
+        return self.crop_ids[key]
+
+    def validate(self, record):
+        """Return a staging tuple (without the line number) or raise ValueError."""
+        crop = _text(record.get('crop') or record.get('crop_name'))
+        if crop is None:
+            raise ValueError("crop is required")
+        crop_id, suggestion = self.crop_id(crop)
+        if suggestion is not None:
+            raise ValueError(f"unknown crop '{crop}'; did you mean '{suggestion}'?")
+        if crop_id is None:
+            raise ValueError(f"unknown crop '{crop}'")
+
+        quantity = record.get('quantity_kg', record.get('quantity'))
+        if _text(quantity) is None:
+            raise ValueError("quantity_kg is required")
+        try:
+            quantity = float(quantity)
+        except (TypeError, ValueError):
+            raise ValueError(f"quantity_kg must be a number, got '{quantity}'")
+        if not math.isfinite(quantity) or quantity < 0:
+            raise ValueError("quantity_kg must be a non-negative number")
+
+        harvest_date = _text(record.get('harvest_date'))
+        if harvest_date is not None:
+            try:
+                harvest_date = datetime.date.fromisoformat(harvest_date)
+            except ValueError:
+                raise ValueError(f"harvest_date must be YYYY-MM-DD, got '{harvest_date}'")
+
+        user_id = _text(record.get('user_id'))
+        if user_id is None:
+            user_id = self.user_id
+        elif not self.any_user:
+            if user_id != str(self.user_id):
+                raise ValueError(f"user_id {user_id} is not the uploading user")
+            user_id = self.user_id
+        else:
+            try:
+                user_id = int(user_id)
+            except ValueError:
+                raise ValueError(f"user_id must be an integer, got '{user_id}'")
+            if not 0 < user_id <= MAX_USER_ID:
+                raise ValueError(f"user_id out of range: {user_id}")
+
+        location = _text(record.get('location'))
+        if location is not None and len(location) > MAX_LOCATION_LENGTH:
+            raise ValueError(f"location is longer than {MAX_LOCATION_LENGTH} characters")
+
+        return ((user_id, crop_id, quantity, harvest_date, location, _text(record.get('storage_details')))
+                + _coordinates(record))
+
+    def rows(self, records):
+        """Staging rows for the valid records; invalid ones are recorded and skipped."""
+        for line, record, problem in records:
+            self.received += 1
+            if problem is None:
+                try:
+                    row = self.validate(record)
+                except ValueError as e:
+                    problem = str(e)
+            if problem is not None:
+                self.error(line, problem)
+                continue
+            self.staged += 1
+            yield (line,) + row
+
+
+def load_farm_data(conn, records, user_id, resolver=None, any_user=False):
+    """Validate ``records`` and append the good ones to farm_data in one transaction.
+
+    Rows stream through COPY into a temporary staging table and are merged
+    with a single INSERT ... SELECT. Every valid row is a lot of its own, even
+    one that matches a stored row field for field, so sending the same file
+    twice stores it twice. With ``any_user``, rows naming a user that does
+    not exist are reported per line. The caller commits.
+    """
+    started = time.perf_counter()
+    validator = FarmRowValidator(user_id, resolver, any_user=any_user)
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TEMP TABLE farm_data_staging (
+            line INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            crop_id INTEGER NOT NULL,
+            quantity_kg FLOAT NOT NULL,
+            harvest_date DATE,
+            location VARCHAR(200),
+            storage_details TEXT,
+            lat FLOAT,
+            lng FLOAT
+        ) ON COMMIT DROP
+    """)
+    copy_rows(cur, 'farm_data_staging', STAGING_COLUMNS, validator.rows(records))
+    # Temp tables are never auto-analyzed; the merge plan needs a row count
+    cur.execute("ANALYZE farm_data_staging")
+
+    cur.execute("""
+        SELECT s.line, s.user_id FROM farm_data_staging s
+        WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.id = s.user_id)
+        ORDER BY s.line
+    """)
+    for line, user_id in cur.fetchall():
+        validator.error(line, f"unknown user_id {user_id}")
+
+    cur.execute("""
+        INSERT INTO farm_data (user_id, crop_id, quantity_kg, harvest_date, location, storage_details, lat, lng)
+        SELECT s.user_id, s.crop_id, s.quantity_kg, s.harvest_date, s.location, s.storage_details, s.lat, s.lng
+        FROM farm_data_staging s
+        WHERE EXISTS (SELECT 1 FROM users u WHERE u.id = s.user_id)
+    """)
+    inserted = cur.rowcount
+    cur.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "received": validator.received,
+        "inserted": inserted,
+        "error_count": validator.error_count,
+        "errors": sorted(validator.errors, key=lambda e: e["line"]),
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(validator.received / elapsed) if elapsed > 0 else None,
+    }
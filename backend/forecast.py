@@ -0,0 +1,367 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+
+from db import db_connection, copy_binary, copy_out_binary, copy_rows
+from price_sim import COPY_ROW_DTYPE, PG_EPOCH
+
+FORECAST_HORIZON = 15
+HISTORY_WINDOW = 180  # days of actual prices each model is fitted on
+SEASON = 7  # weekly market cycle
+SEASON_GAMMA = 0.1
+
+# Candidate (alpha, beta, phi) for damped-trend smoothing; every series is
+# fitted with all of them at once and keeps the one with the lowest one-step error
+PARAM_GRID = np.array([
+    (alpha, beta, phi)
+    for alpha in (0.2, 0.5, 0.8)
+    for beta in (0.05, 0.2)
+    for phi in (0.8, 0.95)
+])
+
+# COPY (...) TO STDOUT binary layout of the history query below
+HISTORY_ROW_DTYPE = np.dtype([
+    ('fields', '>i2'),
+    ('market_len', '>i4'), ('market_id', '>i4'),
+    ('last_len', '>i4'), ('last_day', '>i4'),
+    ('offset_len', '>i4'), ('offset', '>i4'),
+    ('price_len', '>i4'), ('price', '>f8'),
+])
+
+
+# -- model --------------------------------------------------------------------
+
+def fill_gaps(values):
+    """Forward-fill NaNs along time; leading gaps take the first observed price."""
+    values = np.array(values, dtype=np.float64)
+    observed = ~np.isnan(values)
+    idx = np.where(observed, np.arange(values.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    filled = values[np.arange(values.shape[0])[:, None], idx]
+    first = np.argmax(observed, axis=1)
+    first_value = values[np.arange(values.shape[0]), first]
+    return np.where(np.isnan(filled), first_value[:, None], filled)
+
+
+def fit_forecast(values, horizon=FORECAST_HORIZON):
+    """Damped-trend exponential smoothing with additive weekly seasonality.
+
+    ``values`` is (series, days), right-aligned so the last column is each
+    series' latest actual price; NaN marks missing days. All series and all
+    PARAM_GRID candidates are updated together, one day per step, so the cost
+    is a few vector ops per day rather than a Python loop per series.
+    Returns (forecasts of shape (series, horizon), chosen grid index per series).
+    """
+    y = fill_gaps(values)
+    num_series, days = y.shape
+    alpha, beta, phi = (PARAM_GRID[:, i, None] for i in range(3))
+
+    level = np.broadcast_to(y[:, 0], (len(PARAM_GRID), num_series)).copy()
+    span = min(SEASON, days - 1)
+    trend0 = (y[:, span] - y[:, 0]) / span if span > 0 else np.zeros(num_series)
+    trend = np.broadcast_to(trend0, level.shape).copy()
+    season = np.zeros((SEASON,) + level.shape)
+    sse = np.zeros(level.shape)
+
+    one_minus_alpha, one_minus_beta = 1 - alpha, 1 - beta
+    damped = np.empty(level.shape)
+    err = np.empty(level.shape)
+    for t in range(1, days):
+        s = t % SEASON
+        yt = y[:, t]
+        np.multiply(phi, trend, out=damped)
+        # One-step-ahead error, scored once the seasonal terms have warmed up
+        if t > SEASON:
+            np.add(level, damped, out=err)
+            err += season[s]
+            np.subtract(yt, err, out=err)
+            err *= err
+            sse += err
+        # level and trend are rebound each step, so the old level survives for the trend update
+        new_level = alpha * (yt - season[s])
+        new_level += one_minus_alpha * (level + damped)
+        trend = beta * (new_level - level)
+        trend += one_minus_beta * damped
+        season[s] *= 1 - SEASON_GAMMA
+        season[s] += SEASON_GAMMA * (yt - new_level)
+        level = new_level
+
+    best = np.argmin(sse, axis=0)
+    cols = np.arange(num_series)
+    steps = np.arange(1, horizon + 1)
+    # sum_{i=1..h} phi^i, per candidate
+    damping = np.cumsum(PARAM_GRID[:, 2, None] ** steps, axis=1)[best]
+    seasonal = season[(days - 1 + steps) % SEASON][:, best, cols].T
+    forecasts = level[best, cols][:, None] + damping * trend[best, cols][:, None] + seasonal
+    # Prices can't go below a paisa per kg
+    return np.maximum(forecasts, 0.01), best
+
+
+# -- data access --------------------------------------------------------------
+
+def load_history(cur, crop_id, market_ids, window=HISTORY_WINDOW):
+    """Fetch the last ``window`` days of actual prices for one crop's series.
+
+    Returns (market_ids, last_days, values): values is (series, window) and
+    right-aligned on each series' own latest date; last_days are days since
+    PG_EPOCH. Read with binary COPY straight into a NumPy array.
+    """
+    query = cur.mogrify("""
+        WITH last AS (
+            SELECT market_id, MAX(date) AS last_date
+            FROM market_prices
+            WHERE crop_id = %s AND NOT is_predicted AND market_id = ANY(%s)
+            GROUP BY market_id
+        )
+        SELECT mp.market_id, l.last_date - DATE '2000-01-01', mp.date - l.last_date, mp.price_per_kg
+        FROM market_prices mp
+        JOIN last l ON l.market_id = mp.market_id
+        WHERE mp.crop_id = %s AND NOT mp.is_predicted AND mp.date > l.last_date - %s
+    """, (crop_id, list(market_ids), crop_id, window)).decode('utf-8')
+    rows = np.frombuffer(copy_out_binary(cur, query), dtype=HISTORY_ROW_DTYPE)
+
+    series_ids, series_idx = np.unique(rows['market_id'], return_inverse=True)
+    last_days = np.zeros(len(series_ids), dtype=np.int32)
+    last_days[series_idx] = rows['last_day']
+    values = np.full((len(series_ids), window), np.nan)
+    values[series_idx, window - 1 + rows['offset']] = rows['price']
+    return series_ids.astype(np.int32), last_days, values
+
+
+def encode_forecast_rows(batches, horizon):
+    """Yield binary COPY chunks of is_predicted rows, one crop batch at a time."""
+    steps = np.arange(1, horizon + 1, dtype=np.int32)
+    for crop_id, market_ids, last_days, forecasts in batches:
+        block = np.empty(forecasts.shape, dtype=COPY_ROW_DTYPE)
+        block['fields'] = 5
+        block['market_len'] = 4
+        block['crop_len'] = 4
+        block['price_len'] = 8
+        block['date_len'] = 4
+        block['pred_len'] = 1
+        block['market_id'] = market_ids[:, None]
+        block['crop_id'] = crop_id
+        block['price'] = np.round(forecasts, 2)
+        block['date'] = last_days[:, None] + steps[None, :]
+        block['is_predicted'] = 1
+        yield block.tobytes()
+
+
+def write_forecasts(cur, batches, processed, horizon):
+    """Replace the forecasts of every processed series in one merge.
+
+    ``processed`` is (market_id, crop_id, last_date or None, change_seq) for
+    each dirty series handled in this run. Predicted rows outside the new
+    forecast window are deleted, and the series is only marked clean if
+    nothing changed it while we were working.
+    """
+    cur.execute("""
+        CREATE TEMP TABLE forecast_staging (
+            market_id INTEGER,
+            crop_id INTEGER,
+            price_per_kg FLOAT,
+            date DATE,
+            is_predicted BOOLEAN
+        ) ON COMMIT DROP;
+        CREATE TEMP TABLE forecast_batch (
+            market_id INTEGER,
+            crop_id INTEGER,
+            last_date DATE,
+            change_seq BIGINT
+        ) ON COMMIT DROP;
+    """)
+    copy_rows(cur, 'forecast_batch', ('market_id', 'crop_id', 'last_date', 'change_seq'), processed)
+    written = copy_binary(cur, 'forecast_staging',
+                          ('market_id', 'crop_id', 'price_per_kg', 'date', 'is_predicted'),
+                          encode_forecast_rows(batches, horizon))
+    cur.execute("""
+        DELETE FROM market_prices mp
+        USING forecast_batch b
+        WHERE mp.is_predicted AND mp.market_id = b.market_id AND mp.crop_id = b.crop_id
+          AND (b.last_date IS NULL OR mp.date <= b.last_date OR mp.date > b.last_date + %s)
+    """, (horizon,))
+    cur.execute("""
+        INSERT INTO market_prices (market_id, crop_id, price_per_kg, date, is_predicted)
+        SELECT market_id, crop_id, price_per_kg, date, is_predicted FROM forecast_staging
+        ON CONFLICT (market_id, crop_id, date, is_predicted)
+        DO UPDATE SET price_per_kg = EXCLUDED.price_per_kg;
+    """)
+    cur.execute("""
+        DELETE FROM forecast_dirty d
+        USING forecast_batch b
+        WHERE d.market_id = b.market_id AND d.crop_id = b.crop_id AND d.change_seq = b.change_seq
+    """)
+    cur.execute("DROP TABLE forecast_staging, forecast_batch")
+    return written
+
+
+def dirty_series(cur, full=False):
+    """Return {crop_id: {market_id: change_seq}} for the series to re-forecast."""
+    if full:
+        cur.execute("""
+            INSERT INTO forecast_dirty (market_id, crop_id, change_seq)
+            SELECT market_id, crop_id, nextval('forecast_change_seq')
+            FROM (SELECT DISTINCT market_id, crop_id FROM market_prices
+                  WHERE NOT is_predicted AND market_id IS NOT NULL AND crop_id IS NOT NULL) s
+            ON CONFLICT (market_id, crop_id) DO UPDATE SET change_seq = EXCLUDED.change_seq
+        """)
+    cur.execute("SELECT crop_id, market_id, change_seq FROM forecast_dirty")
+    series = {}
+    for crop_id, market_id, change_seq in cur.fetchall():
+        series.setdefault(crop_id, {})[market_id] = change_seq
+    return series
+
+
+# -- jobs ---------------------------------------------------------------------
+
+def timed_fit(values, horizon):
+    # Timed inside the worker so queueing in the pool isn't counted
+    started = time.perf_counter()
+    forecasts, _ = fit_forecast(values, horizon)
+    return forecasts, time.perf_counter() - started
+
+
+def _executor(workers):
+    # workers=1 fits in-process, which is simpler to debug and cheaper for small runs
+    if workers == 1:
+        return None
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def run_forecasts(full=False, horizon=FORECAST_HORIZON, window=HISTORY_WINDOW, workers=None,
+                  connection=db_connection):
+    """Re-forecast every series whose actual history changed since the last run.
+
+    History is loaded one crop at a time and fitted in a process pool while
+    the next crop loads; all forecasts are then written in one transaction.
+    Returns (series forecast, rows written).
+    """
+    with connection() as conn:
+        try:
+            cur = conn.cursor()
+            started = time.perf_counter()
+            dirty = dirty_series(cur, full)
+            if not dirty:
+                conn.commit()
+                print("No series changed since the last forecast run.")
+                return 0, 0
+
+            processed, pending = [], []
+            pool = _executor(workers)
+            try:
+                for crop_id, markets in dirty.items():
+                    market_ids, last_days, values = load_history(cur, crop_id, markets.keys(), window)
+                    found = dict(zip(market_ids.tolist(), last_days.tolist()))
+                    for market_id, change_seq in markets.items():
+                        last_day = found.get(market_id)
+                        last_date = PG_EPOCH + timedelta(days=last_day) if last_day is not None else None
+                        processed.append((market_id, crop_id, last_date, change_seq))
+                    if not len(market_ids):
+                        continue
+                    if pool is None:
+                        result = fit_forecast(values, horizon)
+                    else:
+                        result = pool.submit(fit_forecast, values, horizon)
+                    pending.append((crop_id, market_ids, last_days, result))
+
+                batches = [
+                    (crop_id, market_ids, last_days, (result if pool is None else result.result())[0])
+                    for crop_id, market_ids, last_days, result in pending
+                ]
+            finally:
+                if pool is not None:
+                    pool.shutdown()
+            fitted = time.perf_counter() - started
+
+            written = write_forecasts(cur, batches, processed, horizon)
+            conn.commit()
+            cur.close()
+            num_series = sum(len(b[1]) for b in batches)
+            print(f"Forecast {num_series} series ({written} rows) in {time.perf_counter() - started:.1f}s "
+                  f"(fit {fitted:.1f}s).")
+            return num_series, written
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def backtest(horizon=FORECAST_HORIZON, window=HISTORY_WINDOW, workers=None, output=None):
+    """Hold out the last ``horizon`` actual days of each series and score the forecast.
+
+    Prints overall MAE/MAPE next to a naive last-price baseline, and writes
+    per-series error and runtime to ``output`` (CSV) when given. Runtime is the
+    fit time of the series' crop batch divided by its size.
+    """
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT crop_id, array_agg(DISTINCT market_id) FROM market_prices
+            WHERE NOT is_predicted AND market_id IS NOT NULL AND crop_id IS NOT NULL
+            GROUP BY crop_id
+        """)
+        crops = cur.fetchall()
+        loaded = [(crop_id, *load_history(cur, crop_id, market_ids, window + horizon))
+                  for crop_id, market_ids in crops]
+        conn.rollback()
+        cur.close()
+
+    pool = _executor(workers)
+    try:
+        if pool is None:
+            results = [timed_fit(values[:, :-horizon], horizon) for _, _, _, values in loaded]
+        else:
+            futures = [pool.submit(timed_fit, values[:, :-horizon], horizon) for _, _, _, values in loaded]
+            results = [future.result() for future in futures]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    lines = ["market_id,crop_id,mae,mape,naive_mae,runtime_ms"]
+    errors, naive_errors, pct_errors = [], [], []
+    for (crop_id, market_ids, _, values), (forecasts, seconds) in zip(loaded, results):
+        actual = values[:, -horizon:]
+        naive = fill_gaps(values[:, :-horizon])[:, -1:]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            abs_err = np.abs(forecasts - actual)
+            mae = np.nanmean(abs_err, axis=1)
+            mape = np.nanmean(abs_err / actual, axis=1) * 100
+            naive_mae = np.nanmean(np.abs(naive - actual), axis=1)
+        per_series_ms = seconds * 1000 / len(market_ids)
+        for i, market_id in enumerate(market_ids.tolist()):
+            lines.append(f"{market_id},{crop_id},{mae[i]:.4f},{mape[i]:.2f},{naive_mae[i]:.4f},{per_series_ms:.3f}")
+        errors.append(mae)
+        naive_errors.append(naive_mae)
+        pct_errors.append(mape)
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+    if not errors:
+        print("No price history to backtest.")
+        return
+    errors, naive_errors, pct_errors = (np.concatenate(a) for a in (errors, naive_errors, pct_errors))
+    total = sum(seconds for _, seconds in results)
+    print(f"Backtested {len(errors)} series over {horizon} days: "
+          f"MAE {np.nanmean(errors):.3f}, MAPE {np.nanmean(pct_errors):.2f}%, "
+          f"naive MAE {np.nanmean(naive_errors):.3f}, fit {total * 1000 / len(errors):.3f} ms/series")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forecast market prices and write them as is_predicted rows")
+    parser.add_argument('--full', action='store_true', help="Re-forecast every series, not only those that changed")
+    parser.add_argument('--horizon', type=int, default=FORECAST_HORIZON, help="Days to forecast past each series' last price")
+    parser.add_argument('--window', type=int, default=HISTORY_WINDOW, help="Days of history each model is fitted on")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count, 1 = in-process)")
+    parser.add_argument('--backtest', action='store_true', help="Score forecasts against held-out history instead of writing them")
+    parser.add_argument('--output', help="With --backtest, write per-series results to this CSV file")
+    args = parser.parse_args()
+
+    workers = args.workers or os.cpu_count()
+    if args.backtest:
+        backtest(args.horizon, args.window, workers, args.output)
+    else:
+        run_forecasts(args.full, args.horizon, args.window, workers)
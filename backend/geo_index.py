@@ -0,0 +1,146 @@
+import heapq
+import math
+import threading
+
+import numpy as np
+
+from refdata import refdata
+
+EARTH_RADIUS_KM = 6371.0088
+# Points per leaf: small enough to prune well, large enough that the NumPy
+# distance call at a leaf is worth its overhead
+LEAF_SIZE = 32
+
+
+def unit_vectors(lat, lng):
+    """Degrees to points on the unit sphere, shape (n, 3)."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(chord):
+    # Straight-line distance between unit vectors -> great-circle (haversine) distance
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.asarray(chord) / 2.0, 1.0))
+
+
+def km_to_chord(km):
+    return 2.0 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2.0)
+
+
+class MarketIndex:
+    """Ball tree over market coordinates for nearest-market queries.
+
+    Markets are stored as 3D unit vectors, where straight-line (chord)
+    distance orders points exactly like great-circle distance, so the tree
+    can use plain Euclidean balls and still answer haversine queries. Each
+    leaf is a contiguous slice of the reordered points, so a query walks
+    the tree best-first and scores whole leaves with one matrix product.
+    """
+
+    def __init__(self, markets, leaf_size=LEAF_SIZE):
+        # markets: (id, lat, lng) rows; ones without coordinates are skipped
+        rows = [(m_id, lat, lng) for m_id, lat, lng in markets if lat is not None and lng is not None]
+        self.size = len(rows)
+        ids = np.array([r[0] for r in rows], dtype=np.int64)
+        points = unit_vectors([r[1] for r in rows], [r[2] for r in rows]).reshape(-1, 3)
+
+        order = np.arange(self.size)
+        starts, ends, centers, radii, children = [], [], [], [], []
+
+        def build(start, end):
+            node = len(starts)
+            members = points[order[start:end]]
+            center = members.mean(axis=0)
+            starts.append(start)
+            ends.append(end)
+            centers.append(center)
+            radii.append(float(np.sqrt(((members - center) ** 2).sum(axis=1)).max()))
+            children.append(None)
+            if end - start > leaf_size:
+                # Split at the median of the widest axis
+                axis = int(np.ptp(members, axis=0).argmax())
+                mid = (end - start) // 2
+                split = np.argpartition(members[:, axis], mid)
+                order[start:end] = order[start:end][split]
+                children[node] = (build(start, start + mid), build(start + mid, end))
+            return node
+
+        if self.size:
+            build(0, self.size)
+        self.ids = ids[order]
+        self.points = points[order]
+        self.starts = starts
+        self.ends = ends
+        # Plain floats: the traversal touches a few dozen nodes, where Python
+        # arithmetic is cheaper than NumPy calls
+        self.centers = [tuple(c.tolist()) for c in centers]
+        self.radii = radii
+        self.children = children
+
+    def nearest(self, lat, lng, k=10, radius_km=None):
+        """Up to ``k`` (market_id, distance_km) pairs, closest first, within ``radius_km``."""
+        if not self.size or k <= 0:
+            return []
+        query = unit_vectors(lat, lng)
+        qx, qy, qz = query.tolist()
+        centers, radii, children = self.centers, self.radii, self.children
+
+        def lower_bound(node):
+            # Nothing in the ball can be closer than this
+            cx, cy, cz = centers[node]
+            d = math.sqrt((qx - cx) ** 2 + (qy - cy) ** 2 + (qz - cz) ** 2) - radii[node]
+            return d if d > 0.0 else 0.0
+
+        found_d, found_i, total = [], [], 0
+        kth = km_to_chord(radius_km) if radius_km is not None else math.inf
+        heap = [(lower_bound(0), 0)]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > kth:
+                break
+            pair = children[node]
+            if pair is not None:
+                for child in pair:
+                    bound = lower_bound(child)
+                    if bound <= kth:
+                        heapq.heappush(heap, (bound, child))
+                continue
+            start, end = self.starts[node], self.ends[node]
+            # |p - q|^2 = 2 - 2 p.q for unit vectors: one matmul per leaf
+            d = np.sqrt(np.maximum(2.0 - 2.0 * (self.points[start:end] @ query), 0.0))
+            keep = np.flatnonzero(d <= kth)
+            if len(keep):
+                found_d.append(d[keep])
+                found_i.append(keep + start)
+                total += len(keep)
+            if total >= k:
+                found_d = [np.concatenate(found_d)] if len(found_d) > 1 else found_d
+                found_i = [np.concatenate(found_i)] if len(found_i) > 1 else found_i
+                kth = min(kth, float(np.partition(found_d[0], k - 1)[k - 1]))
+
+        if not found_d:
+            return []
+        d = np.concatenate(found_d)
+        i = np.concatenate(found_i)
+        best = np.argsort(d, kind='stable')[:k]
+        best = best[d[best] <= kth]
+        return list(zip(self.ids[i[best]].tolist(), chord_to_km(d[best]).tolist()))
+
+
+_index = None
+_index_digest = None
+_index_lock = threading.Lock()
+
+
+def get_market_index():
+    """Index over the current markets table, rebuilt whenever refdata reloads it."""
+    global _index, _index_digest
+    digest = refdata.markets_digest()
+    if _index is None or _index_digest != digest:
+        with _index_lock:
+            if _index is None or _index_digest != digest:
+                _index = MarketIndex((row[0], row[3], row[4]) for row in refdata.markets())
+                _index_digest = digest
+    return _index
@@ -0,0 +1,57 @@
+"""Production serving: gunicorn -c gunicorn.conf.py
+
+The app module is imported once in the master (preload_app) and forked, so
+workers share its code pages and start fast. Its module-level app is built
+exactly once there; create_app() opens no connections, so each worker opens
+its own DB pool, OpenAI client and reference data caches in post_fork.
+
+On SIGTERM gunicorn stops accepting connections and gives in-flight
+requests (chat streams included) up to graceful_timeout seconds before
+worker_exit releases the pool.
+
+Tuning, all via environment:
+    PORT                 listen port (default 8000)
+    WEB_CONCURRENCY      worker processes (default 2 x CPUs + 1, at most 8)
+    GUNICORN_THREADS     threads per worker (default 8)
+    GRACEFUL_TIMEOUT     seconds to drain on shutdown (default 30)
+    TRUSTED_PROXY_HOPS   proxies in front of gunicorn whose X-Forwarded-For
+                         is trusted (default 1, Azure's front end); 0 when
+                         clients connect directly
+"""
+import multiprocessing
+import os
+
+# The module-level instance; 'app:create_app()' would build a second one
+wsgi_app = 'app:app'
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# Processes for CPU work (password hashing, JSON encoding) that the GIL
+# would serialize; threads for requests waiting on Postgres or OpenAI
+workers = int(os.getenv('WEB_CONCURRENCY', min(2 * multiprocessing.cpu_count() + 1, 8)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+# Every thread may hold a connection; size each worker's pool to match
+# unless it was set explicitly
+os.environ.setdefault('DB_POOL_MAX', str(threads))
+# Behind the front end every request comes from its address, so the login
+# throttle must key on the forwarded client address instead. Set before
+# preload imports the app, which reads it in create_app()
+os.environ.setdefault('TRUSTED_PROXY_HOPS', '1')
+
+preload_app = True
+timeout = 60
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+accesslog = None  # the app logs slow requests and exports request metrics
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    from app import init_worker
+    init_worker()
+
+
+def worker_exit(server, worker):
+    from app import shutdown_worker
+    shutdown_worker()
@@ -0,0 +1,139 @@
+import gzip
+import hashlib
+import os
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional: fall back to gzip only
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+# Columnar msgpack too: day offsets and dictionary indexes compress well.
+# Not text/event-stream: proxies and browsers buffer gzipped SSE, which stalls
+# the AI advice stream, and single events are too small to gain anything.
+COMPRESS_MIMETYPES = {'application/json', 'text/plain', 'text/csv', 'application/x-msgpack'}
+
+
+# -- validators ---------------------------------------------------------------
+
+def price_version(cur, crop_id=None):
+    """Return (version, updated_at) for one crop's prices, or for all prices.
+
+    price_versions is bumped by statement triggers on market_prices, so this
+    is a single-row lookup rather than a scan of the price data.
+    """
+    if crop_id is not None:
+        cur.execute("SELECT version, updated_at FROM price_versions WHERE crop_id = %s", (crop_id,))
+        row = cur.fetchone()
+    else:
+        cur.execute("SELECT MAX(version), MAX(updated_at) FROM price_versions")
+        row = cur.fetchone()
+    if not row or row[0] is None:
+        return 0, None
+    return row
+
+
+def make_etag(*parts):
+    # The full query string is part of every tag: each filter combination is its own representation
+    raw = '|'.join(str(p) for p in parts + (request.path, request.query_string.decode('latin-1')))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+
+def is_not_modified(etag, last_modified=None):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def add_validators(response, etag, last_modified=None):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Clients may keep the body but must revalidate before reusing it
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def not_modified_response(app, etag, last_modified=None):
+    response = app.response_class(status=304)
+    return add_validators(response, etag, last_modified)
+
+
+# -- compression --------------------------------------------------------------
+
+def choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_body(data, encoding):
+    if encoding == 'br':
+        # Quality 5 is a good speed/size trade-off for dynamic JSON
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+class GzipStream:
+    """Incrementally gzip a streamed body.
+
+    Each chunk is flushed so the client still sees data as it is produced, and
+    close() is always forwarded so the wrapped generator releases its resources.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def __iter__(self):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in self._chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def close(self):
+        close = getattr(self._chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        if not request.accept_encodings['gzip']:
+            return response
+        response.response = GzipStream(response.response)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers.pop('Content-Length', None)
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(compress_body(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    app.after_request(compress_response)
@@ -0,0 +1,337 @@
+import bisect
+import cProfile
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+# Latency buckets (seconds) shared by request, query and upstream histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', '1.0'))
+# Set to a directory to allow X-Profile: 1 requests; each writes a .prof file there
+PROFILE_DIR = os.getenv('PROFILE_DIR')
+
+PHASES = ('pool', 'db', 'serialize')
+
+
+# -- registry -----------------------------------------------------------------
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is one bisect and one locked update."""
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="%s"' % ('+Inf' if bound == float('inf') else repr(bound))
+                yield f"{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """``collect()`` returns exposition lines, e.g. gauges read at scrape time."""
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.collect())
+        for collect in self.collectors:
+            try:
+                lines.extend(collect())
+            except Exception:
+                logger.exception("Metrics collector failed")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    'http_requests_total', "Requests by route, method and status", ('route', 'method', 'status'))
+http_latency = registry.histogram(
+    'http_request_duration_seconds', "Time to produce response headers", ('route', 'method'))
+http_phases = registry.histogram(
+    'http_request_phase_seconds', "Per-request time in pool checkout, queries and JSON encoding",
+    ('route', 'phase'))
+db_latency = registry.histogram(
+    'db_query_duration_seconds', "Query execution time by statement type", ('statement',))
+db_rows = registry.histogram(
+    'db_query_rows', "Rows returned or affected per query", ('statement',), buckets=ROW_BUCKETS)
+upstream_latency = registry.histogram(
+    'upstream_request_duration_seconds', "Calls to external services", ('service', 'outcome'))
+
+
+# -- timing -------------------------------------------------------------------
+
+def add_phase(phase, seconds):
+    # Accumulates into the current request's Server-Timing breakdown
+    if has_request_context():
+        timings = g.get('phase_times')
+        if timings is not None:
+            timings[phase] = timings.get(phase, 0.0) + seconds
+
+
+_STATEMENT = re.compile(r'\s*(?:--[^\n]*\n\s*)*(\w+)')
+
+
+def statement_type(sql):
+    if isinstance(sql, bytes):
+        sql = sql[:64].decode('latin-1')
+    elif not isinstance(sql, str):
+        return 'other'
+    match = _STATEMENT.match(sql)
+    return match.group(1).lower() if match else 'other'
+
+
+def observe_query(sql, seconds, rows):
+    statement = statement_type(sql)
+    db_latency.observe(seconds, statement)
+    if rows is not None and rows >= 0:
+        db_rows.observe(rows, statement)
+    add_phase('db', seconds)
+
+
+def observe_pool_wait(seconds):
+    add_phase('pool', seconds)
+
+
+@contextmanager
+def upstream_timer(service):
+    """Time a call to an external service, labelled ok or error."""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        upstream_latency.observe(time.perf_counter() - started, service, outcome)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with jsonify() time counted as the serialize phase."""
+
+    def response(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().response(*args, **kwargs)
+        finally:
+            add_phase('serialize', time.perf_counter() - started)
+
+
+# -- logging ------------------------------------------------------------------
+
+logger = logging.getLogger('api')
+
+REDACTED = '[redacted]'
+SECRET_KEYS = re.compile(r'pass|secret|token|key|authorization|cookie|session', re.IGNORECASE)
+
+
+def mask_email(value):
+    name, _, domain = str(value).partition('@')
+    return f"{name[:1]}***@{domain}" if domain else REDACTED
+
+
+def redact(value, key=''):
+    """Copy of ``value`` with credentials removed and contact details masked."""
+    if isinstance(value, dict):
+        return {k: redact(v, str(k)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v, key) for v in value]
+    if value is None:
+        return None
+    if SECRET_KEYS.search(key):
+        return REDACTED
+    lowered = key.lower()
+    if lowered == 'email':
+        return mask_email(value)
+    if lowered == 'phone':
+        digits = str(value)
+        return '*' * max(len(digits) - 2, 0) + digits[-2:]
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``extra={"fields": {...}}`` is redacted and merged in."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if has_request_context():
+            entry["request_id"] = g.get('request_id')
+            entry["method"] = request.method
+            entry["path"] = request.path
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(redact(fields))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    # LOG_FORMAT=text keeps plain lines for local development
+    root = logging.getLogger()
+    if any(getattr(h, '_api_handler', False) for h in root.handlers):
+        return
+    handler = logging.StreamHandler()
+    handler._api_handler = True
+    if os.getenv('LOG_FORMAT', 'json') == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    root.addHandler(handler)
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+
+# -- request hooks ------------------------------------------------------------
+
+# cProfile allows one active profiler per process; concurrent X-Profile
+# requests are served unprofiled
+_profile_lock = threading.Lock()
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else '<unmatched>'
+
+
+def _before_request():
+    g.request_started = time.perf_counter()
+    g.phase_times = {}
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    if PROFILE_DIR and request.headers.get('X-Profile') and _profile_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def _finish_profile(response, route):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    try:
+        profiler.disable()
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{g.request_id}-{re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_')}.prof"
+        profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+        response.headers['X-Profile-File'] = name
+    finally:
+        _profile_lock.release()
+
+
+def _after_request(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    route = _route()
+    _finish_profile(response, route)
+    elapsed = time.perf_counter() - started
+
+    http_requests.inc(route, request.method, str(response.status_code))
+    http_latency.observe(elapsed, route, request.method)
+    timings = g.phase_times
+    for phase in PHASES:
+        if phase in timings:
+            http_phases.observe(timings[phase], route, phase)
+
+    # Visible in the browser's network panel; "app" is everything else,
+    # e.g. turning rows into dicts
+    app_time = elapsed - sum(timings.values())
+    response.headers['Server-Timing'] = ', '.join(
+        [f"{phase};dur={timings[phase] * 1000:.1f}" for phase in PHASES if phase in timings]
+        + [f"app;dur={max(app_time, 0.0) * 1000:.1f}", f"total;dur={elapsed * 1000:.1f}"])
+    response.headers['X-Request-ID'] = g.request_id
+
+    if elapsed >= SLOW_REQUEST_SECONDS:
+        logger.warning("Slow request", extra={"fields": {
+            "route": route, "status": response.status_code, "seconds": round(elapsed, 3),
+            "phases": {phase: round(seconds, 3) for phase, seconds in timings.items()},
+        }})
+    return response
+
+
+def metrics_response():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    configure_logging()
+    app.json = TimedJSONProvider(app)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
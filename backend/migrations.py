@@ -0,0 +1,483 @@
+from db import db_connection
+
+# Ordered schema migrations. Each entry is applied once, in its own
+# transaction, and recorded in schema_migrations. Never edit a migration that
+# has shipped; append a new one instead.
+MIGRATIONS = [
+    (1, "baseline tables", """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            phone VARCHAR(20),
+            password_hash VARCHAR(200) NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS crops (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(50) UNIQUE NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS markets (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            location VARCHAR(100) NOT NULL,
+            lat FLOAT,
+            lng FLOAT,
+            spoilage_risk VARCHAR(20)
+        );
+
+        CREATE TABLE IF NOT EXISTS sellers (
+            id SERIAL PRIMARY KEY,
+            market_id INTEGER REFERENCES markets(id),
+            name VARCHAR(100),
+            phone VARCHAR(20),
+            email VARCHAR(100),
+            address TEXT
+        );
+
+        -- Market Prices table (prices in INR/kg)
+        CREATE TABLE IF NOT EXISTS market_prices (
+            id SERIAL PRIMARY KEY,
+            market_id INTEGER REFERENCES markets(id),
+            crop_id INTEGER REFERENCES crops(id),
+            price_per_kg FLOAT NOT NULL,
+            date DATE NOT NULL,
+            is_predicted BOOLEAN DEFAULT FALSE,
+            UNIQUE(market_id, crop_id, date, is_predicted)
+        );
+
+        CREATE TABLE IF NOT EXISTS farm_data (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            crop_id INTEGER REFERENCES crops(id),
+            quantity_kg FLOAT,
+            harvest_date DATE,
+            location VARCHAR(200),
+            storage_details TEXT
+        );
+    """),
+    (2, "indexes for price and farm data access paths", """
+        -- /prices?crop=X[&market=Y] and the per-market summary
+        CREATE INDEX IF NOT EXISTS idx_market_prices_crop_market_date
+            ON market_prices (crop_id, market_id, date);
+        -- /prices?crop=X&is_predicted=... in date order
+        CREATE INDEX IF NOT EXISTS idx_market_prices_crop_predicted_date
+            ON market_prices (crop_id, is_predicted, date);
+
+        -- Case-insensitive name lookups (lower(name) = lower(%s))
+        CREATE INDEX IF NOT EXISTS idx_crops_lower_name ON crops (lower(name));
+        CREATE INDEX IF NOT EXISTS idx_markets_lower_name ON markets (lower(name));
+
+        CREATE INDEX IF NOT EXISTS idx_farm_data_user_id ON farm_data (user_id);
+    """),
+    (3, "price data versions for HTTP validators", """
+        -- One row per crop, bumped whenever any of its prices change, so a
+        -- request can be answered with 304 without touching market_prices
+        CREATE SEQUENCE IF NOT EXISTS price_version_seq;
+
+        CREATE TABLE IF NOT EXISTS price_versions (
+            crop_id INTEGER PRIMARY KEY REFERENCES crops(id),
+            version BIGINT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        INSERT INTO price_versions (crop_id, version)
+        SELECT crop_id, nextval('price_version_seq')
+        FROM (SELECT DISTINCT crop_id FROM market_prices WHERE crop_id IS NOT NULL) c
+        ON CONFLICT (crop_id) DO NOTHING;
+
+        CREATE OR REPLACE FUNCTION bump_price_versions() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO price_versions (crop_id, version, updated_at)
+            SELECT crop_id, nextval('price_version_seq'), now()
+            FROM (SELECT DISTINCT crop_id FROM changed_rows WHERE crop_id IS NOT NULL) c
+            ON CONFLICT (crop_id) DO UPDATE
+                SET version = EXCLUDED.version, updated_at = EXCLUDED.updated_at;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION bump_all_price_versions() RETURNS trigger AS $$
+        BEGIN
+            UPDATE price_versions SET version = nextval('price_version_seq'), updated_at = now();
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        -- Statement-level triggers: one bump per affected crop per statement,
+        -- not per row, so bulk loads stay cheap
+        DROP TRIGGER IF EXISTS market_prices_version_insert ON market_prices;
+        CREATE TRIGGER market_prices_version_insert
+            AFTER INSERT ON market_prices REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_price_versions();
+
+        DROP TRIGGER IF EXISTS market_prices_version_update ON market_prices;
+        CREATE TRIGGER market_prices_version_update
+            AFTER UPDATE ON market_prices REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_price_versions();
+
+        DROP TRIGGER IF EXISTS market_prices_version_delete ON market_prices;
+        CREATE TRIGGER market_prices_version_delete
+            AFTER DELETE ON market_prices REFERENCING OLD TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_price_versions();
+
+        DROP TRIGGER IF EXISTS market_prices_version_truncate ON market_prices;
+        CREATE TRIGGER market_prices_version_truncate
+            AFTER TRUNCATE ON market_prices
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_all_price_versions();
+    """),
+    (4, "change tracking for incremental forecasting", """
+        -- (market, crop) series whose actual history changed since they were
+        -- last forecast; change_seq lets the job clear only what it processed
+        CREATE SEQUENCE IF NOT EXISTS forecast_change_seq;
+
+        CREATE TABLE IF NOT EXISTS forecast_dirty (
+            market_id INTEGER NOT NULL,
+            crop_id INTEGER NOT NULL,
+            change_seq BIGINT NOT NULL,
+            PRIMARY KEY (market_id, crop_id)
+        );
+
+        INSERT INTO forecast_dirty (market_id, crop_id, change_seq)
+        SELECT market_id, crop_id, nextval('forecast_change_seq')
+        FROM (SELECT DISTINCT market_id, crop_id FROM market_prices
+              WHERE NOT is_predicted AND market_id IS NOT NULL AND crop_id IS NOT NULL) s
+        ON CONFLICT DO NOTHING;
+
+        CREATE OR REPLACE FUNCTION mark_forecast_dirty() RETURNS trigger AS $$
+        BEGIN
+            -- Forecast rows themselves never make a series dirty
+            INSERT INTO forecast_dirty (market_id, crop_id, change_seq)
+            SELECT market_id, crop_id, nextval('forecast_change_seq')
+            FROM (SELECT DISTINCT market_id, crop_id FROM changed_rows
+                  WHERE NOT is_predicted AND market_id IS NOT NULL AND crop_id IS NOT NULL) s
+            ON CONFLICT (market_id, crop_id) DO UPDATE SET change_seq = EXCLUDED.change_seq;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS market_prices_forecast_insert ON market_prices;
+        CREATE TRIGGER market_prices_forecast_insert
+            AFTER INSERT ON market_prices REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION mark_forecast_dirty();
+
+        DROP TRIGGER IF EXISTS market_prices_forecast_update ON market_prices;
+        CREATE TRIGGER market_prices_forecast_update
+            AFTER UPDATE ON market_prices REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION mark_forecast_dirty();
+
+        DROP TRIGGER IF EXISTS market_prices_forecast_delete ON market_prices;
+        CREATE TRIGGER market_prices_forecast_delete
+            AFTER DELETE ON market_prices REFERENCING OLD TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION mark_forecast_dirty();
+    """),
+    (5, "weekly and monthly price rollups", """
+        -- OHLC candles per (market, crop, is_predicted) and calendar week/month,
+        -- so long ranges are served from a few points per period
+        CREATE TABLE IF NOT EXISTS price_rollups (
+            resolution VARCHAR(5) NOT NULL CHECK (resolution IN ('week', 'month')),
+            crop_id INTEGER NOT NULL,
+            market_id INTEGER NOT NULL,
+            is_predicted BOOLEAN NOT NULL,
+            period_start DATE NOT NULL,
+            period_end DATE NOT NULL,  -- exclusive
+            open_price FLOAT NOT NULL,
+            high_price FLOAT NOT NULL,
+            low_price FLOAT NOT NULL,
+            close_price FLOAT NOT NULL,
+            avg_price FLOAT NOT NULL,
+            num_days INTEGER NOT NULL,
+            PRIMARY KEY (resolution, crop_id, market_id, is_predicted, period_start)
+        );
+        -- /prices?crop=X&resolution=... across all markets, in period order
+        CREATE INDEX IF NOT EXISTS idx_price_rollups_crop_period
+            ON price_rollups (resolution, crop_id, period_start);
+
+        -- Recompute the candles of every period touched by the statement. A
+        -- period holds at most 31 daily rows, so re-aggregating it from
+        -- market_prices is cheap and stays exact for updates and deletes.
+        CREATE OR REPLACE FUNCTION refresh_price_rollups() RETURNS trigger AS $$
+        BEGIN
+            CREATE TEMP TABLE IF NOT EXISTS rollup_keys (
+                resolution VARCHAR(5), market_id INTEGER, crop_id INTEGER,
+                is_predicted BOOLEAN, period_start DATE, period_end DATE
+            ) ON COMMIT DROP;
+            TRUNCATE rollup_keys;
+
+            INSERT INTO rollup_keys
+            SELECT DISTINCT r.resolution, c.market_id, c.crop_id, c.is_predicted,
+                   date_trunc(r.resolution, c.date)::date,
+                   (date_trunc(r.resolution, c.date) + ('1 ' || r.resolution)::interval)::date
+            FROM changed_rows c CROSS JOIN (VALUES ('week'), ('month')) AS r(resolution)
+            WHERE c.market_id IS NOT NULL AND c.crop_id IS NOT NULL AND c.is_predicted IS NOT NULL;
+
+            IF TG_OP = 'UPDATE' THEN
+                -- A row may have moved out of its old period
+                INSERT INTO rollup_keys
+                SELECT DISTINCT r.resolution, o.market_id, o.crop_id, o.is_predicted,
+                       date_trunc(r.resolution, o.date)::date,
+                       (date_trunc(r.resolution, o.date) + ('1 ' || r.resolution)::interval)::date
+                FROM old_rows o CROSS JOIN (VALUES ('week'), ('month')) AS r(resolution)
+                WHERE o.market_id IS NOT NULL AND o.crop_id IS NOT NULL AND o.is_predicted IS NOT NULL;
+            END IF;
+
+            IF TG_OP <> 'INSERT' THEN
+                DELETE FROM price_rollups p
+                USING rollup_keys k
+                WHERE p.resolution = k.resolution AND p.crop_id = k.crop_id AND p.market_id = k.market_id
+                  AND p.is_predicted = k.is_predicted AND p.period_start = k.period_start;
+            END IF;
+
+            INSERT INTO price_rollups (resolution, crop_id, market_id, is_predicted, period_start, period_end,
+                                       open_price, high_price, low_price, close_price, avg_price, num_days)
+            SELECT k.resolution, k.crop_id, k.market_id, k.is_predicted, k.period_start, k.period_end,
+                   (array_agg(mp.price_per_kg ORDER BY mp.date))[1],
+                   MAX(mp.price_per_kg), MIN(mp.price_per_kg),
+                   (array_agg(mp.price_per_kg ORDER BY mp.date DESC))[1],
+                   ROUND(AVG(mp.price_per_kg)::numeric, 2)::float8, COUNT(*)
+            FROM (SELECT DISTINCT * FROM rollup_keys) k
+            JOIN market_prices mp
+              ON mp.crop_id = k.crop_id AND mp.market_id = k.market_id AND mp.is_predicted = k.is_predicted
+             AND mp.date >= k.period_start AND mp.date < k.period_end
+            GROUP BY k.resolution, k.crop_id, k.market_id, k.is_predicted, k.period_start, k.period_end
+            ON CONFLICT (resolution, crop_id, market_id, is_predicted, period_start) DO UPDATE
+                SET open_price = EXCLUDED.open_price, high_price = EXCLUDED.high_price,
+                    low_price = EXCLUDED.low_price, close_price = EXCLUDED.close_price,
+                    avg_price = EXCLUDED.avg_price, num_days = EXCLUDED.num_days;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION clear_price_rollups() RETURNS trigger AS $$
+        BEGIN
+            TRUNCATE price_rollups;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS market_prices_rollup_insert ON market_prices;
+        CREATE TRIGGER market_prices_rollup_insert
+            AFTER INSERT ON market_prices REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION refresh_price_rollups();
+
+        DROP TRIGGER IF EXISTS market_prices_rollup_update ON market_prices;
+        CREATE TRIGGER market_prices_rollup_update
+            AFTER UPDATE ON market_prices REFERENCING OLD TABLE AS old_rows NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION refresh_price_rollups();
+
+        DROP TRIGGER IF EXISTS market_prices_rollup_delete ON market_prices;
+        CREATE TRIGGER market_prices_rollup_delete
+            AFTER DELETE ON market_prices REFERENCING OLD TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION refresh_price_rollups();
+
+        DROP TRIGGER IF EXISTS market_prices_rollup_truncate ON market_prices;
+        CREATE TRIGGER market_prices_rollup_truncate
+            AFTER TRUNCATE ON market_prices
+            FOR EACH STATEMENT EXECUTE FUNCTION clear_price_rollups();
+
+        -- Backfill from the existing daily rows
+        INSERT INTO price_rollups (resolution, crop_id, market_id, is_predicted, period_start, period_end,
+                                   open_price, high_price, low_price, close_price, avg_price, num_days)
+        SELECT r.resolution, mp.crop_id, mp.market_id, mp.is_predicted,
+               date_trunc(r.resolution, mp.date)::date,
+               (date_trunc(r.resolution, mp.date) + ('1 ' || r.resolution)::interval)::date,
+               (array_agg(mp.price_per_kg ORDER BY mp.date))[1],
+               MAX(mp.price_per_kg), MIN(mp.price_per_kg),
+               (array_agg(mp.price_per_kg ORDER BY mp.date DESC))[1],
+               ROUND(AVG(mp.price_per_kg)::numeric, 2)::float8, COUNT(*)
+        FROM market_prices mp CROSS JOIN (VALUES ('week'), ('month')) AS r(resolution)
+        WHERE mp.market_id IS NOT NULL AND mp.crop_id IS NOT NULL AND mp.is_predicted IS NOT NULL
+        GROUP BY 1, 2, 3, 4, 5, 6
+        ON CONFLICT DO NOTHING;
+    """),
+    (6, "assistant conversation memory", """
+        -- One row per (user, chat session); turns up to summarized_through are
+        -- folded into summary and no longer sent to the model verbatim
+        CREATE TABLE IF NOT EXISTS conversations (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            session_id VARCHAR(64) NOT NULL,
+            summary TEXT NOT NULL DEFAULT '',
+            summarized_through BIGINT NOT NULL DEFAULT 0,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            UNIQUE (user_id, session_id)
+        );
+
+        CREATE TABLE IF NOT EXISTS conversation_turns (
+            id BIGSERIAL PRIMARY KEY,
+            conversation_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+            role VARCHAR(10) NOT NULL,
+            content TEXT NOT NULL,
+            tokens INTEGER NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS idx_conversation_turns_conversation
+            ON conversation_turns (conversation_id, id);
+    """),
+    (7, "farm coordinates and precomputed profit recommendations", """
+        -- Optional GPS position of the lot; transport cost falls back to the
+        -- city named in location when these are missing
+        ALTER TABLE farm_data ADD COLUMN IF NOT EXISTS lat FLOAT;
+        ALTER TABLE farm_data ADD COLUMN IF NOT EXISTS lng FLOAT;
+
+        -- Best (market, sell date) per farm lot from the nightly profit.py
+        -- --batch run; market_id is NULL when no market had a usable price
+        CREATE TABLE IF NOT EXISTS profit_recommendations (
+            farm_data_id INTEGER PRIMARY KEY REFERENCES farm_data(id) ON DELETE CASCADE,
+            user_id INTEGER,
+            market_id INTEGER REFERENCES markets(id),
+            sell_date DATE,
+            price_per_kg FLOAT,
+            distance_km FLOAT,
+            gross FLOAT,
+            transport_cost FLOAT,
+            spoilage_cost FLOAT,
+            net FLOAT,
+            computed_on DATE NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_profit_recommendations_user ON profit_recommendations (user_id);
+    """),
+    (8, "price watchlists, change log and notifications", """
+        -- kind above/below: threshold in INR/kg on actual prices;
+        -- forecast_up/forecast_down: percent move forecast over the next week
+        CREATE TABLE IF NOT EXISTS price_watches (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            crop_id INTEGER NOT NULL REFERENCES crops(id),
+            market_id INTEGER REFERENCES markets(id),  -- NULL: any market
+            kind VARCHAR(13) NOT NULL
+                CHECK (kind IN ('above', 'below', 'forecast_up', 'forecast_down')),
+            threshold FLOAT NOT NULL CHECK (threshold > 0),
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS idx_price_watches_crop_market ON price_watches (crop_id, market_id);
+        CREATE INDEX IF NOT EXISTS idx_price_watches_user ON price_watches (user_id);
+
+        -- Price rows the alert engine has not looked at yet. Only crops someone
+        -- watches are logged, recent actuals by day and forecasts once per
+        -- rewritten series, so alerts.py never rescans market_prices.
+        CREATE TABLE IF NOT EXISTS price_changes (
+            id BIGSERIAL PRIMARY KEY,
+            market_id INTEGER NOT NULL,
+            crop_id INTEGER NOT NULL,
+            date DATE,  -- NULL for forecast rows
+            is_predicted BOOLEAN NOT NULL
+        );
+
+        CREATE OR REPLACE FUNCTION log_price_changes() RETURNS trigger AS $$
+        BEGIN
+            -- Backfilled history (older than a week) never alerts
+            INSERT INTO price_changes (market_id, crop_id, date, is_predicted)
+            SELECT DISTINCT c.market_id, c.crop_id, CASE WHEN c.is_predicted THEN NULL ELSE c.date END, c.is_predicted
+            FROM changed_rows c
+            WHERE c.market_id IS NOT NULL AND c.crop_id IS NOT NULL AND c.is_predicted IS NOT NULL
+              AND (c.is_predicted OR c.date >= current_date - 7)
+              AND c.crop_id IN (SELECT w.crop_id FROM price_watches w);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS market_prices_alert_insert ON market_prices;
+        CREATE TRIGGER market_prices_alert_insert
+            AFTER INSERT ON market_prices REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION log_price_changes();
+
+        DROP TRIGGER IF EXISTS market_prices_alert_update ON market_prices;
+        CREATE TRIGGER market_prices_alert_update
+            AFTER UPDATE ON market_prices REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION log_price_changes();
+
+        -- price_date is the price's day (above/below) or the week the forecast
+        -- alert is for, so re-running the engine never notifies twice
+        CREATE TABLE IF NOT EXISTS notifications (
+            id BIGSERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            watch_id INTEGER REFERENCES price_watches(id) ON DELETE SET NULL,
+            type VARCHAR(20) NOT NULL,
+            priority VARCHAR(10) NOT NULL,
+            title TEXT NOT NULL,
+            message TEXT NOT NULL,
+            crop_id INTEGER,
+            market_id INTEGER,
+            price_date DATE,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            read_at TIMESTAMPTZ,
+            UNIQUE (watch_id, market_id, price_date)
+        );
+        -- /notifications, newest first
+        CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications (user_id, id);
+    """),
+    (9, "indexes for keyset pagination of prices", """
+        -- /prices pages walk (date, id); without these every page sorts the whole match
+        CREATE INDEX IF NOT EXISTS idx_market_prices_date_id ON market_prices (date, id);
+        CREATE INDEX IF NOT EXISTS idx_market_prices_crop_date_id ON market_prices (crop_id, date, id);
+    """),
+]
+
+# Arbitrary constant so concurrent deploys serialize on the same advisory lock
+MIGRATION_LOCK_ID = 7460001
+
+
+def applied_versions(cur):
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def migrate(target=None):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(200) NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """)
+        conn.commit()
+
+        applied = []
+        for version, name, sql in MIGRATIONS:
+            if target is not None and version > target:
+                break
+            try:
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+                if version in applied_versions(cur):
+                    conn.rollback()
+                    continue
+                print(f"Applying migration {version}: {name}")
+                cur.execute(sql)
+                cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                conn.commit()
+                applied.append(version)
+            except Exception:
+                conn.rollback()
+                raise
+        cur.close()
+        return applied
+
+
+def status():
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass('schema_migrations')")
+        done = applied_versions(cur) if cur.fetchone()[0] else set()
+        cur.close()
+    return [(version, name, version in done) for version, name, _ in MIGRATIONS]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument('--target', type=int, default=None, help="Stop after this migration version")
+    parser.add_argument('--status', action='store_true', help="List migrations and whether they are applied")
+    args = parser.parse_args()
+
+    if args.status:
+        for version, name, done in status():
+            print(f"{version:>4}  {'applied' if done else 'pending':8}  {name}")
+    else:
+        applied = migrate(args.target)
+        print(f"Applied {len(applied)} migration(s)." if applied else "Database is up to date.")
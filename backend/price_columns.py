@@ -0,0 +1,124 @@
+"""Columnar MessagePack encoding of /prices results.
+
+Sent when the client asks for it with ``Accept: application/x-msgpack``;
+JSON stays the default. The body is one MessagePack map:
+
+    v, resolution, count
+    epoch         "2000-01-01"; dates are day offsets from it
+    crops, markets
+                  names, each listed once; the crop and market columns
+                  index into them
+    dtypes        column name -> NumPy dtype string, e.g. "<f4"
+    date, price, is_predicted, crop, market
+                  little-endian binary columns, one entry per row
+    open, high, low, close, days
+                  only for resolution=week|month
+
+A JavaScript client wraps each column in a typed array, e.g.
+``new Float32Array(bin.buffer, bin.byteOffset, count)``.
+
+Rows come from a binary COPY read straight into a NumPy structured array,
+so no per-row Python objects are built on the way out.
+"""
+import datetime
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # optional: without it /prices only speaks JSON
+    msgpack = None
+
+from refdata import refdata
+
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/msgpack', 'application/vnd.msgpack')
+PRICE_EPOCH = datetime.date(2000, 1, 1)
+
+# Select lists for build_price_query(columnar=True). Every column is
+# fixed-width and NOT NULL, so each binary COPY tuple has the same layout
+DAY_COLUMNS_SQL = """
+    SELECT mp.date - DATE '2000-01-01', mp.price_per_kg::float4, COALESCE(mp.is_predicted, FALSE),
+           COALESCE(mp.crop_id, 0), COALESCE(mp.market_id, 0), mp.id
+"""
+ROLLUP_COLUMNS_SQL = """
+    SELECT r.period_start - DATE '2000-01-01', r.avg_price::float4, r.is_predicted,
+           r.crop_id, r.market_id, r.market_id * 2 + r.is_predicted::int,
+           r.open_price::float4, r.high_price::float4, r.low_price::float4, r.close_price::float4, r.num_days
+"""
+
+_BASE_FIELDS = [
+    ('fields', '>i2'),
+    ('day_len', '>i4'), ('day', '>i4'),
+    ('price_len', '>i4'), ('price', '>f4'),
+    ('predicted_len', '>i4'), ('predicted', 'u1'),
+    ('crop_len', '>i4'), ('crop_id', '>i4'),
+    ('market_len', '>i4'), ('market_id', '>i4'),
+    ('key_len', '>i4'), ('key', '>i4'),
+]
+DAY_ROW_DTYPE = np.dtype(_BASE_FIELDS)
+ROLLUP_ROW_DTYPE = np.dtype(_BASE_FIELDS + [
+    ('open_len', '>i4'), ('open', '>f4'),
+    ('high_len', '>i4'), ('high', '>f4'),
+    ('low_len', '>i4'), ('low', '>f4'),
+    ('close_len', '>i4'), ('close', '>f4'),
+    ('days_len', '>i4'), ('days', '>i4'),
+])
+
+
+def available():
+    return msgpack is not None
+
+
+def wants_msgpack(accept_mimetypes):
+    """True if the Accept header prefers MessagePack over JSON."""
+    if msgpack is None:
+        return False
+    # JSON is listed first, so "*/*" and missing headers still get JSON
+    return accept_mimetypes.best_match(('application/json',) + MSGPACK_MIMETYPES) in MSGPACK_MIMETYPES
+
+
+def decode_rows(data, resolution):
+    """Binary COPY tuple data (see db.copy_out_binary) as a structured array."""
+    dtype = DAY_ROW_DTYPE if resolution == 'day' else ROLLUP_ROW_DTYPE
+    return np.frombuffer(data, dtype=dtype)
+
+
+def row_cursor(rows, i):
+    """(date, key) of row ``i``, as encode_price_cursor takes them."""
+    return PRICE_EPOCH + datetime.timedelta(days=int(rows['day'][i])), int(rows['key'][i])
+
+
+def _dictionary(ids, name):
+    # Names once per distinct id; the column holds small indexes into them
+    unique, index = np.unique(ids, return_inverse=True)
+    dtype = np.dtype('<u2') if len(unique) <= 0xFFFF else np.dtype('<u4')
+    return [name(int(i)) for i in unique], index.astype(dtype)
+
+
+def encode_price_columns(rows, resolution, crop_name=refdata.crop_name, market_name=refdata.market_name):
+    crops, crop_index = _dictionary(rows['crop_id'], crop_name)
+    markets, market_index = _dictionary(rows['market_id'], market_name)
+    columns = {
+        "date": rows['day'].astype('<i4'),
+        "price": rows['price'].astype('<f4'),
+        "is_predicted": rows['predicted'].astype('u1'),
+        "crop": crop_index,
+        "market": market_index,
+    }
+    if resolution != 'day':
+        for name in ('open', 'high', 'low', 'close'):
+            columns[name] = rows[name].astype('<f4')
+        columns["days"] = rows['days'].astype('u1')
+
+    body = {
+        "v": 1,
+        "resolution": resolution,
+        "count": len(rows),
+        "epoch": PRICE_EPOCH.isoformat(),
+        "crops": crops,
+        "markets": markets,
+        "dtypes": {name: column.dtype.str for name, column in columns.items()},
+    }
+    body.update((name, column.tobytes()) for name, column in columns.items())
+    return msgpack.packb(body, use_bin_type=True)
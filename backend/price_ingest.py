@@ -0,0 +1,391 @@
+import argparse
+import csv
+import datetime
+import json
+import math
+import sys
+import time
+
+import numpy as np
+
+from crop_resolver import get_crop_resolver
+from db import copy_binary, db_connection
+from farm_ingest import MAX_REPORTED_ERRORS, read_jsonl_records, text_stream
+from price_sim import PG_EPOCH
+from refdata import refdata
+
+FEED_FORMATS = ('csv', 'jsonl', 'json')
+
+# Rows encoded per COPY chunk; memory stays flat however long the file is
+FEED_BATCH_ROWS = 50000
+# Largest single JSON array element we will buffer while looking for its end
+MAX_JSON_ITEM = 1 << 20
+
+# Accepted column names per field: our own export (price_sim.write_csv) and
+# the Agmarknet daily feed, whose modal_price is INR per quintal
+FEED_COLUMNS = {
+    'market': ('market', 'market_name'),
+    'crop': ('crop', 'crop_name', 'commodity'),
+    'date': ('date', 'arrival_date'),
+    'is_predicted': ('is_predicted',),
+}
+PRICE_COLUMNS = (('price_per_kg', 1.0), ('modal_price', 0.01))
+
+BOOLEANS = {None: False, False: False, True: True,
+            '': False, 'f': False, 'false': False, '0': False, 'no': False,
+            't': True, 'true': True, '1': True, 'yes': True}
+
+# One staging row in PostgreSQL binary COPY layout; line keeps file order so
+# the last of several rows for the same key wins
+FEED_ROW_DTYPE = np.dtype([
+    ('fields', '>i2'),
+    ('line_len', '>i4'), ('line', '>i4'),
+    ('market_len', '>i4'), ('market_id', '>i4'),
+    ('crop_len', '>i4'), ('crop_id', '>i4'),
+    ('price_len', '>i4'), ('price', '>f8'),
+    ('date_len', '>i4'), ('date', '>i4'),
+    ('pred_len', '>i4'), ('is_predicted', 'u1'),
+])
+
+
+def _first(names, present):
+    return next((name for name in names if name in present), None)
+
+
+def _scalar(value):
+    # Nested JSON would be unhashable in the lookup memos; it fails validation as text
+    return json.dumps(value) if isinstance(value, (list, dict)) else value
+
+
+def feed_fields(record):
+    """(market, crop, date, price, scale, is_predicted) from a JSON record."""
+    price, scale = next(((record.get(name), s) for name, s in PRICE_COLUMNS if name in record), (None, 1.0))
+    return tuple(_scalar(record.get(_first(FEED_COLUMNS[field], record)))
+                 for field in ('market', 'crop', 'date')) + (
+        _scalar(price), scale, _scalar(record.get(_first(FEED_COLUMNS['is_predicted'], record))))
+
+
+def read_csv_feed(stream):
+    """Yield (line, fields, problem) for each CSV row; see feed_fields for the layout.
+
+    Columns are located once from the header, and rows are read with a plain
+    csv.reader, which is about twice as fast as DictReader on large files.
+    """
+    reader = csv.reader(text_stream(stream))
+    header = {name.strip().lower(): i for i, name in enumerate(next(reader, []))}
+    index = {field: header.get(_first(names, header)) for field, names in FEED_COLUMNS.items()}
+    price_column = next(((header[name], s) for name, s in PRICE_COLUMNS if name in header), None)
+    if None in (index['market'], index['crop'], index['date'], price_column):
+        raise ValueError("Price feed needs market, crop, date and price_per_kg (or modal_price) columns")
+    m, c, d = index['market'], index['crop'], index['date']
+    p, scale = price_column
+    f = index['is_predicted']
+    width = max(i for i in (m, c, d, p, f) if i is not None) + 1
+
+    def rows():
+        for values in reader:
+            if not values:
+                continue
+            if len(values) < width:
+                yield reader.line_num, None, "missing columns"
+                continue
+            yield reader.line_num, (values[m], values[c], values[d], values[p], scale,
+                                    values[f] if f is not None else None), None
+    return rows()
+
+
+def read_json_array_feed(stream, chunk_size=1 << 16):
+    """Yield (item number, fields, problem) for a top-level JSON array, decoding incrementally."""
+    text = text_stream(stream)
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = text.read(chunk_size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+    def peek():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer) or eof:
+                return buffer[pos] if pos < len(buffer) else ''
+            fill()
+
+    if peek() != '[':
+        raise ValueError("Expected a JSON array of price records")
+    pos += 1
+    if peek() == ']':
+        return
+    item = 0
+    while True:
+        item += 1
+        peek()
+        while True:
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+                break
+            except json.JSONDecodeError as e:
+                # Most likely the element is cut off at the end of the buffer
+                if eof or len(buffer) - pos > MAX_JSON_ITEM:
+                    raise ValueError(f"Invalid JSON in item {item}: {e.msg}")
+                fill()
+        if isinstance(record, dict):
+            yield item, feed_fields({str(k).lower(): v for k, v in record.items()}), None
+        else:
+            yield item, None, "expected a JSON object"
+        separator = peek()
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f"Expected ',' or ']' after item {item}")
+        pos += 1
+
+
+def read_jsonl_feed(stream):
+    for line, record, problem in read_jsonl_records(stream):
+        yield line, feed_fields(record) if problem is None else None, problem
+
+
+def read_price_feed(stream, fmt):
+    if fmt == 'csv':
+        return read_csv_feed(stream)
+    if fmt == 'json':
+        return read_json_array_feed(stream)
+    return read_jsonl_feed(stream)
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+class PriceFeedEncoder:
+    """Validates feed rows and encodes them as binary COPY chunks.
+
+    Market, crop and date strings repeat on almost every row of a daily feed,
+    so each distinct spelling is looked up or parsed once and memoized.
+    Crops must be a known name or alias: Agmarknet lists products next to
+    the crops they come from ("Mustard Oil", "Cotton Seed"), and guessing
+    would overwrite the crop's own series with the product's prices.
+    """
+
+    def __init__(self, resolver=None, find_market=refdata.market_id,
+                 max_errors=MAX_REPORTED_ERRORS, batch_rows=FEED_BATCH_ROWS):
+        self.resolver = resolver
+        self.find_market = find_market
+        self.max_errors = max_errors
+        self.batch_rows = batch_rows
+        self.market_ids = {}
+        self.crop_ids = {}
+        self.days = {}
+        self.received = 0
+        self.staged = 0
+        self.errors = []
+        self.error_count = 0
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": message})
+
+    # Memos are keyed by the raw field value, so the common case is one dict
+    # hit per field; normalizing only happens the first time a value is seen
+
+    def market_id(self, raw):
+        if raw not in self.market_ids:
+            name = _text(raw)
+            self.market_ids[raw] = self.find_market(name) if name else None
+        return self.market_ids[raw]
+
+    def crop_id(self, raw):
+        if raw not in self.crop_ids:
+            if self.resolver is None:
+                self.resolver = get_crop_resolver()
+            name = _text(raw)
+            self.crop_ids[raw] = self.resolver.lookup_id(name) if name else None
+        return self.crop_ids[raw]
+
+    def day(self, raw):
+        # Days since 2000-01-01, the binary COPY date representation
+        if raw not in self.days:
+            text = _text(raw)
+            try:
+                if '/' in text:
+                    # Agmarknet writes DD/MM/YYYY
+                    day, month, year = text.split('/')
+                    value = datetime.date(int(year), int(month), int(day))
+                else:
+                    value = datetime.date.fromisoformat(text)
+                self.days[raw] = (value - PG_EPOCH).days
+            except ValueError:
+                self.days[raw] = None
+        return self.days[raw]
+
+    def validate(self, fields):
+        """Return (market_id, crop_id, price_per_kg, day, is_predicted) or raise ValueError."""
+        market, crop, date, price, scale, predicted = fields
+        market_id = self.market_id(market)
+        if market_id is None:
+            raise ValueError(f"unknown market '{_text(market)}'")
+        crop_id = self.crop_id(crop)
+        if crop_id is None:
+            raise ValueError(f"unknown crop '{_text(crop)}'")
+        day = self.day(date)
+        if day is None:
+            raise ValueError(f"date must be YYYY-MM-DD or DD/MM/YYYY, got '{_text(date)}'")
+        try:
+            value = float(price) * scale
+        except (TypeError, ValueError):
+            raise ValueError(f"price must be a number, got '{price}'")
+        # Also false for NaN
+        if not 0 < value < math.inf:
+            raise ValueError("price must be a positive number")
+        flag = BOOLEANS.get(predicted)
+        if flag is None:
+            flag = BOOLEANS.get(_text(predicted).lower())
+            if flag is None:
+                raise ValueError(f"is_predicted must be true or false, got '{predicted}'")
+        return market_id, crop_id, value, day, flag
+
+    def encode(self, columns):
+        block = np.empty(len(columns[0]), dtype=FEED_ROW_DTYPE)
+        block['fields'] = 6
+        block['line_len'] = 4
+        block['market_len'] = 4
+        block['crop_len'] = 4
+        block['price_len'] = 8
+        block['date_len'] = 4
+        block['pred_len'] = 1
+        line, market_id, crop_id, price, day, is_predicted = columns
+        block['line'] = line
+        block['market_id'] = market_id
+        block['crop_id'] = crop_id
+        block['price'] = np.round(np.array(price, dtype=np.float64), 2)
+        block['date'] = day
+        block['is_predicted'] = is_predicted
+        return block.tobytes()
+
+    def chunks(self, records):
+        """Binary COPY chunks for the valid rows; invalid ones are recorded and skipped."""
+        columns = tuple([] for _ in range(6))
+        line_append, market_append, crop_append, price_append, day_append, flag_append = (
+            column.append for column in columns)
+        validate = self.validate
+        for line, fields, problem in records:
+            self.received += 1
+            if problem is None:
+                try:
+                    market_id, crop_id, price, day, flag = validate(fields)
+                except ValueError as e:
+                    problem = str(e)
+            if problem is not None:
+                self.error(line, problem)
+                continue
+            line_append(line)
+            market_append(market_id)
+            crop_append(crop_id)
+            price_append(price)
+            day_append(day)
+            flag_append(flag)
+            if len(columns[0]) >= self.batch_rows:
+                self.staged += len(columns[0])
+                yield self.encode(columns)
+                for column in columns:
+                    column.clear()
+        if columns[0]:
+            self.staged += len(columns[0])
+            yield self.encode(columns)
+
+
+def load_price_feed(conn, records, resolver=None):
+    """Upsert a daily price feed into market_prices without touching other history.
+
+    Rows stream through binary COPY into a temporary staging table and are
+    merged in one INSERT ... ON CONFLICT on (market_id, crop_id, date,
+    is_predicted). Re-running the same feed changes nothing: prices that are
+    already current are left alone, so their rows, versions and rollups are
+    not rewritten either. The caller commits.
+    """
+    started = time.perf_counter()
+    encoder = PriceFeedEncoder(resolver)
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TEMP TABLE market_prices_feed (
+            line INTEGER NOT NULL,
+            market_id INTEGER NOT NULL,
+            crop_id INTEGER NOT NULL,
+            price_per_kg FLOAT NOT NULL,
+            date DATE NOT NULL,
+            is_predicted BOOLEAN NOT NULL
+        ) ON COMMIT DROP
+    """)
+    copy_binary(cur, 'market_prices_feed',
+                ('line', 'market_id', 'crop_id', 'price_per_kg', 'date', 'is_predicted'),
+                encoder.chunks(records))
+
+    # ON CONFLICT may touch a row only once per statement, so repeated keys
+    # in the feed are collapsed first (last line wins)
+    cur.execute("""
+        WITH upserted AS (
+            INSERT INTO market_prices (market_id, crop_id, price_per_kg, date, is_predicted)
+            SELECT DISTINCT ON (market_id, crop_id, date, is_predicted)
+                   market_id, crop_id, price_per_kg, date, is_predicted
+            FROM market_prices_feed
+            ORDER BY market_id, crop_id, date, is_predicted, line DESC
+            ON CONFLICT (market_id, crop_id, date, is_predicted)
+            DO UPDATE SET price_per_kg = EXCLUDED.price_per_kg
+            WHERE market_prices.price_per_kg IS DISTINCT FROM EXCLUDED.price_per_kg
+            RETURNING xmax = 0 AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+    """)
+    inserted, updated = cur.fetchone()
+    cur.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "received": encoder.received,
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": encoder.staged - inserted - updated,
+        "error_count": encoder.error_count,
+        "errors": encoder.errors,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(encoder.received / elapsed) if elapsed > 0 else None,
+    }
+
+
+def ingest_file(path, fmt=None):
+    if fmt is None:
+        fmt = 'csv' if path.endswith('.csv') else 'json' if path.endswith('.json') else 'jsonl'
+    stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    try:
+        with db_connection() as conn:
+            try:
+                result = load_price_feed(conn, read_price_feed(stream, fmt))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a daily market price feed into market_prices")
+    parser.add_argument('path', help="Feed file (CSV, JSON lines or a JSON array), or - for stdin")
+    parser.add_argument('--format', choices=FEED_FORMATS, help="Default: from the file extension (.csv, .json, else JSON lines)")
+    parser.add_argument('--show-errors', type=int, default=20, help="Rejected rows to print")
+    args = parser.parse_args()
+
+    result = ingest_file(args.path, args.format)
+    print(f"Read {result['received']} rows in {result['seconds']:.2f}s ({result['rows_per_second']} rows/s): "
+          f"{result['inserted']} inserted, {result['updated']} updated, {result['unchanged']} unchanged, "
+          f"{result['error_count']} rejected")
+    for error in result['errors'][:args.show_errors]:
+        print(f"  line {error['line']}: {error['error']}")
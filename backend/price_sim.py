@@ -0,0 +1,197 @@
+import argparse
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from db import copy_binary
+
+# Base prices (per kg) and volatility
+# Volatility: higher number = more fluctuation (e.g., vegetables > grains)
+BASE_PRICE_MAP = {
+    'Wheat': (32, 0.05), 'Rice (Basmati)': (85, 0.04), 'Rice (Common)': (45, 0.03),
+    'Tomato': (40, 0.25), 'Onion': (35, 0.20), 'Potato': (25, 0.15),
+    'Apple': (120, 0.10), 'Banana': (40, 0.08),
+    'Cotton': (65, 0.06), 'Sugarcane': (4, 0.02),
+    'Green Chilli': (60, 0.30), 'Ginger': (80, 0.15),
+    'Turmeric': (110, 0.05)
+}
+DEFAULT_BASE = (50, 0.10)
+
+PG_EPOCH = date(2000, 1, 1)
+
+# One market_prices row in PostgreSQL binary COPY layout:
+# field count, then (length, value) for market_id, crop_id, price_per_kg, date, is_predicted
+COPY_ROW_DTYPE = np.dtype([
+    ('fields', '>i2'),
+    ('market_len', '>i4'), ('market_id', '>i4'),
+    ('crop_len', '>i4'), ('crop_id', '>i4'),
+    ('price_len', '>i4'), ('price', '>f8'),
+    ('date_len', '>i4'), ('date', '>i4'),
+    ('pred_len', '>i4'), ('is_predicted', 'u1'),
+])
+
+
+def simulate_prices(crop_names, num_markets, days, seed=None):
+    """Simulate daily prices for every (market, crop) pair at once.
+
+    Returns a float32 array of shape (markets, crops, days). Each series is a
+    random walk with a directional drift that reverses every 7-21 days and is
+    clamped to 0.4x-2.5x of the crop's base price.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (num_markets, len(crop_names))
+
+    params = np.array([BASE_PRICE_MAP.get(c, DEFAULT_BASE) for c in crop_names], dtype=np.float64).reshape(-1, 2)
+    base = np.broadcast_to(params[:, 0], shape)
+    volatility = np.broadcast_to(params[:, 1], shape)
+    noise_scale = base * volatility * 0.1
+    drift_step = base * volatility * 0.05
+    floor = base * 0.4
+    ceiling = base * 2.5
+
+    # Add regional variation (random +/- 15% per market)
+    current = base * rng.uniform(0.85, 1.15, shape)
+    direction = rng.choice(np.array([-1.0, 1.0]), shape)
+    duration = rng.integers(5, 16, shape)
+    counter = np.zeros(shape, dtype=np.int64)
+
+    # Fill day-major (contiguous writes), then lay the series out per market
+    by_day = np.empty((days,) + shape, dtype=np.float32)
+    noise = np.empty(shape, dtype=np.float64)
+    for day in range(days):
+        # Trend logic: periodic reversals to simulate seasonal/supply-demand cycles
+        reverse = counter >= duration
+        flips = np.count_nonzero(reverse)
+        if flips:
+            direction[reverse] *= -1
+            duration[reverse] = rng.integers(7, 22, flips)
+            counter[reverse] = 0
+        counter += 1
+
+        # Daily random walk + Trend
+        rng.standard_normal(out=noise)
+        noise *= noise_scale
+        current += noise
+        current += direction * drift_step
+
+        # Soft boundaries, forcing a correction in the other direction
+        low = current < floor
+        high = current > ceiling
+        if low.any():
+            current[low] = floor[low]
+            direction[low] = 1.0
+        if high.any():
+            current[high] = ceiling[high]
+            direction[high] = -1.0
+
+        by_day[day] = current
+    return np.ascontiguousarray(by_day.transpose(1, 2, 0))
+
+
+def price_dates(start_date, days):
+    return [start_date + timedelta(days=i) for i in range(days)]
+
+
+def encode_copy_rows(prices, market_ids, crop_ids, start_date, today):
+    """Yield binary COPY chunks for market_prices, one market at a time."""
+    num_markets, num_crops, days = prices.shape
+    day_numbers = (start_date - PG_EPOCH).days + np.arange(days, dtype=np.int32)
+    is_predicted = day_numbers > (today - PG_EPOCH).days
+
+    block = np.empty((num_crops, days), dtype=COPY_ROW_DTYPE)
+    block['fields'] = 5
+    block['market_len'] = 4
+    block['crop_len'] = 4
+    block['price_len'] = 8
+    block['date_len'] = 4
+    block['pred_len'] = 1
+    block['crop_id'] = np.asarray(crop_ids, dtype=np.int32)[:, None]
+    block['date'] = day_numbers[None, :]
+    block['is_predicted'] = is_predicted[None, :]
+
+    for m in range(num_markets):
+        block['market_id'] = market_ids[m]
+        block['price'] = np.round(prices[m].astype(np.float64), 2)
+        yield block.tobytes()
+
+
+def write_postgres(cur, prices, market_ids, crop_ids, start_date, today):
+    """Upsert simulated prices into market_prices; returns rows written.
+
+    ``market_ids``/``crop_ids`` are aligned with the first two axes of ``prices``.
+    Rows go through a temp staging table via binary COPY and are merged in
+    one statement.
+    """
+    cur.execute("""
+        CREATE TEMP TABLE market_prices_staging (
+            market_id INTEGER,
+            crop_id INTEGER,
+            price_per_kg FLOAT,
+            date DATE,
+            is_predicted BOOLEAN
+        ) ON COMMIT DROP;
+    """)
+    copied = copy_binary(cur, 'market_prices_staging',
+                         ('market_id', 'crop_id', 'price_per_kg', 'date', 'is_predicted'),
+                         encode_copy_rows(prices, market_ids, crop_ids, start_date, today))
+    cur.execute("""
+        INSERT INTO market_prices (market_id, crop_id, price_per_kg, date, is_predicted)
+        SELECT market_id, crop_id, price_per_kg, date, is_predicted FROM market_prices_staging
+        ON CONFLICT (market_id, crop_id, date, is_predicted)
+        DO UPDATE SET price_per_kg = EXCLUDED.price_per_kg;
+    """)
+    cur.execute("DROP TABLE market_prices_staging")
+    return copied
+
+
+def write_npz(path, prices, market_names, crop_names, start_date):
+    np.savez(path, prices=prices, markets=np.array(market_names),
+             crops=np.array(crop_names), start_date=np.array(start_date.isoformat()))
+
+
+def write_csv(path, prices, market_names, crop_names, start_date):
+    # Actual prices only; is_predicted rows come from forecast.py
+    num_markets, num_crops, days = prices.shape
+    dates = [d.isoformat() for d in price_dates(start_date, days)]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("market,crop,date,price_per_kg,is_predicted\n")
+        for m in range(num_markets):
+            for c in range(num_crops):
+                series = np.round(prices[m, c].astype(np.float64), 2).tolist()
+                prefix = f"{market_names[m]},{crop_names[c]},"
+                f.writelines(f"{prefix}{dates[i]},{series[i]},false\n" for i in range(days))
+
+
+if __name__ == "__main__":
+    from seed_db import build_crops, build_markets
+    import random
+
+    parser = argparse.ArgumentParser(description="Generate synthetic market price series")
+    parser.add_argument('--markets', type=int, default=None, help="Number of markets (default: the built-in mandi list)")
+    parser.add_argument('--crops', type=int, default=None, help="Number of crops (default: the built-in crop list)")
+    parser.add_argument('--days', type=int, default=180, help="Days of price history to generate")
+    parser.add_argument('--seed', type=int, default=None, help="Random seed for reproducible datasets")
+    parser.add_argument('--out', help="Write to a .npz or .csv file instead of Postgres")
+    args = parser.parse_args()
+
+    if not args.out:
+        from seed_db import seed_db
+        seed_db(num_markets=args.markets, num_crops=args.crops, days=args.days, seed=args.seed)
+    else:
+        crops = build_crops(args.crops)
+        markets = [m['name'] for m in build_markets(args.markets, random.Random(args.seed))]
+        today = date.today()
+        start_date = today - timedelta(days=args.days)
+
+        started = time.perf_counter()
+        # History up to and including today, as seed_db writes it
+        prices = simulate_prices(crops, len(markets), args.days + 1, seed=args.seed)
+        print(f"Simulated {prices.size} prices in {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        if args.out.endswith('.csv'):
+            write_csv(args.out, prices, markets, crops, start_date)
+        else:
+            write_npz(args.out, prices, markets, crops, start_date)
+        print(f"Wrote {args.out} in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,344 @@
+import argparse
+import datetime
+import time
+
+import numpy as np
+
+from db import copy_rows, db_connection
+from forecast import FORECAST_HORIZON
+from geo_index import chord_to_km, unit_vectors
+from refdata import refdata
+
+# Hired truck at a flat rate per km, the same figure the market explorer
+# shows; one truck per TRUCK_CAPACITY_KG of produce
+TRANSPORT_COST_PER_KM = 25.0
+TRUCK_CAPACITY_KG = 10000.0
+TRUCK_KM_PER_DAY = 400.0
+
+# Share of a lot's value lost per day between harvest and sale (including
+# days on the road), by the destination market's spoilage risk
+SPOILAGE_RATE_PER_DAY = {'Low': 0.005, 'Medium': 0.015, 'High': 0.03}
+DEFAULT_SPOILAGE_RATE = SPOILAGE_RATE_PER_DAY['Medium']
+
+# A "current" price older than this is not offered as a same-day sale
+PRICE_STALE_DAYS = 30
+
+# Cap on lots x markets x days per evaluation block (~16 MB per float array)
+BLOCK_ELEMENTS = 2_000_000
+
+RECOMMENDATION_COLUMNS = ('farm_data_id', 'user_id', 'market_id', 'sell_date', 'price_per_kg', 'distance_km',
+                          'gross', 'transport_cost', 'spoilage_cost', 'net', 'computed_on')
+
+
+# -- model --------------------------------------------------------------------
+
+def evaluate_lots(quantity, ready_day, crop_index, farm_xyz, cube, market_xyz, spoilage_rate):
+    """Best (market, day) for each farm lot, evaluated as one array per quantity.
+
+    quantity, ready_day and crop_index are (lots,): kg, first day the lot can
+    be sold (index into the cube's day axis) and row in ``cube``. farm_xyz is
+    (lots, 3) unit vectors, NaN where the farm's position is unknown; its
+    transport cost is then left out. cube is (crops, markets, days) price per
+    kg with NaN for no price; market_xyz is (markets, 3), NaN if unknown.
+
+    net = price x quantity - spoilage - transport, where spoilage grows with
+    the market's rate and the days held plus days on the road. Returns a dict
+    of (lots,) arrays; net is -inf where no market/day was possible.
+    """
+    num_lots = len(quantity)
+    _, num_markets, num_days = cube.shape
+    lots = np.arange(num_lots)
+
+    chord = np.sqrt(((farm_xyz[:, None, :] - market_xyz[None, :, :]) ** 2).sum(axis=2))
+    distance = chord_to_km(chord)                                   # (lots, markets)
+    farm_known = ~np.isnan(farm_xyz[:, 0])
+    # Unknown farm: price and spoilage only. Unknown market: unusable for a known farm.
+    reachable = ~np.isnan(distance) | ~farm_known[:, None]
+    road_km = np.nan_to_num(distance)
+    trucks = np.ceil(quantity / TRUCK_CAPACITY_KG)
+    transport = TRANSPORT_COST_PER_KM * road_km * trucks[:, None]   # (lots, markets)
+
+    held = np.arange(num_days)[None, :] - ready_day[:, None]         # (lots, days)
+    exposure = np.maximum(held, 0)[:, None, :] + (road_km / TRUCK_KM_PER_DAY)[:, :, None]
+    exposure *= spoilage_rate[None, :, None]
+    np.minimum(exposure, 1.0, out=exposure)                          # spoiled share
+
+    gross = cube[crop_index] * quantity[:, None, None]               # (lots, markets, days)
+    net = gross * (1.0 - exposure)
+    net -= transport[:, :, None]
+    valid = ~np.isnan(gross) & reachable[:, :, None] & (held >= 0)[:, None, :]
+    net[~valid] = -np.inf
+
+    best = net.reshape(num_lots, -1).argmax(axis=1)
+    market, day = np.divmod(best, num_days)
+    best_gross = gross[lots, market, day]
+    best_net = net[lots, market, day]
+    return {
+        "market": market,
+        "day": day,
+        "net": best_net,
+        "gross": best_gross,
+        "transport": transport[lots, market],
+        "spoilage": best_gross * exposure[lots, market, day],
+        "distance": np.where(farm_known, distance[lots, market], np.nan),
+    }
+
+
+def lots_per_block(num_markets, num_days):
+    return max(1, BLOCK_ELEMENTS // max(1, num_markets * num_days))
+
+
+# -- data ---------------------------------------------------------------------
+
+class MarketArrays:
+    """Market ids, positions and spoilage rates aligned for evaluate_lots."""
+
+    def __init__(self, rows):
+        # rows: refdata.markets() - (id, name, location, lat, lng, spoilage_risk)
+        self.ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.names = [r[1] for r in rows]
+        lat = np.array([np.nan if r[3] is None else r[3] for r in rows], dtype=np.float64)
+        lng = np.array([np.nan if r[4] is None else r[4] for r in rows], dtype=np.float64)
+        self.xyz = unit_vectors(lat, lng).reshape(-1, 3)
+        self.spoilage_rate = np.array([SPOILAGE_RATE_PER_DAY.get(r[5], DEFAULT_SPOILAGE_RATE) for r in rows])
+        self.index = {market_id: i for i, market_id in enumerate(self.ids.tolist())}
+
+        # Mean market position per city, for farms that only give a place name
+        cities = {}
+        for r in rows:
+            if r[2] and r[3] is not None and r[4] is not None:
+                cities.setdefault(r[2].strip().lower(), []).append((r[3], r[4]))
+        self.cities = {city: tuple(np.mean(points, axis=0)) for city, points in cities.items()}
+
+    def farm_position(self, location, lat, lng):
+        if lat is not None and lng is not None:
+            return lat, lng
+        text = (location or '').lower()
+        for city, position in self.cities.items():
+            if city in text:
+                return position
+        return None
+
+
+def load_price_cube(cur, crop_ids, markets, today, horizon=FORECAST_HORIZON):
+    """(crops, markets, horizon + 1) prices per kg; day 0 is today.
+
+    Day 0 is each market's latest actual price (within PRICE_STALE_DAYS);
+    later days are the forecast rows written by forecast.py.
+    """
+    cube = np.full((len(crop_ids), len(markets.ids), horizon + 1), np.nan)
+    if not crop_ids:
+        return cube
+    crop_index = {crop_id: i for i, crop_id in enumerate(crop_ids)}
+
+    cur.execute("""
+        SELECT DISTINCT ON (crop_id, market_id) crop_id, market_id, price_per_kg
+        FROM market_prices
+        WHERE crop_id = ANY(%s) AND NOT is_predicted AND date <= %s AND date > %s
+        ORDER BY crop_id, market_id, date DESC
+    """, (list(crop_ids), today, today - datetime.timedelta(days=PRICE_STALE_DAYS)))
+    for crop_id, market_id, price in cur.fetchall():
+        m = markets.index.get(market_id)
+        if m is not None:
+            cube[crop_index[crop_id], m, 0] = price
+
+    cur.execute("""
+        SELECT crop_id, market_id, date - %s, price_per_kg
+        FROM market_prices
+        WHERE crop_id = ANY(%s) AND is_predicted AND date > %s AND date <= %s
+    """, (today, list(crop_ids), today, today + datetime.timedelta(days=horizon)))
+    for crop_id, market_id, day, price in cur.fetchall():
+        m = markets.index.get(market_id)
+        if m is not None:
+            cube[crop_index[crop_id], m, day] = price
+    return cube
+
+
+LOT_QUERY = """
+    SELECT f.id, f.user_id, f.crop_id, f.quantity_kg, f.harvest_date, f.location, f.lat, f.lng
+    FROM farm_data f
+    WHERE f.crop_id IS NOT NULL AND f.quantity_kg > 0
+"""
+
+
+def recommend(lots, markets, cube, crop_index, today):
+    """Evaluate ``lots`` (LOT_QUERY rows) block by block.
+
+    Yields (lot row, result dict or None) in input order; None means no
+    market had a usable price on a day the lot could be sold.
+    """
+    num_days = cube.shape[2]
+    step = lots_per_block(len(markets.ids), num_days)
+    for start in range(0, len(lots), step):
+        block = lots[start:start + step]
+        positions = [markets.farm_position(lot[5], lot[6], lot[7]) for lot in block]
+        farm_lat = np.array([p[0] if p else np.nan for p in positions])
+        farm_lng = np.array([p[1] if p else np.nan for p in positions])
+        # A lot harvested in the past is ready today
+        ready = np.array([max((lot[4] - today).days, 0) if lot[4] else 0 for lot in block])
+        result = evaluate_lots(
+            np.array([lot[3] for lot in block], dtype=np.float64),
+            ready,
+            np.array([crop_index[lot[2]] for lot in block]),
+            unit_vectors(farm_lat, farm_lng).reshape(-1, 3),
+            cube, markets.xyz, markets.spoilage_rate,
+        )
+        for i, lot in enumerate(block):
+            if not np.isfinite(result["net"][i]):
+                yield lot, None
+                continue
+            m, day = int(result["market"][i]), int(result["day"][i])
+            distance = float(result["distance"][i])
+            yield lot, {
+                "market_id": int(markets.ids[m]),
+                "market": markets.names[m],
+                "sell_date": today + datetime.timedelta(days=day),
+                "price_per_kg": round(float(cube[crop_index[lot[2]], m, day]), 2),
+                "distance_km": None if np.isnan(distance) else round(distance, 1),
+                "gross": round(float(result["gross"][i]), 2),
+                "transport_cost": round(float(result["transport"][i]), 2),
+                "spoilage_cost": round(float(result["spoilage"][i]), 2),
+                "net": round(float(result["net"][i]), 2),
+            }
+
+
+def _context(cur, lots, today, horizon):
+    markets = MarketArrays(refdata.markets())
+    crop_ids = sorted({lot[2] for lot in lots})
+    cube = load_price_cube(cur, crop_ids, markets, today, horizon)
+    return markets, cube, {crop_id: i for i, crop_id in enumerate(crop_ids)}
+
+
+# -- entry points -------------------------------------------------------------
+
+def format_recommendation(lot, rec):
+    item = {
+        "farm_data_id": lot[0],
+        "crop": refdata.crop_name(lot[2]),
+        "quantity_kg": lot[3],
+        "harvest_date": lot[4].isoformat() if lot[4] else None,
+        "location": lot[5],
+        "recommendation": None,
+    }
+    if rec is not None:
+        item["recommendation"] = dict(rec, sell_date=rec["sell_date"].isoformat())
+    return item
+
+
+def summarize(items):
+    recs = [item["recommendation"] for item in items if item["recommendation"]]
+    totals = {key: round(sum(r[key] for r in recs), 2)
+              for key in ("gross", "transport_cost", "spoilage_cost", "net")}
+    by_market = {}
+    for r in recs:
+        by_market[r["market"]] = round(by_market.get(r["market"], 0.0) + r["net"], 2)
+    totals["by_market"] = [{"market": name, "net": net}
+                           for name, net in sorted(by_market.items(), key=lambda kv: -kv[1])]
+    return totals
+
+
+def user_recommendations(user_id, today=None, horizon=FORECAST_HORIZON):
+    """Recommendations for one user's lots: tonight's batch if it covers them all, else computed now."""
+    today = today or datetime.date.today()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(LOT_QUERY + " AND f.user_id = %s ORDER BY f.id", (user_id,))
+        lots = cur.fetchall()
+        cur.execute("""
+            SELECT r.farm_data_id, r.market_id, r.sell_date, r.price_per_kg, r.distance_km,
+                   r.gross, r.transport_cost, r.spoilage_cost, r.net
+            FROM profit_recommendations r
+            WHERE r.user_id = %s AND r.computed_on = %s
+        """, (user_id, today))
+        stored = {row[0]: row for row in cur.fetchall()}
+
+        if lots and all(lot[0] in stored for lot in lots):
+            source = "batch"
+            pairs = []
+            for lot in lots:
+                row = stored[lot[0]]
+                rec = None
+                if row[1] is not None:
+                    rec = dict(zip(("market_id", "sell_date", "price_per_kg", "distance_km",
+                                    "gross", "transport_cost", "spoilage_cost", "net"), row[1:]))
+                    rec["market"] = refdata.market_name(row[1])
+                pairs.append((lot, rec))
+        else:
+            source = "live"
+            markets, cube, crop_index = _context(cur, lots, today, horizon)
+            pairs = list(recommend(lots, markets, cube, crop_index, today))
+        conn.rollback()
+        cur.close()
+
+    items = [format_recommendation(lot, rec) for lot, rec in pairs]
+    return {"user_id": user_id, "computed_on": today.isoformat(), "source": source,
+            "lots": items, "totals": summarize(items)}
+
+
+def run_batch(today=None, horizon=FORECAST_HORIZON, chunk=20000):
+    """Recompute the best market and day for every farm lot and store them.
+
+    Lots are read in id order chunk by chunk. The old rows are replaced in
+    the same transaction, so readers see either last night's set or
+    tonight's, never a mix. Returns the number of lots evaluated.
+    """
+    today = today or datetime.date.today()
+    started = time.perf_counter()
+    with db_connection() as conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT DISTINCT crop_id FROM farm_data WHERE crop_id IS NOT NULL")
+            crop_ids = sorted(row[0] for row in cur.fetchall())
+            markets = MarketArrays(refdata.markets())
+            cube = load_price_cube(cur, crop_ids, markets, today, horizon)
+            crop_index = {crop_id: i for i, crop_id in enumerate(crop_ids)}
+            loaded = time.perf_counter() - started
+
+            cur.execute("DELETE FROM profit_recommendations")
+            total, last_id = 0, 0
+            while True:
+                cur.execute(LOT_QUERY + " AND f.id > %s ORDER BY f.id LIMIT %s", (last_id, chunk))
+                lots = cur.fetchall()
+                if not lots:
+                    break
+                rows = []
+                for lot, rec in recommend(lots, markets, cube, crop_index, today):
+                    if rec is None:
+                        rows.append((lot[0], lot[1]) + (None,) * 8 + (today,))
+                    else:
+                        rows.append((lot[0], lot[1], rec["market_id"], rec["sell_date"], rec["price_per_kg"],
+                                     rec["distance_km"], rec["gross"], rec["transport_cost"],
+                                     rec["spoilage_cost"], rec["net"], today))
+                copy_rows(cur, 'profit_recommendations', RECOMMENDATION_COLUMNS, rows)
+                total += len(lots)
+                last_id = lots[-1][0]
+            conn.commit()
+            cur.close()
+        except Exception:
+            conn.rollback()
+            raise
+    elapsed = time.perf_counter() - started
+    print(f"Recommended {total} farm lots in {elapsed:.2f}s (prices loaded in {loaded:.2f}s, "
+          f"{total / max(elapsed - loaded, 1e-9):.0f} lots/s).")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Best market and sell date for farm lots")
+    parser.add_argument('--batch', action='store_true', help="Precompute recommendations for every user")
+    parser.add_argument('--user', type=int, help="Print recommendations for one user")
+    parser.add_argument('--horizon', type=int, default=FORECAST_HORIZON, help="Days ahead to consider selling")
+    args = parser.parse_args()
+
+    if args.batch:
+        run_batch(horizon=args.horizon)
+    elif args.user is not None:
+        result = user_recommendations(args.user, horizon=args.horizon)
+        for item in result["lots"]:
+            rec = item["recommendation"]
+            where = (f"{rec['market']} on {rec['sell_date']}: net {rec['net']:,.0f}"
+                     if rec else "no market with a usable price")
+            print(f"#{item['farm_data_id']} {item['crop']} {item['quantity_kg']:g} kg -> {where}")
+        print(f"Total net: {result['totals']['net']:,.0f}")
+    else:
+        parser.error("pass --batch or --user")
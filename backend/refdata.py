@@ -0,0 +1,203 @@
+import hashlib
+import os
+import threading
+import time
+
+from cache import TTLCache
+from db import db_connection, get_db_connection
+
+# Other processes (seed scripts, other workers) announce changes on this channel
+REFDATA_CHANNEL = 'refdata_changed'
+
+
+def table_digest(rows):
+    # Content hash, so every worker derives the same HTTP validator for the same data
+    return hashlib.sha1(repr(rows).encode('utf-8')).hexdigest()[:20]
+
+
+class CropTable:
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda r: r[1])  # (id, name)
+        self.by_id = {r[0]: r[1] for r in rows}
+        self.by_lower_name = {r[1].lower(): r[0] for r in rows}
+        self.digest = table_digest(self.rows)
+
+
+class MarketTable:
+    def __init__(self, rows):
+        self.rows = rows  # (id, name, location, lat, lng, spoilage_risk)
+        self.by_id = {r[0]: r for r in rows}
+        self.by_lower_name = {}
+        for r in rows:
+            # markets.name isn't unique; keep the oldest row like the seeders do
+            self.by_lower_name.setdefault(r[1].lower(), r[0])
+        self.digest = table_digest(rows)
+
+
+class ReferenceData:
+    """Process-wide cache of the crops and markets tables.
+
+    Entries expire after ``ttl`` seconds, tables larger than ``max_rows`` are
+    never cached, and a LISTEN connection picks up NOTIFYs from other
+    processes so changes show up within ``poll_interval`` seconds rather than
+    at expiry.
+    """
+
+    def __init__(self, ttl=300.0, max_rows=100000, listen=True, poll_interval=1.0,
+                 connect=get_db_connection, clock=time.monotonic):
+        self.max_rows = max_rows
+        self.poll_interval = poll_interval
+        self._cache = TTLCache(max_entries=8, ttl=ttl, clock=clock)
+        self._load_lock = threading.Lock()
+        self._listen = listen
+        self._connect = connect
+        self._clock = clock
+        self._listen_lock = threading.Lock()
+        self._listen_conn = None
+        self._listen_pid = None
+        self._listen_retry_at = 0.0
+        self._next_poll_at = 0.0
+        self.version = 0
+        self.loads = 0
+        self.invalidations = 0
+
+    # -- change notifications ---------------------------------------------
+
+    def _poll_notifications(self):
+        if not self._listen:
+            return
+        # A /prices page resolves names per row; one poll() syscall per
+        # interval is plenty, the rest skip without taking the lock
+        if self._clock() < self._next_poll_at:
+            return
+        with self._listen_lock:
+            now = self._clock()
+            if now < self._next_poll_at:
+                return
+            self._next_poll_at = now + self.poll_interval
+            self._poll_locked(now)
+
+    def _poll_locked(self, now):
+        # LISTEN connections must not be shared across fork()
+        if self._listen_conn is None or self._listen_pid != os.getpid():
+            if now < self._listen_retry_at:
+                return
+            conn = self._connect()
+            if conn is None:
+                # Fall back to TTL expiry for a while instead of reconnecting on every lookup
+                self._listen_retry_at = now + 30.0
+                return
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {REFDATA_CHANNEL}")
+            cur.close()
+            self._listen_conn, self._listen_pid = conn, os.getpid()
+        try:
+            # Non-blocking: only drains what has already arrived on the socket
+            self._listen_conn.poll()
+        except Exception:
+            self._listen_conn = None
+            self.invalidate()
+            return
+        if self._listen_conn.notifies:
+            self._listen_conn.notifies.clear()
+            self.invalidate()
+
+    def invalidate(self):
+        self._cache.clear()
+        self.invalidations += 1
+
+    # -- loading ------------------------------------------------------------
+
+    def _get(self, key, loader):
+        self._poll_notifications()
+        table = self._cache.get(key)
+        if table is not None:
+            return table
+        with self._load_lock:
+            # Another thread may have loaded it while we waited
+            table = self._cache.peek(key)
+            if table is not None:
+                return table
+            with db_connection() as conn:
+                cur = conn.cursor()
+                table = loader(cur)
+                cur.close()
+            self.loads += 1
+            self.version += 1
+            if len(table.rows) <= self.max_rows:
+                self._cache.set(key, table)
+            return table
+
+    def _crop_table(self):
+        def load(cur):
+            cur.execute("SELECT id, name FROM crops")
+            return CropTable(cur.fetchall())
+        return self._get('crops', load)
+
+    def _market_table(self):
+        def load(cur):
+            cur.execute("SELECT id, name, location, lat, lng, spoilage_risk FROM markets ORDER BY id")
+            return MarketTable(cur.fetchall())
+        return self._get('markets', load)
+
+    # -- public lookups -----------------------------------------------------
+
+    def crops(self):
+        return self._crop_table().rows
+
+    def markets(self):
+        return self._market_table().rows
+
+    def crops_digest(self):
+        return self._crop_table().digest
+
+    def markets_digest(self):
+        return self._market_table().digest
+
+    def crop_id(self, name):
+        return self._crop_table().by_lower_name.get(name.strip().lower())
+
+    def market_id(self, name):
+        return self._market_table().by_lower_name.get(name.strip().lower())
+
+    def crop_name(self, crop_id):
+        name = self._crop_table().by_id.get(crop_id)
+        if name is None:
+            # Row newer than our snapshot: reload once
+            self._cache.pop('crops')
+            name = self._crop_table().by_id.get(crop_id)
+        return name
+
+    def market(self, market_id):
+        row = self._market_table().by_id.get(market_id)
+        if row is None:
+            self._cache.pop('markets')
+            row = self._market_table().by_id.get(market_id)
+        return row
+
+    def market_name(self, market_id):
+        row = self.market(market_id)
+        return row[1] if row else None
+
+    def stats(self):
+        stats = self._cache.stats()
+        stats.update({
+            "version": self.version,
+            "loads": self.loads,
+            "invalidations": self.invalidations,
+            "listening": self._listen_conn is not None,
+        })
+        return stats
+
+
+def notify_refdata_changed(cur):
+    # Delivered to every listening process when the surrounding transaction commits
+    cur.execute(f"NOTIFY {REFDATA_CHANNEL}")
+
+
+refdata = ReferenceData(
+    ttl=float(os.getenv('REFDATA_TTL', '300')),
+    max_rows=int(os.getenv('REFDATA_MAX_ROWS', '100000')),
+    poll_interval=float(os.getenv('REFDATA_POLL_INTERVAL', '1')),
+)
@@ -0,0 +1,92 @@
+import os
+import unicodedata
+
+from cache import TTLCache
+from crop_resolver import get_crop_resolver
+from db import db_connection
+from http_cache import price_version
+from metrics import logger
+
+
+def normalize_message(text):
+    """Lower-case, drop punctuation and symbols, collapse whitespace.
+
+    Works on category rather than ASCII so Hindi or Tamil questions keep
+    their vowel signs and normalize just as consistently.
+    """
+    cleaned = ''.join(' ' if unicodedata.category(c)[0] in 'PSZ' or unicodedata.category(c) == 'Cc' else c
+                      for c in text.lower())
+    return ' '.join(cleaned.split())
+
+
+def mentioned_crop_ids(normalized):
+    # Same index as /prices?crop=, so "tamatar" and "tomatoes" count as Tomato
+    return get_crop_resolver().mentions(normalized)
+
+
+def price_data_version(normalized):
+    # Answers about specific crops only go stale when those crops' prices
+    # change; anything else is tied to the newest price change overall
+    crop_ids = mentioned_crop_ids(normalized)
+    with db_connection() as conn:
+        cur = conn.cursor()
+        if crop_ids:
+            version = tuple(price_version(cur, crop_id)[0] for crop_id in crop_ids)
+        else:
+            version = price_version(cur)[0]
+        cur.close()
+    return version
+
+
+class ResponseCache:
+    """LRU/TTL cache of assistant replies for repeated stateless questions.
+
+    Keys are (normalized message, prompt addition, data version), so a reply
+    is never served after the prices it talks about have changed. Each hit
+    credits the latency of the completion it replaced to ``saved_seconds``.
+    """
+
+    def __init__(self, max_entries=512, ttl=900.0, version_fn=price_data_version):
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.version_fn = version_fn
+        self.saved_seconds = 0.0
+        self.skipped = 0
+
+    def key(self, message, system_prompt_addition=''):
+        normalized = normalize_message(message)
+        try:
+            version = self.version_fn(normalized)
+        except Exception:
+            # No version, no caching: never risk serving a stale answer
+            logger.exception("Error reading chat cache version")
+            return None
+        return normalized, ' '.join(system_prompt_addition.split()), version
+
+    def get(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        reply, latency = entry
+        self.saved_seconds += latency
+        return reply
+
+    def set(self, key, reply, latency):
+        self._cache.set(key, (reply, latency))
+
+    def skip(self):
+        # A reply that came from a tool call (e.g. update_farm_data) is never cached
+        self.skipped += 1
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        stats = self._cache.stats()
+        stats.update({"saved_seconds": round(self.saved_seconds, 3), "skipped": self.skipped})
+        return stats
+
+
+chat_cache = ResponseCache(
+    max_entries=int(os.getenv('CHAT_CACHE_SIZE', '512')),
+    ttl=float(os.getenv('CHAT_CACHE_TTL', '900')),
+)
@@ -1,9 +1,8 @@
-from db import get_db_connection
+from db import db_connection
 from werkzeug.security import generate_password_hash
 
 def seed_user():
-    conn = get_db_connection()
-    if conn:
+    with db_connection() as conn:
         try:
             cur = conn.cursor()
             
@@ -26,7 +25,6 @@ def seed_user():
                 print(f"User {email} created successfully with password '{password}'")
                 
             cur.close()
-            conn.close()
         except Exception as e:
             print(f"Error seeding user: {e}")
 
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+
+from metrics import logger, upstream_timer
+
+# Azure speech tokens are valid for 10 minutes
+TOKEN_LIFETIME = 600.0
+# Start a background refresh once a token is this old; callers keep getting
+# the current token meanwhile
+REFRESH_AFTER = 480.0
+
+
+class SpeechTokenError(Exception):
+    def __init__(self, message, status_code=502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SpeechTokenCache:
+    """Hands every caller the current speech token for one key and region.
+
+    Tokens older than ``refresh_after`` are renewed in a background thread;
+    only a missing or expired token makes a caller wait. Concurrent refreshes
+    collapse into one upstream call, and all calls share a pooled session.
+    """
+
+    def __init__(self, key, region, url=None, lifetime=TOKEN_LIFETIME, refresh_after=REFRESH_AFTER,
+                 timeout=10.0, clock=time.monotonic, session=None):
+        self.key = key
+        self.region = region
+        self.url = url or f'https://{region}.api.cognitive.microsoft.com/sts/v1.0/issueToken'
+        self.lifetime = lifetime
+        self.refresh_after = refresh_after
+        self.timeout = timeout
+        self._clock = clock
+        if session is None:
+            # Imported here so processes that never hand out speech tokens don't pay for it
+            import requests
+            session = requests.Session()
+        self._session = session
+        self._token = None
+        self._fetched_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._background = None
+        self.hits = 0
+        self.upstream_calls = 0
+        self.refresh_errors = 0
+
+    def _age(self):
+        return self._clock() - self._fetched_at
+
+    def _fetch(self):
+        self.upstream_calls += 1
+        with upstream_timer('speech_token'):
+            response = self._session.post(self.url, headers={
+                'Ocp-Apim-Subscription-Key': self.key,
+                'Content-Type': 'application/x-www-form-urlencoded'
+            }, timeout=self.timeout)
+            if response.status_code != 200:
+                raise SpeechTokenError("Failed to get token", response.status_code)
+        self._token, self._fetched_at = response.text, self._clock()
+
+    def _refresh_in_background(self):
+        # Non-blocking: if a refresh is already running there is nothing to do
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._fetch()
+            except Exception as e:
+                # The current token stays in use until it actually expires
+                self.refresh_errors += 1
+                logger.warning("Error refreshing speech token: %s", e)
+            finally:
+                self._refresh_lock.release()
+
+        self._background = threading.Thread(target=run, name='speech-token-refresh', daemon=True)
+        self._background.start()
+
+    def get(self):
+        """Return (token, seconds until it expires), fetching only if needed."""
+        token, age = self._token, self._age()
+        if token is not None and age < self.lifetime:
+            self.hits += 1
+            if age >= self.refresh_after:
+                self._refresh_in_background()
+            return token, self.lifetime - age
+
+        with self._refresh_lock:
+            # Whoever held the lock before us may already have fetched one
+            if self._token is None or self._age() >= self.lifetime:
+                self._fetch()
+            else:
+                self.hits += 1
+            return self._token, self.lifetime - self._age()
+
+    def wait_for_refresh(self, timeout=None):
+        background = self._background
+        if background is not None:
+            background.join(timeout)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "upstream_calls": self.upstream_calls,
+            "refresh_errors": self.refresh_errors,
+            "token_age": self._age() if self._token is not None else None,
+        }
+
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_speech_token_cache():
+    """Return the process-wide token cache, or None if speech isn't configured.
+
+    Rebuilt after fork() so each worker has its own session and refresh thread.
+    """
+    global _cache, _cache_pid
+    key, region = os.getenv('AZURE_SPEECH_KEY'), os.getenv('AZURE_SPEECH_REGION')
+    if not key or not region:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid() or (_cache.key, _cache.region) != (key, region):
+            _cache = SpeechTokenCache(key, region, url=os.getenv('AZURE_SPEECH_TOKEN_URL'),
+                                      refresh_after=float(os.getenv('SPEECH_TOKEN_REFRESH_AFTER', str(REFRESH_AFTER))))
+            _cache_pid = os.getpid()
+        return _cache
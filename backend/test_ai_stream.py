@@ -0,0 +1,228 @@
+import functools
+import json
+import os
+import unittest
+from contextlib import contextmanager
+
+from fake_openai import FakeOpenAIServer
+
+# Runs offline: the backend talks to a local fake completions server
+fake = FakeOpenAIServer()
+os.environ['AZURE_OPENAI_ENDPOINT'] = fake.endpoint
+os.environ['AZURE_OPENAI_API_KEY'] = 'fake'
+
+import ai_client
+import app as backend
+from auth import issue_token
+from conversations import Conversation
+from crop_resolver import CropResolver
+from response_cache import chat_cache, normalize_message
+from seed_db import ALL_CROPS
+
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split('\n\n'):
+        event, data = 'message', None
+        for line in block.split('\n'):
+            if line.startswith('event: '):
+                event = line[len('event: '):]
+            elif line.startswith('data: '):
+                data = json.loads(line[len('data: '):])
+        events.append((event, data))
+    return events
+
+
+class RecordingConnection:
+    """Stands in for a pooled connection; keeps every statement it is sent."""
+
+    def __init__(self):
+        self.statements = []
+        self.commits = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.statements.append((' '.join(sql.split()), params))
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        pass
+
+    @contextmanager
+    def __call__(self):
+        yield self
+
+
+class TestAIStream(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        fake.start()
+        ai_client.reset_openai_client()
+        cls.client = backend.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        fake.stop()
+
+    def setUp(self):
+        fake.tool_args = None
+        fake.requests.clear()
+        # Stand-in for the price data version, which normally comes from Postgres
+        self.data_version = 1
+        chat_cache.version_fn = lambda normalized: self.data_version
+        chat_cache.clear()
+
+    def chat(self, **payload):
+        payload.setdefault('message', 'Should I sell my tomatoes?')
+        return self.client.post('/api/ai/chat', json=payload, headers={'Authorization': f"Bearer {issue_token(1)}"})
+
+    def test_stream_sends_tokens_as_events(self):
+        response = self.chat(stream=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+
+        events = parse_events(response.get_data(as_text=True))
+        self.assertEqual(events[-1][0], 'done')
+        deltas = [data['delta'] for event, data in events if event == 'message']
+        self.assertGreater(len(deltas), 1)
+        self.assertEqual(''.join(deltas), fake.reply)
+
+    def test_stream_after_tool_call(self):
+        fake.tool_args = {"crop_name": "Onion", "quantity": 200, "location": "Nashik"}
+        calls = []
+        handlers = dict(backend.CHAT_TOOL_HANDLERS)
+        backend.CHAT_TOOL_HANDLERS['update_farm_data'] = lambda user_id, args: calls.append(args) or "Saved."
+        try:
+            response = self.chat(stream=True, message='I harvested 200 kg of onion in Nashik')
+            events = parse_events(response.get_data(as_text=True))
+        finally:
+            backend.CHAT_TOOL_HANDLERS.update(handlers)
+
+        # Arguments arrive in fragments and must be reassembled before the tool runs
+        self.assertEqual(calls, [fake.tool_args])
+        self.assertIn(('tool', {"names": ["update_farm_data"]}), events)
+        self.assertEqual(''.join(d['delta'] for e, d in events if e == 'message'), fake.reply)
+        self.assertEqual(events[-1][0], 'done')
+
+        # The second completion carries the tool round trip
+        followup = fake.requests[-1]['messages']
+        self.assertEqual(followup[-2]['tool_calls'][0]['function']['name'], 'update_farm_data')
+        self.assertEqual(followup[-1], {"tool_call_id": "call_fake_1", "role": "tool",
+                                        "name": "update_farm_data", "content": "Saved."})
+
+    def test_update_farm_data_tool(self):
+        # The real handler, with the database swapped for a recorder
+        fake.tool_args = {"crop_name": "pyaaz", "quantity": 200, "location": "Nashik", "harvest_date": "2024-03-01"}
+        conn = RecordingConnection()
+        resolver = CropResolver(list(enumerate(ALL_CROPS, 1)))
+        handlers = dict(backend.CHAT_TOOL_HANDLERS)
+        backend.CHAT_TOOL_HANDLERS['update_farm_data'] = functools.partial(
+            backend.save_farm_data, resolver=resolver, connection=conn)
+        try:
+            response = self.chat(message='I harvested 200 kg of onion in Nashik')
+        finally:
+            backend.CHAT_TOOL_HANDLERS.update(handlers)
+
+        self.assertEqual(response.status_code, 200)
+        onion = ALL_CROPS.index('Onion') + 1
+        self.assertEqual(conn.statements, [(
+            "INSERT INTO farm_data (user_id, crop_id, quantity_kg, location, harvest_date) VALUES (%s, %s, %s, %s, %s)",
+            (1, onion, 200, 'Nashik', '2024-03-01'))])
+        self.assertEqual(conn.commits, 1)
+        tool_reply = fake.requests[-1]['messages'][-1]
+        self.assertEqual(tool_reply['content'], "Successfully updated database with farm data for Onion.")
+
+    def test_session_history_is_sent_and_recorded(self):
+        recorded = []
+
+        class StubConversation(Conversation):
+            def record(self, user_message, reply):
+                recorded.append((user_message, reply))
+
+        history = StubConversation(1, "Farmer grows onions in Nashik.", [('user', 'Hi'), ('assistant', 'Hello!')], 20, 1200)
+        loader = backend.load_conversation
+        backend.load_conversation = lambda user_id, session_id: history
+        try:
+            self.chat(stream=True, session_id='abc').get_data()
+        finally:
+            backend.load_conversation = loader
+
+        sent = fake.requests[-1]['messages']
+        self.assertEqual(sent[1], {"role": "system", "content": "Summary of the conversation so far: Farmer grows onions in Nashik."})
+        self.assertEqual(sent[2:4], [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello!"}])
+        self.assertEqual(recorded, [('Should I sell my tomatoes?', fake.reply)])
+
+    def test_non_streaming_response(self):
+        response = self.chat()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {"response": fake.reply})
+
+    def test_client_is_reused(self):
+        self.assertIs(ai_client.get_openai_client(), ai_client.get_openai_client())
+        self.chat()
+        before = fake.connections
+        for i in range(3):
+            self.chat(message=f"Question {i}")
+        # Pooled keep-alive connection: no new socket per request
+        self.assertEqual(fake.connections, before)
+
+    def test_repeated_question_is_served_from_cache(self):
+        first = self.chat(message="Today's tomato price in Azadpur?").get_json()
+        self.assertNotIn('cached', first)
+        # Same question modulo case, punctuation and spacing
+        second = self.chat(message="today's  TOMATO price in Azadpur").get_json()
+        self.assertEqual(second, {"response": fake.reply, "cached": True})
+
+        events = parse_events(self.chat(message="Today's tomato price in Azadpur?", stream=True).get_data(as_text=True))
+        self.assertEqual(''.join(d['delta'] for e, d in events if e == 'message'), fake.reply)
+        self.assertEqual(events[-1], ('done', {"cached": True}))
+        self.assertEqual(len(fake.requests), 1)
+
+        stats = chat_cache.stats()
+        self.assertGreaterEqual(stats['hits'], 2)
+        self.assertGreater(stats['saved_seconds'], 0)
+
+    def test_new_price_data_invalidates_cached_reply(self):
+        self.chat(message="Best market for onions?")
+        self.data_version = 2
+        self.assertNotIn('cached', self.chat(message="Best market for onions?").get_json())
+        self.assertEqual(len(fake.requests), 2)
+
+    def test_tool_call_replies_are_not_cached(self):
+        fake.tool_args = {"crop_name": "Onion", "quantity": 200, "location": "Nashik"}
+        handlers = dict(backend.CHAT_TOOL_HANDLERS)
+        backend.CHAT_TOOL_HANDLERS['update_farm_data'] = lambda user_id, args: "Saved."
+        skipped = chat_cache.stats()['skipped']
+        try:
+            for stream in (False, True):
+                self.chat(message="I harvested 200 kg of onion", stream=stream).get_data()
+        finally:
+            backend.CHAT_TOOL_HANDLERS.update(handlers)
+        # Both turns went upstream (tool call + follow-up each): the write is never skipped
+        self.assertEqual(len(fake.requests), 4)
+        self.assertEqual(chat_cache.stats()['skipped'] - skipped, 2)
+
+    def test_normalize_message(self):
+        self.assertEqual(normalize_message("  What's the ONION price?! "), "what s the onion price")
+        # Vowel signs are marks, not punctuation, and must survive
+        self.assertEqual(normalize_message("प्याज़ का भाव?"), "प्याज़ का भाव")
+
+    def test_upstream_error_becomes_error_event(self):
+        os.environ['AZURE_OPENAI_ENDPOINT'] = 'http://127.0.0.1:9'
+        os.environ['AZURE_OPENAI_MAX_RETRIES'] = '0'
+        ai_client.reset_openai_client()
+        try:
+            events = parse_events(self.chat(stream=True).get_data(as_text=True))
+        finally:
+            os.environ['AZURE_OPENAI_ENDPOINT'] = fake.endpoint
+            del os.environ['AZURE_OPENAI_MAX_RETRIES']
+            ai_client.reset_openai_client()
+        self.assertEqual(events[-1][0], 'error')
+
+
+if __name__ == '__main__':
+    unittest.main()
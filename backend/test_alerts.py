@@ -0,0 +1,84 @@
+import datetime
+import random
+import time
+import unittest
+
+from alerts import Watch, WatchIndex, match_actuals, match_forecasts
+
+TOMATO, ONION = 1, 2
+AZADPUR, VASHI = 10, 20
+NAMES = {TOMATO: 'Tomato', ONION: 'Onion', AZADPUR: 'Azadpur Mandi', VASHI: 'Vashi Market'}
+DAY = datetime.date(2024, 3, 4)
+LOOKUPS = dict(crop_name=NAMES.get, market_name=NAMES.get)
+
+
+class TestWatchIndex(unittest.TestCase):
+    def setUp(self):
+        self.watches = [
+            Watch(1, 100, TOMATO, VASHI, 'above', 50.0),
+            Watch(2, 101, TOMATO, VASHI, 'above', 60.0),
+            Watch(3, 102, TOMATO, None, 'above', 55.0),
+            Watch(4, 103, TOMATO, VASHI, 'below', 30.0),
+            Watch(5, 104, ONION, VASHI, 'above', 20.0),
+            Watch(6, 105, TOMATO, AZADPUR, 'forecast_up', 20.0),
+            Watch(7, 106, TOMATO, None, 'forecast_down', 10.0),
+        ]
+        self.index = WatchIndex(self.watches)
+
+    def ids(self, watches):
+        return sorted(w.id for w in watches)
+
+    def test_crossing_up(self):
+        self.assertEqual(self.ids(self.index.crossed(TOMATO, VASHI, 48.0, 56.0)), [1, 3])
+        self.assertEqual(self.ids(self.index.crossed(TOMATO, VASHI, 40.0, 70.0)), [1, 2, 3])
+        # Already above: staying there is not a new crossing
+        self.assertEqual(self.ids(self.index.crossed(TOMATO, VASHI, 50.0, 52.0)), [])
+        # Any-market watch fires for other markets too
+        self.assertEqual(self.ids(self.index.crossed(TOMATO, AZADPUR, 40.0, 58.0)), [3])
+
+    def test_crossing_down(self):
+        self.assertEqual(self.ids(self.index.crossed(TOMATO, VASHI, 35.0, 29.0)), [4])
+        self.assertEqual(self.ids(self.index.crossed(TOMATO, VASHI, 30.0, 25.0)), [])
+        self.assertEqual(self.ids(self.index.crossed(TOMATO, VASHI, 35.0, 31.0)), [])
+
+    def test_first_price_counts_as_crossing(self):
+        self.assertEqual(self.ids(self.index.crossed(TOMATO, VASHI, None, 52.0)), [1])
+        self.assertEqual(self.ids(self.index.crossed(ONION, AZADPUR, None, 52.0)), [])
+
+    def test_forecast_moves(self):
+        self.assertEqual(self.ids(self.index.forecast_moves(TOMATO, AZADPUR, 25.0, -25.0)), [6])
+        self.assertEqual(self.ids(self.index.forecast_moves(TOMATO, AZADPUR, 15.0, 12.0)), [7])
+        self.assertEqual(self.ids(self.index.forecast_moves(TOMATO, VASHI, 25.0, 0.0)), [])
+
+    def test_matching_builds_notifications(self):
+        rows = [(VASHI, TOMATO, DAY, 52.5, 48.0), (VASHI, ONION, DAY, 18.0, 19.0)]
+        notes = list(match_actuals(self.index, rows, **LOOKUPS))
+        self.assertEqual(len(notes), 1)
+        user_id, watch_id, kind, priority, title, message, crop_id, market_id, day = notes[0]
+        self.assertEqual((user_id, watch_id, kind, priority, market_id, day), (100, 1, 'price', 'high', VASHI, DAY))
+        self.assertEqual(title, "Tomato in Vashi Market crossed ₹50/kg")
+        self.assertIn("₹52.5/kg", message)
+        self.assertIn("previously ₹48/kg", message)
+
+        week = DAY - datetime.timedelta(days=DAY.weekday())
+        forecasts = [(AZADPUR, TOMATO, 40.0, (38.0, DAY), (50.0, DAY + datetime.timedelta(days=3)))]
+        notes = list(match_forecasts(self.index, forecasts, week, **LOOKUPS))
+        self.assertEqual([n[1] for n in notes], [6])
+        self.assertEqual(notes[0][4], "Tomato forecast up 25% this week in Azadpur Mandi")
+        self.assertEqual(notes[0][-1], week)
+
+    def test_matching_cost_does_not_grow_with_unrelated_watches(self):
+        rng = random.Random(1)
+        watches = [Watch(i, i, rng.randrange(3, 500), rng.randrange(1, 300), 'above', rng.uniform(5, 100))
+                   for i in range(200000)]
+        watches.append(Watch(0, 1, TOMATO, VASHI, 'above', 50.0))
+        index = WatchIndex(watches)
+        rows = [(VASHI, TOMATO, DAY, 45.0 + i % 10, 45.0 + (i + 5) % 10) for i in range(20000)]
+        started = time.perf_counter()
+        fired = list(match_actuals(index, rows, **LOOKUPS))
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual({n[1] for n in fired}, {0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,12 @@ import unittest
 # Direct access to Flask backend (no Vite proxy)
 BASE_URL = "http://127.0.0.1:5000"
 
+
+def session_headers():
+    # User-scoped routes need a session; uses the admin account from seed_user.py
+    response = requests.post(f"{BASE_URL}/login", json={"email": "admin@example.com", "password": "password123"})
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
 class TestAPI(unittest.TestCase):
     def test_get_crops(self):
         # Frontend /api/crops -> Backend /crops
@@ -13,6 +19,13 @@ class TestAPI(unittest.TestCase):
         self.assertTrue(len(data) > 0)
         print(f"Found {len(data)} crops")
 
+    def test_metrics(self):
+        requests.get(f"{BASE_URL}/crops")
+        response = requests.get(f"{BASE_URL}/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_requests_total{route="/crops"', response.text)
+        self.assertIn('db_pool_connections', response.text)
+
     def test_get_markets(self):
         # Frontend /api/markets -> Backend /markets
         response = requests.get(f"{BASE_URL}/markets")
@@ -40,5 +53,179 @@ class TestAPI(unittest.TestCase):
         self.assertIn('is_predicted', sample)
         self.assertIn('market', sample)
 
+    def test_get_prices_columnar(self):
+        import msgpack
+        import numpy as np
+        crop = requests.get(f"{BASE_URL}/crops").json()[0]['name']
+        rows = requests.get(f"{BASE_URL}/prices?crop={crop}&limit=50").json()
+        response = requests.get(f"{BASE_URL}/prices?crop={crop}&limit=50",
+                                headers={"Accept": "application/x-msgpack"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'application/x-msgpack')
+        body = msgpack.unpackb(response.content)
+        self.assertEqual(body['count'], len(rows))
+        prices = np.frombuffer(body['price'], dtype=body['dtypes']['price']).tolist()
+        for row, price in zip(rows, prices):
+            self.assertAlmostEqual(row['price'], price, places=2)
+
+    def test_get_prices_paginated(self):
+        crops = requests.get(f"{BASE_URL}/crops").json()
+        first_crop = crops[0]['name']
+
+        response = requests.get(f"{BASE_URL}/prices?crop={first_crop}&is_predicted=false&limit=50")
+        self.assertEqual(response.status_code, 200)
+        first_page = response.json()
+        self.assertEqual(len(first_page), 50)
+        self.assertTrue(all(not p['is_predicted'] for p in first_page))
+
+        # Follow the cursor; pages must continue in date order without overlap
+        cursor = response.headers['X-Next-Cursor']
+        response = requests.get(f"{BASE_URL}/prices?crop={first_crop}&is_predicted=false&limit=50&cursor={cursor}")
+        self.assertEqual(response.status_code, 200)
+        second_page = response.json()
+        self.assertTrue(len(second_page) > 0)
+        self.assertGreaterEqual(second_page[0]['date'], first_page[-1]['date'])
+
+    def test_get_prices_streamed(self):
+        crops = requests.get(f"{BASE_URL}/crops").json()
+        first_crop = crops[0]['name']
+
+        full = requests.get(f"{BASE_URL}/prices?crop={first_crop}").json()
+        streamed = requests.get(f"{BASE_URL}/prices?crop={first_crop}&stream=1").json()
+        self.assertEqual(len(full), len(streamed))
+
+    def test_get_prices_weekly(self):
+        crops = requests.get(f"{BASE_URL}/crops").json()
+        markets = requests.get(f"{BASE_URL}/markets").json()
+        query = f"crop={crops[0]['name']}&market={markets[0]['name']}"
+
+        daily = requests.get(f"{BASE_URL}/prices?{query}").json()
+        weekly = requests.get(f"{BASE_URL}/prices?{query}&resolution=week").json()
+        self.assertTrue(len(weekly) > 0)
+        # Roughly one candle per week per actual/predicted series
+        self.assertLessEqual(len(weekly), len(daily) // 7 + 4)
+        sample = weekly[0]
+        for key in ('open', 'high', 'low', 'close'):
+            self.assertIn(key, sample)
+        self.assertLessEqual(sample['low'], sample['high'])
+
+    def test_get_price_summary(self):
+        crops = requests.get(f"{BASE_URL}/crops").json()
+        first_crop = crops[0]['name']
+
+        response = requests.get(f"{BASE_URL}/prices/summary?crop={first_crop}")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(len(data) > 0)
+        print(f"Found summaries for {len(data)} markets for {first_crop}")
+
+        # Windows are trimmed server-side
+        sample = data[0]
+        self.assertIn('current_price', sample)
+        self.assertIn('max_predicted', sample)
+        self.assertLessEqual(len(sample['history']), 15)
+        self.assertLessEqual(len(sample['forecast']), 15)
+
+    def test_bulk_farm_data(self):
+        body = ("crop,quantity_kg,harvest_date,location\n"
+                "tomatoes,125.5,2024-02-10,Bulk Test Farm\n"
+                "Not A Crop,10,2024-02-10,Bulk Test Farm\n")
+        headers = dict(session_headers(), **{"Content-Type": "text/csv"})
+
+        response = requests.post(f"{BASE_URL}/farm-data/bulk", data=body, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result['received'], 2)
+        self.assertEqual(result['error_count'], 1)
+        self.assertEqual(result['errors'][0]['line'], 3)
+
+        # Identical lots are still separate lots: nothing is deduplicated
+        again = requests.post(f"{BASE_URL}/farm-data/bulk", data=body, headers=headers).json()
+        self.assertEqual(again['inserted'], 1)
+
+    def test_ingest_price_feed(self):
+        crops = requests.get(f"{BASE_URL}/crops").json()
+        markets = requests.get(f"{BASE_URL}/markets").json()
+        # A day well before the seeded history, so other tests are unaffected
+        body = ("market,crop,date,price_per_kg\n"
+                f"{markets[0]['name']},{crops[0]['name']},2001-01-01,42.5\n"
+                f"{markets[0]['name']},Not A Crop,2001-01-01,42.5\n")
+        anonymous = {"Content-Type": "text/csv"}
+        self.assertEqual(requests.post(f"{BASE_URL}/prices/ingest", data=body, headers=anonymous).status_code, 401)
+
+        # The server must run with ADMIN_USER_IDS naming the seeded admin account
+        headers = dict(session_headers(), **anonymous)
+        response = requests.post(f"{BASE_URL}/prices/ingest", data=body, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result['received'], 2)
+        self.assertEqual(result['error_count'], 1)
+
+        # Idempotent: the same feed again changes nothing
+        again = requests.post(f"{BASE_URL}/prices/ingest", data=body, headers=headers).json()
+        self.assertEqual((again['inserted'], again['updated'], again['unchanged']), (0, 0, 1))
+
+    def test_nearest_markets(self):
+        crops = requests.get(f"{BASE_URL}/crops").json()
+        response = requests.get(f"{BASE_URL}/markets/nearest?lat=28.73&lng=77.12&k=3&crop={crops[0]['name']}")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data), 3)
+        distances = [m['distanceKm'] for m in data]
+        self.assertEqual(distances, sorted(distances))
+        self.assertIn('latestPrice', data[0])
+
+        # Nothing within 1 km of the middle of the Arabian Sea
+        response = requests.get(f"{BASE_URL}/markets/nearest?lat=15&lng=65&radius_km=1")
+        self.assertEqual(response.json(), [])
+        self.assertEqual(requests.get(f"{BASE_URL}/markets/nearest?lat=abc&lng=1").status_code, 400)
+
+    def test_profit_recommendations(self):
+        self.assertEqual(requests.get(f"{BASE_URL}/profit/recommendations?user_id=1").status_code, 401)
+        response = requests.get(f"{BASE_URL}/profit/recommendations", headers=session_headers())
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIn(data['source'], ('batch', 'live'))
+        for lot in data['lots']:
+            rec = lot['recommendation']
+            if rec is not None:
+                self.assertAlmostEqual(rec['gross'] - rec['transport_cost'] - rec['spoilage_cost'], rec['net'], delta=0.05)
+        self.assertAlmostEqual(sum(m['net'] for m in data['totals']['by_market']), data['totals']['net'], delta=1)
+
+    def test_watchlist_and_notifications(self):
+        crops = requests.get(f"{BASE_URL}/crops").json()
+        headers = session_headers()
+        watch = {"crop": crops[0]['name'], "kind": "above", "threshold": 50}
+        response = requests.post(f"{BASE_URL}/watchlist", json=watch, headers=headers)
+        self.assertEqual(response.status_code, 201)
+        watch_id = response.json()['id']
+        watches = requests.get(f"{BASE_URL}/watchlist", headers=headers).json()
+        self.assertIn(watch_id, [w['id'] for w in watches])
+        response = requests.post(f"{BASE_URL}/watchlist", json=dict(watch, kind="sideways"), headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+        response = requests.get(f"{BASE_URL}/notifications?limit=1", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(response.json()), 1)
+
+        # Another user's list is refused, with or without a session
+        self.assertEqual(requests.get(f"{BASE_URL}/watchlist?user_id=2").status_code, 401)
+        self.assertEqual(requests.get(f"{BASE_URL}/watchlist?user_id=2", headers=headers).status_code, 403)
+
+        self.assertEqual(requests.delete(f"{BASE_URL}/watchlist/{watch_id}", headers=headers).status_code, 200)
+        self.assertEqual(requests.delete(f"{BASE_URL}/watchlist/{watch_id}", headers=headers).status_code, 404)
+
+    def test_login_session_token(self):
+        # Uses the admin account from seed_user.py
+        response = requests.post(f"{BASE_URL}/login", json={"email": "admin@example.com", "password": "password123"})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertGreater(data['expires_in'], 0)
+        headers = {"Authorization": f"Bearer {data['token']}"}
+        self.assertEqual(requests.get(f"{BASE_URL}/watchlist", headers=headers).status_code, 200)
+
+        forged = {"Authorization": f"Bearer {data['token'][:-2]}xx"}
+        self.assertEqual(requests.get(f"{BASE_URL}/watchlist", headers=forged).status_code, 401)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request
+
+from auth import (HasherBusy, PasswordHasher, Throttle, ThrottleExceeded, bearer_token, is_admin, issue_token,
+                  verify_token)
+
+SECRET = b'test-secret'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestThrottle(unittest.TestCase):
+    def test_sliding_window(self):
+        clock = FakeClock()
+        throttle = Throttle(limit=3, window=60, clock=clock)
+        for _ in range(3):
+            throttle.hit('1.2.3.4')
+        with self.assertRaises(ThrottleExceeded) as ctx:
+            throttle.hit('1.2.3.4')
+        self.assertEqual(ctx.exception.retry_after, 60)
+        # Other keys are unaffected
+        throttle.hit('5.6.7.8')
+
+        clock.now += 30
+        self.assertEqual(throttle.retry_after('1.2.3.4'), 30)
+        clock.now += 30
+        self.assertEqual(throttle.retry_after('1.2.3.4'), 0)
+        throttle.hit('1.2.3.4')
+
+    def test_reset_and_pruning(self):
+        clock = FakeClock()
+        throttle = Throttle(limit=2, window=10, max_keys=3, clock=clock)
+        throttle.hit('a@example.com')
+        throttle.hit('a@example.com')
+        throttle.reset('a@example.com')
+        self.assertEqual(throttle.retry_after('a@example.com'), 0)
+
+        for key in ('a', 'b', 'c'):
+            throttle.hit(key)
+        clock.now += 10
+        throttle.hit('d')
+        self.assertEqual(sorted(throttle._hits), ['d'])
+
+
+class TestSessionTokens(unittest.TestCase):
+    def test_round_trip(self):
+        token = issue_token(42, ttl=60, secret=SECRET, now=1000)
+        self.assertEqual(verify_token(token, secret=SECRET, now=1059), 42)
+        self.assertIsNone(verify_token(token, secret=SECRET, now=1060))
+
+    def test_rejects_tampering(self):
+        token = issue_token(42, ttl=60, secret=SECRET, now=1000)
+        version, user_id, expires, signature = token.split('.')
+        self.assertIsNone(verify_token(f"{version}.1.{expires}.{signature}", secret=SECRET, now=1000))
+        self.assertIsNone(verify_token(f"{version}.{user_id}.99999.{signature}", secret=SECRET, now=1000))
+        self.assertIsNone(verify_token(token, secret=b'other-secret', now=1000))
+        for junk in ('', 'abc', 'v1.1.2', 'v1.x.y.z', 'v1.1.2.é', None):
+            self.assertIsNone(verify_token(junk, secret=SECRET, now=1000))
+
+    def test_bearer_header(self):
+        self.assertEqual(bearer_token({'Authorization': 'Bearer abc.def'}), 'abc.def')
+        self.assertIsNone(bearer_token({'Authorization': 'Basic abc'}))
+        self.assertIsNone(bearer_token({}))
+
+
+class TestPasswordHasher(unittest.TestCase):
+    def test_hash_and_check_in_processes(self):
+        hasher = PasswordHasher(workers=1, queue_max=1)
+        try:
+            hashed = hasher.hash('password123')
+            self.assertTrue(hasher.check(hashed, 'password123'))
+            self.assertFalse(hasher.check(hashed, 'wrong'))
+        finally:
+            hasher.shutdown()
+        self.assertEqual(hasher.stats()["in_flight"], 0)
+
+    def test_full_queue_is_rejected_without_waiting(self):
+        hasher = PasswordHasher(workers=1, queue_max=1, executor_factory=lambda n: ThreadPoolExecutor(n))
+        release = threading.Event()
+        blocked = [threading.Thread(target=hasher._run, args=('check', release.wait)) for _ in range(2)]
+        for thread in blocked:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while hasher.stats()["queued"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(hasher.stats()["queued"], 1)
+        self.assertEqual(hasher.stats()["in_flight"], 1)
+
+        with self.assertRaises(HasherBusy):
+            hasher.check('hash', 'password')
+        self.assertEqual(hasher.rejected, 1)
+
+        release.set()
+        for thread in blocked:
+            thread.join()
+        self.assertEqual(hasher.stats()["queued"], 0)
+        hasher.shutdown()
+
+
+class TestClientAddress(unittest.TestCase):
+    def test_forwarded_address_behind_a_proxy(self):
+        import app as backend
+        os.environ['TRUSTED_PROXY_HOPS'] = '1'
+        try:
+            proxied = backend.create_app()
+        finally:
+            del os.environ['TRUSTED_PROXY_HOPS']
+        proxied.add_url_rule('/client-address', 'client_address', lambda: request.remote_addr)
+        # The throttles key on remote_addr: the client's, not the front end's
+        response = proxied.test_client().get('/client-address', headers={'X-Forwarded-For': '203.0.113.7'},
+                                             environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        self.assertEqual(response.get_data(as_text=True), '203.0.113.7')
+
+
+class TestSessionRoutes(unittest.TestCase):
+    def test_bad_token_is_unauthorized_before_any_query(self):
+        import app as backend
+        client = backend.app.test_client()
+        response = client.get('/profit/recommendations', headers={'Authorization': 'Bearer v1.1.1.forged'})
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("log in", response.get_json()["error"])
+
+    def test_user_routes_need_a_session(self):
+        import app as backend
+        client = backend.app.test_client()
+        for method, path in [('GET', '/profit/recommendations?user_id=2'), ('GET', '/watchlist?user_id=2'),
+                             ('GET', '/notifications?user_id=2'), ('DELETE', '/watchlist/1?user_id=2'),
+                             ('POST', '/notifications/1/read?user_id=2'), ('POST', '/farm-data/bulk?user_id=2')]:
+            self.assertEqual(client.open(path, method=method).status_code, 401, path)
+        for path, body in [('/watchlist', {"user_id": 2, "kind": "above"}), ('/api/ai/chat', {"user_id": 2, "message": "hi"})]:
+            self.assertEqual(client.post(path, json=body).status_code, 401, path)
+
+    def test_price_ingest_needs_an_admin(self):
+        import app as backend
+        client = backend.app.test_client()
+        body = b'market,crop,date,price_per_kg\n'
+        self.assertEqual(client.post('/prices/ingest', data=body, content_type='text/csv').status_code, 401)
+        headers = {'Authorization': f"Bearer {issue_token(1)}"}
+        response = client.post('/prices/ingest', data=body, content_type='text/csv', headers=headers)
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(is_admin(1, admins=frozenset({1})))
+
+    def test_user_id_must_match_the_session(self):
+        import app as backend
+        client = backend.app.test_client()
+        headers = {'Authorization': f"Bearer {issue_token(1)}"}
+        response = client.get('/watchlist?user_id=2', headers=headers)
+        self.assertEqual(response.status_code, 403)
+        response = client.post('/api/ai/chat', json={"user_id": "2", "message": "hi"}, headers=headers)
+        self.assertEqual(response.status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
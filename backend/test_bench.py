@@ -0,0 +1,45 @@
+import unittest
+
+from bench import compare, percentile, summarize_run
+
+
+class TestBench(unittest.TestCase):
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertEqual(percentile([1, 2, 3], 50), 2)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summarize_run(self):
+        summary = summarize_run([0.010, 0.020, 0.030, 0.040], errors=1, elapsed=2.0)
+        self.assertEqual(summary["requests"], 5)
+        self.assertEqual(summary["errors"], 1)
+        self.assertEqual(summary["rps"], 2.0)
+        self.assertEqual(summary["p50_ms"], 20.0)
+        self.assertEqual(summary["p99_ms"], 40.0)
+
+    def test_compare_flags_regressions_beyond_tolerance(self):
+        baseline = {"results": {"500": {
+            "crops": {"p95_ms": 10.0, "rps": 1000.0, "errors": 0},
+            "prices": {"p95_ms": 50.0, "rps": 200.0, "errors": 0},
+        }}}
+        report = {"results": {
+            "500": {
+                "crops": {"p95_ms": 11.5, "rps": 900.0, "errors": 0},
+                "prices": {"p95_ms": 80.0, "rps": 120.0, "errors": 2},
+                "chat": {"p95_ms": 900.0, "rps": 5.0, "errors": 0},
+            },
+            "5000": {"crops": {"p95_ms": 30.0, "rps": 300.0, "errors": 0}},
+        }}
+        regressions = compare(report, baseline)
+        # crops is within 20%; chat and the 5000 size have no baseline
+        self.assertEqual(len(regressions), 3)
+        self.assertTrue(all(r.startswith("500 markets / prices") for r in regressions))
+        self.assertEqual(compare(report, baseline, tolerance=1.0), ["500 markets / prices: 0 -> 2 errors"])
+
+
+if __name__ == '__main__':
+    unittest.main()
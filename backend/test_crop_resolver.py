@@ -0,0 +1,107 @@
+import time
+import unittest
+
+from crop_resolver import CROP_MATCH_THRESHOLD, CropResolver, normalize_crop_name
+from seed_db import ALL_CROPS
+
+# Same names and ids the seeded crops table has; no database needed
+CROPS = list(enumerate(ALL_CROPS, 1))
+IDS = {name: crop_id for crop_id, name in CROPS}
+
+
+class TestCropResolver(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.resolver = CropResolver(CROPS)
+
+    def assertResolves(self, text, name, exact=True):
+        match = self.resolver.resolve(text)
+        self.assertIsNotNone(match, text)
+        self.assertEqual(match.name, name, text)
+        if exact:
+            self.assertEqual(match.score, 1.0, text)
+        else:
+            self.assertGreaterEqual(match.score, CROP_MATCH_THRESHOLD, text)
+
+    def test_normalized_key(self):
+        self.assertEqual(normalize_crop_name('  Rice (Basmati) '), normalize_crop_name('basmati rice'))
+        self.assertEqual(normalize_crop_name('Tomatoes'), 'tomato')
+        self.assertEqual(normalize_crop_name('Green Chillies'), 'chilli green')
+
+    def test_canonical_names_and_plurals(self):
+        self.assertResolves('Wheat', 'Wheat')
+        self.assertResolves('tomatoes', 'Tomato')
+        self.assertResolves('POTATOES', 'Potato')
+        self.assertResolves('Rice basmati', 'Rice (Basmati)')
+
+    def test_parenthesised_local_names(self):
+        self.assertResolves('chana', 'Bengal Gram (Chana)')
+        self.assertResolves('bengal gram', 'Bengal Gram (Chana)')
+        self.assertResolves('tur', 'Red Gram (Tur)')
+        self.assertResolves('moong', 'Green Gram (Moong)')
+
+    def test_aliases_and_native_script(self):
+        self.assertResolves('tamatar', 'Tomato')
+        self.assertResolves('pyaaz', 'Onion')
+        self.assertResolves('प्याज़', 'Onion')
+        self.assertResolves('வெங்காயம்', 'Onion')
+        self.assertResolves('అల్లం', 'Ginger')
+        self.assertResolves('chickpeas', 'Bengal Gram (Chana)')
+
+    def test_kannada_and_malayalam(self):
+        self.assertResolves('ಟೊಮೆಟೊ', 'Tomato')
+        self.assertResolves('ಈರುಳ್ಳಿ', 'Onion')
+        self.assertResolves('tenginakai', 'Coconut')
+        self.assertResolves('തക്കാളി', 'Tomato')
+        self.assertResolves('കുരുമുളക്', 'Black Pepper')
+        self.assertResolves('vendakka', 'Okra')
+
+    def test_ambiguous_base_name_uses_alias(self):
+        # Two crops are "Rice ..."; plain rice means the common one
+        self.assertResolves('rice', 'Rice (Common)')
+        self.assertResolves('basmati', 'Rice (Basmati)')
+
+    def test_typos_above_threshold(self):
+        self.assertResolves('tomatoe', 'Tomato', exact=False)
+        self.assertResolves('corriander', 'Coriander', exact=False)
+        self.assertResolves('turmric', 'Turmeric', exact=False)
+        # Swapped letters share few trigrams; the edit-distance rerank catches them
+        self.assertResolves('onoin', 'Onion', exact=False)
+
+    def test_unknown_names_fall_below_threshold(self):
+        for text in ('kiwi', 'dragon fruit', 'wheat flour'):
+            self.assertIsNone(self.resolver.resolve_id(text), text)
+        self.assertIsNone(self.resolver.resolve(''))
+        self.assertIsNone(self.resolver.resolve('   '))
+
+    def test_near_misses_are_not_guessed(self):
+        # Close to several crops, or a product of one rather than the crop itself
+        for text in ('dal', 'gram', 'corn flour', 'sugar', 'potato chips'):
+            self.assertIsNone(self.resolver.resolve_id(text), text)
+        match = self.resolver.resolve('dal')
+        self.assertEqual(match.score, match.runner_up)
+
+    def test_lookup_never_guesses(self):
+        self.assertEqual(self.resolver.lookup_id('Tomatoes'), IDS['Tomato'])
+        self.assertEqual(self.resolver.lookup_id('पालक'), IDS['Spinach'])
+        self.assertIsNone(self.resolver.lookup_id('tomatoe'))
+        self.assertIsNone(self.resolver.lookup_id(None))
+
+    def test_mentions(self):
+        text = 'Should I sell my tamatar and basmati rice now, or wait? What about प्याज़'
+        self.assertEqual(self.resolver.mentions(text),
+                         sorted([IDS['Tomato'], IDS['Rice (Basmati)'], IDS['Onion']]))
+        self.assertEqual(self.resolver.mentions('what is the weather today'), [])
+
+    def test_lookup_is_sub_millisecond(self):
+        queries = ['tomatoes', 'corriander', 'onoin', 'gehun', 'dragon fruit']
+        started = time.perf_counter()
+        for _ in range(200):
+            for query in queries:
+                self.resolver.resolve(query)
+        per_lookup = (time.perf_counter() - started) / (200 * len(queries))
+        self.assertLess(per_lookup, 0.001)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import threading
+import time
+import unittest
+
+import psycopg2.extensions
+
+from db import ConnectionPool, DatabaseUnavailable
+
+
+class FakeConnection:
+    """Just enough of a psycopg2 connection for the pool."""
+
+    def __init__(self, number):
+        self.number = number
+        self.closed = 0
+        self.broken = False
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        self.pings = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        if self.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.pings += 1
+
+    def fetchone(self):
+        return (1,)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeConnect:
+    def __init__(self):
+        self.made = []
+
+    def __call__(self):
+        conn = FakeConnection(len(self.made) + 1)
+        self.made.append(conn)
+        return conn
+
+
+class TestConnectionPool(unittest.TestCase):
+    def pool(self, **kwargs):
+        self.connect = FakeConnect()
+        kwargs.setdefault('minconn', 0)
+        return ConnectionPool(connect=self.connect, **kwargs)
+
+    def test_checkout_times_out_when_exhausted(self):
+        pool = self.pool(maxconn=1, timeout=0.05)
+        conn = pool.getconn()
+        started = time.monotonic()
+        with self.assertRaises(DatabaseUnavailable):
+            pool.getconn()
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertEqual(pool.stats()["timeouts"], 1)
+
+        # A returned connection wakes a waiting caller
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+        pool.timeout = 5
+        waiter.start()
+        pool.putconn(conn)
+        waiter.join()
+        self.assertEqual(got, [conn])
+        self.assertEqual(pool.stats()["in_use"], 1)
+
+    def test_idle_connections_are_validated(self):
+        pool = self.pool(maxconn=2, validate_after=60)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(conn.pings, 0)
+        pool.putconn(conn)
+
+        pool.validate_after = 0
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(conn.pings, 1)
+        self.assertEqual(conn.rollbacks, 1)
+
+    def test_broken_connection_is_replaced(self):
+        pool = self.pool(maxconn=1, validate_after=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.broken = True
+        replacement = pool.getconn()
+        self.assertIsNot(replacement, conn)
+        self.assertTrue(conn.closed)
+        stats = pool.stats()
+        self.assertEqual((stats["discarded"], stats["connects"], stats["size"]), (1, 2, 1))
+
+    def test_discarded_on_return(self):
+        pool = self.pool(maxconn=2)
+        first, second = pool.getconn(), pool.getconn()
+        pool.putconn(first, discard=True)
+        second.close()
+        pool.putconn(second)
+        stats = pool.stats()
+        self.assertEqual((stats["discarded"], stats["idle"], stats["in_use"]), (2, 0, 0))
+
+    def test_open_transaction_is_rolled_back_on_return(self):
+        pool = self.pool(maxconn=1)
+        conn = pool.getconn()
+        conn.status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        pool.putconn(conn)
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertIs(pool.getconn(), conn)
+
+    def test_failed_connect_frees_the_slot(self):
+        pool = ConnectionPool(minconn=0, maxconn=1, connect=lambda: None)
+        for _ in range(2):
+            with self.assertRaises(DatabaseUnavailable):
+                pool.getconn()
+        stats = pool.stats()
+        self.assertEqual((stats["connect_failures"], stats["in_use"]), (2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import io
+import json
+import unittest
+
+from crop_resolver import CropResolver
+from farm_ingest import FarmRowValidator, bulk_format, read_csv_records, read_jsonl_records
+from seed_db import ALL_CROPS
+
+CROPS = list(enumerate(ALL_CROPS, 1))
+IDS = {name: crop_id for crop_id, name in CROPS}
+
+
+class CountingResolver(CropResolver):
+    def __init__(self, crops):
+        super().__init__(crops)
+        self.lookups = 0
+
+    def lookup_id(self, text):
+        self.lookups += 1
+        return super().lookup_id(text)
+
+
+class TestFarmIngest(unittest.TestCase):
+    def setUp(self):
+        self.resolver = CountingResolver(CROPS)
+        self.validator = FarmRowValidator(user_id=7, resolver=self.resolver)
+
+    def load(self, records):
+        return list(self.validator.rows(records))
+
+    def test_format_negotiation(self):
+        self.assertEqual(bulk_format(None, 'text/csv'), 'csv')
+        self.assertEqual(bulk_format(None, 'application/x-ndjson'), 'jsonl')
+        self.assertEqual(bulk_format('JSONL', 'application/octet-stream'), 'jsonl')
+        self.assertIsNone(bulk_format(None, 'application/json'))
+        self.assertIsNone(bulk_format('xml', 'text/csv'))
+
+    def test_csv_rows(self):
+        body = ('﻿Crop,Quantity_kg,harvest_date,location,user_id\r\n'
+                'tamatar,120.5,2024-03-01,"Nashik, MH",\r\n'
+                'Wheat,80,,Indore,7\r\n'
+                'Onion,50,,Indore,12\r\n').encode()
+        rows = self.load(read_csv_records(io.BytesIO(body)))
+        self.assertEqual(rows[0][:4], (2, 7, IDS['Tomato'], 120.5))
+        self.assertEqual(str(rows[0][4]), '2024-03-01')
+        self.assertEqual(rows[0][5], 'Nashik, MH')
+        self.assertEqual(rows[1][:3], (3, 7, IDS['Wheat']))
+        self.assertIsNone(rows[1][4])
+        # Rows can't be filed under another user
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(self.validator.errors, [{"line": 4, "error": "user_id 12 is not the uploading user"}])
+
+    def test_admin_upload_files_rows_per_member(self):
+        validator = FarmRowValidator(1, resolver=self.resolver, any_user=True)
+        body = ('crop,quantity_kg,user_id\n'
+                'Wheat,80,12\n'
+                'Onion,50,\n'
+                'Onion,50,0\n').encode()
+        rows = list(validator.rows(read_csv_records(io.BytesIO(body))))
+        self.assertEqual([row[:2] for row in rows], [(2, 12), (3, 1)])
+        self.assertIn("out of range", validator.errors[0]["error"])
+
+    def test_csv_without_crop_column_is_rejected(self):
+        with self.assertRaises(ValueError):
+            read_csv_records(io.BytesIO(b'name,quantity\nTomato,1\n'))
+
+    def test_per_row_errors_do_not_stop_the_batch(self):
+        lines = [
+            {"crop": "Onion", "quantity_kg": 10},
+            {"crop": "kiwi", "quantity_kg": 10},
+            "not json",
+            {"crop": "Onion", "quantity_kg": -1},
+            {"crop": "Onion", "quantity_kg": "lots"},
+            {"crop": "Onion", "quantity_kg": 5, "harvest_date": "01/03/2024"},
+            {"crop": "Onion", "quantity_kg": 5, "user_id": "abc"},
+            {"quantity_kg": 5},
+            [1, 2],
+            {"crop": "Onion", "quantity": 3, "location": "x" * 201},
+            {"crop_name": "pyaaz", "quantity": 3},
+        ]
+        body = '\n'.join(l if isinstance(l, str) else json.dumps(l) for l in lines).encode()
+        rows = self.load(read_jsonl_records(io.BytesIO(body)))
+
+        self.assertEqual([row[0] for row in rows], [1, 11])
+        self.assertEqual({row[2] for row in rows}, {IDS['Onion']})
+        self.assertEqual(self.validator.received, 11)
+        self.assertEqual(self.validator.error_count, 9)
+        errors = {e["line"]: e["error"] for e in self.validator.errors}
+        self.assertIn("unknown crop", errors[2])
+        self.assertIn("invalid JSON", errors[3])
+        self.assertIn("non-negative", errors[4])
+        self.assertIn("YYYY-MM-DD", errors[6])
+        self.assertIn("crop is required", errors[8])
+        self.assertIn("JSON object", errors[9])
+
+    def test_coordinates(self):
+        body = ('crop,quantity_kg,lat,lng\n'
+                'Onion,10,19.99,73.79\n'
+                'Onion,10,,\n'
+                'Onion,10,19.99,\n'
+                'Onion,10,95,73.79\n').encode()
+        rows = self.load(read_csv_records(io.BytesIO(body)))
+        self.assertEqual([row[-2:] for row in rows], [(19.99, 73.79), (None, None)])
+        errors = {e["line"]: e["error"] for e in self.validator.errors}
+        self.assertIn("together", errors[4])
+        self.assertIn("within", errors[5])
+
+    def test_near_miss_crop_names_are_errors(self):
+        body = '\n'.join(json.dumps({"crop": name, "quantity_kg": 1})
+                         for name in ['tomatoe', 'mustard oil', 'sugar', 'pyaaz']).encode()
+        rows = self.load(read_jsonl_records(io.BytesIO(body)))
+        self.assertEqual([row[0] for row in rows], [4])
+        errors = {e["line"]: e["error"] for e in self.validator.errors}
+        self.assertIn("did you mean 'Tomato'", errors[1])
+        self.assertIn("did you mean 'Mustard'", errors[2])
+        self.assertEqual(errors[3], "unknown crop 'sugar'")
+
+    def test_crop_names_resolved_once_per_spelling(self):
+        body = '\n'.join(json.dumps({"crop": name, "quantity_kg": 1})
+                         for name in ['Tomato', 'tomato', 'tamatar'] * 1000).encode()
+        rows = self.load(read_jsonl_records(io.BytesIO(body)))
+        self.assertEqual(len(rows), 3000)
+        self.assertEqual(self.resolver.lookups, 2)
+
+    def test_reported_errors_are_capped(self):
+        validator = FarmRowValidator(1, resolver=self.resolver, max_errors=5)
+        body = b'\n'.join(b'{"quantity_kg": 1}' for _ in range(50))
+        list(validator.rows(read_jsonl_records(io.BytesIO(body))))
+        self.assertEqual(validator.error_count, 50)
+        self.assertEqual(len(validator.errors), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
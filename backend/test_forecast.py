@@ -0,0 +1,196 @@
+import contextlib
+import io
+import unittest
+from datetime import timedelta
+
+import numpy as np
+
+from db import PGCOPY_HEADER, PGCOPY_TRAILER
+from forecast import HISTORY_ROW_DTYPE, fill_gaps, fit_forecast, run_forecasts
+from price_sim import COPY_ROW_DTYPE, PG_EPOCH
+
+nan = np.nan
+
+
+class TestFillGaps(unittest.TestCase):
+    def test_forward_fill_and_leading_gaps(self):
+        values = np.array([
+            [nan, nan, 3.0, nan, 5.0, nan],
+            [1.0, nan, nan, 4.0, nan, nan],
+            [2.0, 2.5, 3.0, 3.5, 4.0, 4.5],
+        ])
+        filled = fill_gaps(values)
+        np.testing.assert_array_equal(filled, [
+            [3.0, 3.0, 3.0, 3.0, 5.0, 5.0],
+            [1.0, 1.0, 1.0, 4.0, 4.0, 4.0],
+            [2.0, 2.5, 3.0, 3.5, 4.0, 4.5],
+        ])
+        # The caller's array is left alone
+        self.assertTrue(np.isnan(values[0, 0]))
+
+
+class TestFitForecast(unittest.TestCase):
+    def test_recovers_trend_and_weekly_season(self):
+        t = np.arange(195)
+        season = 4 * np.sin(2 * np.pi * t / 7)
+        truth = 50 + 0.3 * t + season
+        history = truth[:180] + np.random.default_rng(0).normal(0, 0.2, 180)
+
+        forecasts, best = fit_forecast(history[None, :], horizon=15)
+        self.assertEqual(forecasts.shape, (1, 15))
+        self.assertEqual(best.shape, (1,))
+        forecast = forecasts[0]
+
+        # Close in the first week; the damped trend drifts low after that
+        self.assertLess(np.abs(forecast[:7] - truth[180:187]).max(), 1.5)
+        slope, intercept = np.polyfit(t[180:], forecast, 1)
+        self.assertGreater(slope, 0.15)
+        residual = forecast - (slope * t[180:] + intercept)
+        self.assertGreater(np.corrcoef(residual, season[180:])[0, 1], 0.95)
+
+    def test_flat_series_with_gaps(self):
+        values = np.full((2, 60), 20.0)
+        values[0, ::3] = nan
+        values[1, :30] = nan
+        forecasts, _ = fit_forecast(values, horizon=5)
+        np.testing.assert_allclose(forecasts, 20.0)
+
+    def test_forecasts_never_go_below_a_paisa(self):
+        forecasts, _ = fit_forecast(np.linspace(50, 1, 60)[None, :], horizon=10)
+        self.assertEqual(forecasts.min(), 0.01)
+
+
+def history_copy(rows):
+    # COPY ... TO STDOUT (FORMAT binary) output for load_history
+    block = np.empty(len(rows), dtype=HISTORY_ROW_DTYPE)
+    block['fields'] = 4
+    block['market_len'] = block['last_len'] = block['offset_len'] = 4
+    block['price_len'] = 8
+    for i, row in enumerate(rows):
+        block['market_id'][i], block['last_day'][i], block['offset'][i], block['price'][i] = row
+    return PGCOPY_HEADER + block.tobytes() + PGCOPY_TRAILER
+
+
+class FakeForecastCursor:
+    """Serves forecast_dirty and price history, and records what gets written back."""
+
+    def __init__(self, dirty, history):
+        self.dirty = dirty  # [(crop_id, market_id, change_seq)]
+        self.history = history  # {(crop_id, market_id): (last_day, prices)}
+        self.statements = []
+        self.loaded = []  # (crop_id, market_ids) per load_history call
+        self.copied = {}
+        self.rowcount = -1
+        self._result = []
+        self._params = None
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+        self._result = list(self.dirty) if 'FROM forecast_dirty' in sql else []
+
+    def fetchall(self):
+        return self._result
+
+    def mogrify(self, sql, params):
+        self._params = params
+        return b'SELECT history'
+
+    def copy_expert(self, sql, file, size=8192):
+        if 'TO STDOUT' in sql:
+            crop_id, market_ids = self._params[0], self._params[1]
+            self.loaded.append((crop_id, sorted(market_ids)))
+            rows = []
+            for market_id in market_ids:
+                if (crop_id, market_id) not in self.history:
+                    continue
+                last_day, prices = self.history[crop_id, market_id]
+                rows += [(market_id, last_day, offset, price)
+                         for offset, price in zip(range(1 - len(prices), 1), prices)]
+            file.write(history_copy(rows))
+            return
+        table = sql.split()[1]
+        data = file.read()
+        if 'binary' in sql:
+            self.copied[table] = np.frombuffer(data[len(PGCOPY_HEADER):-len(PGCOPY_TRAILER)], dtype=COPY_ROW_DTYPE)
+            self.rowcount = len(self.copied[table])
+        else:
+            self.copied[table] = [line.split('\t') for line in data.decode('utf-8').splitlines()]
+            self.rowcount = len(self.copied[table])
+
+    def close(self):
+        pass
+
+
+class FakeForecastConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.commits = 0
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    @contextlib.contextmanager
+    def __call__(self):
+        yield self
+
+
+class TestRunForecasts(unittest.TestCase):
+    LAST_DAY = 9000  # days since PG_EPOCH
+
+    def run_job(self, dirty, full=False):
+        prices = 20 + np.sin(np.arange(40))
+        history = {
+            (1, market_id): (self.LAST_DAY, prices) for market_id in (10, 11, 12)
+        }
+        history[2, 10] = (self.LAST_DAY - 3, prices[:30])
+        cur = FakeForecastCursor(dirty, history)
+        conn = FakeForecastConnection(cur)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_forecasts(full=full, horizon=5, window=40, workers=1, connection=conn)
+        return result, cur, conn
+
+    def test_only_dirty_series_are_refit(self):
+        (series, written), cur, conn = self.run_job([(1, 11, 7), (2, 10, 8)])
+        self.assertEqual((series, written), (2, 10))
+        self.assertEqual(conn.commits, 1)
+        # History is read for the dirty markets only, one crop at a time
+        self.assertEqual(cur.loaded, [(1, [11]), (2, [10])])
+
+        staged = cur.copied['forecast_staging']
+        self.assertEqual(sorted(set(zip(staged['crop_id'].tolist(), staged['market_id'].tolist()))),
+                         [(1, 11), (2, 10)])
+        self.assertTrue(staged['is_predicted'].all())
+        crop1 = staged[staged['crop_id'] == 1]
+        self.assertEqual(crop1['date'].tolist(), list(range(self.LAST_DAY + 1, self.LAST_DAY + 6)))
+
+        # Each series is marked clean against the change_seq it was read at
+        self.assertEqual(cur.copied['forecast_batch'], [
+            ['11', '1', (PG_EPOCH + timedelta(days=self.LAST_DAY)).isoformat(), '7'],
+            ['10', '2', (PG_EPOCH + timedelta(days=self.LAST_DAY - 3)).isoformat(), '8'],
+        ])
+        self.assertFalse(any('INSERT INTO forecast_dirty' in sql for sql in cur.statements))
+
+    def test_series_without_history_only_clears_old_forecasts(self):
+        (series, written), cur, _ = self.run_job([(1, 99, 3)])
+        self.assertEqual((series, written), (0, 0))
+        self.assertEqual(len(cur.copied['forecast_staging']), 0)
+        self.assertEqual(cur.copied['forecast_batch'], [['99', '1', '\\N', '3']])
+
+    def test_nothing_dirty_writes_nothing(self):
+        result, cur, conn = self.run_job([])
+        self.assertEqual(result, (0, 0))
+        self.assertEqual((cur.loaded, cur.copied, conn.commits), ([], {}, 1))
+
+    def test_full_run_marks_every_series_dirty(self):
+        _, cur, _ = self.run_job([(1, 10, 1)], full=True)
+        self.assertIn('INSERT INTO forecast_dirty', cur.statements[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import math
+import time
+import unittest
+
+import numpy as np
+
+from geo_index import EARTH_RADIUS_KM, MarketIndex
+from seed_db import MARKETS
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class TestMarketIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(7)
+        # Tens of thousands of markets spread over India
+        cls.points = list(zip(range(1, 30001), rng.uniform(8, 35, 30000).tolist(),
+                              rng.uniform(68, 97, 30000).tolist()))
+        cls.index = MarketIndex(cls.points)
+        cls.rng = rng
+
+    def brute_force(self, lat, lng, k, radius_km=None):
+        scored = sorted((haversine_km(lat, lng, p_lat, p_lng), m_id) for m_id, p_lat, p_lng in self.points)
+        if radius_km is not None:
+            scored = [s for s in scored if s[0] <= radius_km]
+        return scored[:k]
+
+    def test_matches_brute_force(self):
+        for i in range(25):
+            lat, lng = self.rng.uniform(5, 38), self.rng.uniform(65, 100)
+            k = int(self.rng.integers(1, 40))
+            radius = (None, 10.0, 60.0)[i % 3]
+            got = self.index.nearest(lat, lng, k, radius)
+            expected = self.brute_force(lat, lng, k, radius)
+            self.assertEqual([m for m, _ in got], [m for _, m in expected])
+            for (_, distance), (exact, _) in zip(got, expected):
+                self.assertAlmostEqual(distance, exact, places=6)
+
+    def test_seeded_markets(self):
+        rows = [(i, m['lat'], m['lng']) for i, m in enumerate(MARKETS, 1)]
+        index = MarketIndex(rows + [(99, None, None)])
+        self.assertEqual(index.size, len(MARKETS))
+        # North Delhi: the three Delhi mandis, closest first, before any other city
+        nearest = index.nearest(28.73, 77.12, k=3)
+        self.assertEqual([MARKETS[m - 1]['name'] for m, _ in nearest], ['Azadpur Mandi', 'Keshopur', 'Ghazipur'])
+        self.assertLess(nearest[0][1], 5)
+        self.assertEqual(index.nearest(0.0, -30.0, k=5, radius_km=100), [])
+
+    def test_antimeridian_and_poles(self):
+        index = MarketIndex([(1, 0.0, 179.9), (2, 0.0, -179.9), (3, 89.9, 0.0), (4, 0.0, 0.0)])
+        self.assertEqual([m for m, _ in index.nearest(0.0, 180.0, k=2)], [1, 2])
+        self.assertEqual(index.nearest(90.0, 45.0, k=1)[0][0], 3)
+
+    def test_empty_index(self):
+        self.assertEqual(MarketIndex([]).nearest(20.0, 78.0), [])
+
+    def test_query_is_sub_millisecond(self):
+        started = time.perf_counter()
+        for _ in range(200):
+            self.index.nearest(20.5, 78.9, k=10)
+            self.index.nearest(12.9, 77.6, k=5, radius_km=25)
+        self.assertLess((time.perf_counter() - started) / 400, 0.001)
+
+
+if __name__ == '__main__':
+    unittest.main()
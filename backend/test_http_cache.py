@@ -0,0 +1,119 @@
+import datetime
+import gzip
+import json
+import unittest
+
+from flask import Flask, Response, jsonify
+
+import http_cache
+from http_cache import add_validators, init_compression, is_not_modified, make_etag, not_modified_response
+
+UPDATED = datetime.datetime(2024, 3, 1, 12, 30, 15, 250000, tzinfo=datetime.timezone.utc)
+ROWS = [{"date": f"2024-01-{d:02d}", "price": 10.5 + d} for d in range(1, 29)] * 4
+
+
+def create_test_app():
+    app = Flask(__name__)
+    init_compression(app)
+
+    @app.route('/prices')
+    def prices():
+        etag = make_etag('prices', 7)
+        if is_not_modified(etag, UPDATED):
+            return not_modified_response(app, etag, UPDATED)
+        return add_validators(jsonify(ROWS), etag, UPDATED)
+
+    @app.route('/small')
+    def small():
+        return jsonify({"ok": True})
+
+    @app.route('/events')
+    def events():
+        return Response((f"data: {i}\n\n" for i in range(200)), mimetype='text/event-stream')
+
+    @app.route('/stream')
+    def stream():
+        return Response((json.dumps(row) + "\n" for row in ROWS), mimetype='application/json')
+
+    return app
+
+
+class TestValidators(unittest.TestCase):
+    def setUp(self):
+        self.client = create_test_app().test_client()
+
+    def test_matching_etag_is_not_modified(self):
+        first = self.client.get('/prices')
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        self.assertEqual(first.headers['Cache-Control'], 'no-cache')
+
+        again = self.client.get('/prices', headers={'If-None-Match': etag})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.data, b'')
+        self.assertEqual(again.headers['ETag'], etag)
+
+    def test_etag_covers_the_query_string(self):
+        etag = self.client.get('/prices?crop=Tomato').headers['ETag']
+        self.assertNotEqual(etag, self.client.get('/prices?crop=Onion').headers['ETag'])
+        response = self.client.get('/prices?crop=Onion', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since(self):
+        # HTTP dates have whole seconds; the sub-second part must not defeat the check
+        since = UPDATED.strftime('%a, %d %b %Y %H:%M:%S GMT')
+        self.assertEqual(self.client.get('/prices', headers={'If-Modified-Since': since}).status_code, 304)
+        earlier = (UPDATED - datetime.timedelta(seconds=1)).strftime('%a, %d %b %Y %H:%M:%S GMT')
+        self.assertEqual(self.client.get('/prices', headers={'If-Modified-Since': earlier}).status_code, 200)
+
+    def test_etag_wins_over_if_modified_since(self):
+        since = UPDATED.strftime('%a, %d %b %Y %H:%M:%S GMT')
+        response = self.client.get('/prices', headers={'If-None-Match': 'W/"stale"', 'If-Modified-Since': since})
+        self.assertEqual(response.status_code, 200)
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.client = create_test_app().test_client()
+
+    def test_gzip(self):
+        response = self.client.get('/prices', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.data)), ROWS)
+
+    @unittest.skipIf(http_cache.brotli is None, "brotli is not installed")
+    def test_brotli_preferred(self):
+        response = self.client.get('/prices', headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(http_cache.brotli.decompress(response.data)), ROWS)
+
+    def test_identity_and_small_bodies_are_untouched(self):
+        response = self.client.get('/prices')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.json, ROWS)
+        response = self.client.get('/small', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_not_modified_is_not_compressed(self):
+        etag = self.client.get('/prices').headers['ETag']
+        response = self.client.get('/prices', headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_streamed_json_is_gzipped_incrementally(self):
+        response = self.client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        lines = gzip.decompress(response.data).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line) for line in lines], ROWS)
+
+    def test_event_stream_is_never_compressed(self):
+        response = self.client.get('/events', headers={'Accept-Encoding': 'gzip, br'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertTrue(response.data.startswith(b'data: 0\n\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
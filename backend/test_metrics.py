@@ -0,0 +1,97 @@
+import json
+import logging
+import time
+import unittest
+
+from flask import Flask, jsonify
+
+from metrics import (Histogram, JsonFormatter, add_phase, init_metrics, metrics_response, redact, registry,
+                     statement_type, upstream_timer)
+
+
+def make_app():
+    app = Flask(__name__)
+    init_metrics(app)
+
+    @app.route('/items/<int:item_id>')
+    def item(item_id):
+        add_phase('db', 0.002)
+        return jsonify({"id": item_id})
+
+    @app.route('/metrics')
+    def metrics():
+        return metrics_response()
+
+    return app
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_exposition(self):
+        hist = Histogram('demo_seconds', "Demo", ('route',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            hist.observe(value, '/a')
+        lines = list(hist.collect())
+        self.assertIn('demo_seconds_bucket{route="/a",le="0.1"} 2', lines)
+        self.assertIn('demo_seconds_bucket{route="/a",le="1.0"} 3', lines)
+        self.assertIn('demo_seconds_bucket{route="/a",le="+Inf"} 4', lines)
+        self.assertIn('demo_seconds_count{route="/a"} 4', lines)
+
+    def test_request_metrics_and_server_timing(self):
+        client = make_app().test_client()
+        response = client.get('/items/7', headers={'X-Request-ID': 'abc123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Request-ID'], 'abc123')
+        timing = response.headers['Server-Timing']
+        self.assertIn('db;dur=2.0', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('total;dur=', timing)
+        client.get('/nope')
+
+        body = client.get('/metrics').get_data(as_text=True)
+        # Routes are labelled by rule, not by URL, so ids don't explode cardinality
+        self.assertIn('http_requests_total{route="/items/<int:item_id>",method="GET",status="200"}', body)
+        self.assertIn('route="<unmatched>",method="GET",status="404"', body)
+        self.assertIn('http_request_phase_seconds_count{route="/items/<int:item_id>",phase="db"}', body)
+
+    def test_statement_type(self):
+        self.assertEqual(statement_type("\n  -- latest first\n  SELECT 1"), 'select')
+        self.assertEqual(statement_type(b"COPY t FROM STDIN"), 'copy')
+        self.assertEqual(statement_type(object()), 'other')
+
+    def test_upstream_timer_outcome(self):
+        with upstream_timer('demo_service'):
+            pass
+        with self.assertRaises(ValueError):
+            with upstream_timer('demo_service'):
+                raise ValueError()
+        body = registry.render()
+        self.assertIn('upstream_request_duration_seconds_count{service="demo_service",outcome="ok"} 1', body)
+        self.assertIn('upstream_request_duration_seconds_count{service="demo_service",outcome="error"} 1', body)
+
+    def test_redaction(self):
+        data = {"name": "Asha", "email": "asha@example.com", "phone": "9876543210",
+                "password": "hunter2", "nested": {"api_key": "k", "tokens": ["t"]}}
+        clean = redact(data)
+        self.assertEqual(clean["name"], "Asha")
+        self.assertEqual(clean["email"], "a***@example.com")
+        self.assertEqual(clean["phone"], "********10")
+        self.assertEqual(clean["password"], "[redacted]")
+        self.assertEqual(clean["nested"], {"api_key": "[redacted]", "tokens": ["[redacted]"]})
+
+        record = logging.LogRecord('api', logging.INFO, __file__, 1, "Signup request", None, None)
+        record.fields = {"email": "asha@example.com", "password": "hunter2"}
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry["msg"], "Signup request")
+        self.assertNotIn("hunter2", json.dumps(entry))
+
+    def test_overhead_is_small(self):
+        hist = Histogram('overhead_seconds', "Overhead", ('route', 'method'))
+        started = time.perf_counter()
+        for i in range(100000):
+            hist.observe(i * 1e-6, '/prices', 'GET')
+        # A few microseconds per observation at most
+        self.assertLess((time.perf_counter() - started) / 100000, 5e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
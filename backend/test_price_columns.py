@@ -0,0 +1,100 @@
+import datetime
+import json
+import time
+import unittest
+
+import numpy as np
+from werkzeug.datastructures import MIMEAccept
+
+from price_columns import (DAY_ROW_DTYPE, PRICE_EPOCH, ROLLUP_ROW_DTYPE, available, decode_rows,
+                           encode_price_columns, row_cursor, wants_msgpack)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+NAMES = {1: 'Tomato', 2: 'Onion', 10: 'Azadpur Mandi', 20: 'Vashi Market'}
+LOOKUPS = dict(crop_name=NAMES.get, market_name=NAMES.get)
+
+
+def copy_data(dtype, **columns):
+    """Tuple data as Postgres' binary COPY sends it: field count, then (length, value) per field."""
+    n = len(next(iter(columns.values())))
+    rows = np.zeros(n, dtype=dtype)
+    rows['fields'] = len(dtype.names) // 2
+    for length, value in zip(dtype.names[1::2], dtype.names[2::2]):
+        rows[length] = dtype[value].itemsize
+    for name, values in columns.items():
+        rows[name] = values
+    return rows.tobytes()
+
+
+@unittest.skipIf(msgpack is None, "msgpack is not installed")
+class TestPriceColumns(unittest.TestCase):
+    def test_day_rows_round_trip(self):
+        day = (datetime.date(2024, 3, 4) - PRICE_EPOCH).days
+        data = copy_data(DAY_ROW_DTYPE, day=[day, day, day + 1], price=[21.5, 30.25, 22.0],
+                         predicted=[0, 0, 1], crop_id=[1, 2, 1], market_id=[20, 10, 20], key=[7, 8, 9])
+        rows = decode_rows(data, 'day')
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(row_cursor(rows, 2), (datetime.date(2024, 3, 5), 9))
+
+        body = msgpack.unpackb(encode_price_columns(rows, 'day', **LOOKUPS))
+        self.assertEqual(body['count'], 3)
+        self.assertEqual(body['crops'], ['Tomato', 'Onion'])
+        self.assertEqual(body['markets'], ['Azadpur Mandi', 'Vashi Market'])
+        column = lambda name: np.frombuffer(body[name], dtype=body['dtypes'][name])
+        self.assertEqual(column('date').tolist(), [day, day, day + 1])
+        self.assertEqual(column('price').tolist(), [21.5, 30.25, 22.0])
+        self.assertEqual(column('is_predicted').tolist(), [0, 0, 1])
+        self.assertEqual([body['crops'][i] for i in column('crop')], ['Tomato', 'Onion', 'Tomato'])
+        self.assertEqual([body['markets'][i] for i in column('market')],
+                         ['Vashi Market', 'Azadpur Mandi', 'Vashi Market'])
+        self.assertNotIn('open', body)
+
+    def test_rollup_rows_carry_candles(self):
+        data = copy_data(ROLLUP_ROW_DTYPE, day=[8830], price=[20.0], predicted=[0], crop_id=[1], market_id=[10],
+                         key=[20], open=[19.0], high=[22.0], low=[18.5], close=[21.0], days=[7])
+        body = msgpack.unpackb(encode_price_columns(decode_rows(data, 'week'), 'week', **LOOKUPS))
+        self.assertEqual(np.frombuffer(body['low'], dtype=body['dtypes']['low']).tolist(), [18.5])
+        self.assertEqual(np.frombuffer(body['days'], dtype=body['dtypes']['days']).tolist(), [7])
+
+    def test_empty_result(self):
+        body = msgpack.unpackb(encode_price_columns(decode_rows(b'', 'day'), 'day', **LOOKUPS))
+        self.assertEqual((body['count'], body['crops'], body['date']), (0, [], b''))
+
+    def test_negotiation(self):
+        self.assertTrue(available())
+        self.assertTrue(wants_msgpack(MIMEAccept([('application/x-msgpack', 1)])))
+        self.assertTrue(wants_msgpack(MIMEAccept([('application/json', 0.5), ('application/msgpack', 1)])))
+        self.assertFalse(wants_msgpack(MIMEAccept([('*/*', 1)])))
+        self.assertFalse(wants_msgpack(MIMEAccept([])))
+
+    def test_smaller_and_faster_than_json(self):
+        n = 200000
+        rng = np.random.default_rng(1)
+        columns = dict(day=8800 + np.arange(n) // 100, price=rng.uniform(10, 60, n).astype(np.float32),
+                       predicted=np.zeros(n), crop_id=rng.choice([1, 2], n), market_id=rng.choice([10, 20], n),
+                       key=np.arange(n))
+        data = copy_data(DAY_ROW_DTYPE, **columns)
+
+        started = time.perf_counter()
+        packed = encode_price_columns(decode_rows(data, 'day'), 'day', **LOOKUPS)
+        columnar_time = time.perf_counter() - started
+
+        # The JSON path: one dict per row, as format_price_row builds them
+        tuples = list(zip((PRICE_EPOCH + datetime.timedelta(days=int(d)) for d in columns['day']),
+                          columns['price'].tolist(), [False] * n, columns['crop_id'].tolist(),
+                          columns['market_id'].tolist()))
+        started = time.perf_counter()
+        text = json.dumps([{"date": d.strftime('%Y-%m-%d'), "price": float(p), "is_predicted": pred,
+                            "crop": NAMES.get(c), "market": NAMES.get(m)} for d, p, pred, c, m in tuples])
+        json_time = time.perf_counter() - started
+
+        self.assertLess(len(packed) * 5, len(text))
+        self.assertLess(columnar_time * 5, json_time)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import datetime
+import io
+import json
+import unittest
+
+import numpy as np
+
+from crop_resolver import CropResolver
+from price_ingest import FEED_ROW_DTYPE, PriceFeedEncoder, read_json_array_feed, read_price_feed
+from price_sim import PG_EPOCH
+from seed_db import ALL_CROPS
+
+CROPS = list(enumerate(ALL_CROPS, 1))
+IDS = {name: crop_id for crop_id, name in CROPS}
+MARKETS = {'Azadpur Mandi': 1, 'Vashi Market': 2}
+
+
+def day_number(iso):
+    return (datetime.date.fromisoformat(iso) - PG_EPOCH).days
+
+
+class TestPriceIngest(unittest.TestCase):
+    def setUp(self):
+        self.encoder = PriceFeedEncoder(CropResolver(CROPS), find_market=MARKETS.get)
+
+    def decode(self, fmt, body):
+        data = b''.join(self.encoder.chunks(read_price_feed(io.BytesIO(body), fmt)))
+        return np.frombuffer(data, dtype=FEED_ROW_DTYPE)
+
+    def test_csv_feed(self):
+        body = (b'market,crop,date,price_per_kg,is_predicted\n'
+                b'Azadpur Mandi,Tomatoes,2024-05-01,41.237,false\n'
+                b'Vashi Market,pyaaz,2024-05-01,30,true\n')
+        rows = self.decode('csv', body)
+        self.assertEqual(rows['line'].tolist(), [2, 3])
+        self.assertEqual(rows['market_id'].tolist(), [1, 2])
+        self.assertEqual(rows['crop_id'].tolist(), [IDS['Tomato'], IDS['Onion']])
+        self.assertEqual(rows['price'].tolist(), [41.24, 30.0])
+        self.assertEqual(rows['date'].tolist(), [day_number('2024-05-01')] * 2)
+        self.assertEqual(rows['is_predicted'].tolist(), [0, 1])
+        self.assertTrue((rows['fields'] == 6).all())
+
+    def test_agmarknet_columns(self):
+        # modal_price is INR per quintal and dates are DD/MM/YYYY
+        body = (b'State,District,Market,Commodity,Variety,Arrival_Date,Min_Price,Max_Price,Modal_Price\n'
+                b'Delhi,Delhi,Azadpur Mandi,Onion,Red,03/05/2024,1800,2600,2250\n')
+        rows = self.decode('csv', body)
+        self.assertEqual(rows['price'].tolist(), [22.5])
+        self.assertEqual(rows['date'].tolist(), [day_number('2024-05-03')])
+        self.assertEqual(rows['is_predicted'].tolist(), [0])
+
+    def test_missing_columns_rejected_up_front(self):
+        with self.assertRaises(ValueError):
+            read_price_feed(io.BytesIO(b'market,crop,price\nA,B,1\n'), 'csv')
+
+    def test_bad_rows_are_reported(self):
+        body = (b'market,crop,date,price_per_kg\n'
+                b'Azadpur Mandi,Wheat,2024-05-01,30\n'
+                b'Nowhere,Wheat,2024-05-01,30\n'
+                b'Azadpur Mandi,kiwi,2024-05-01,30\n'
+                b'Azadpur Mandi,Wheat,May 1,30\n'
+                b'Azadpur Mandi,Wheat,2024-05-01,-2\n'
+                b'Azadpur Mandi,Wheat,2024-05-01,nan\n'
+                b'Azadpur Mandi,Wheat\n')
+        rows = self.decode('csv', body)
+        self.assertEqual(rows['line'].tolist(), [2])
+        self.assertEqual(self.encoder.received, 7)
+        errors = {e['line']: e['error'] for e in self.encoder.errors}
+        self.assertEqual(sorted(errors), [3, 4, 5, 6, 7, 8])
+        self.assertIn('unknown market', errors[3])
+        self.assertIn('unknown crop', errors[4])
+        self.assertIn('date', errors[5])
+        self.assertIn('positive', errors[6])
+        self.assertIn('positive', errors[7])
+        self.assertIn('missing columns', errors[8])
+
+    def test_products_are_not_taken_for_their_crop(self):
+        products = ['Sugar', 'Mustard Oil', 'Groundnut Oil', 'Coconut Oil', 'Soyabean Oil', 'Sunflower Oil',
+                    'Cotton Seed', 'Dry Chillies', 'Potato Chips', 'Black Gram Dal']
+        body = ('market,crop,date,price_per_kg\n'
+                + ''.join(f'Azadpur Mandi,{name},2024-05-01,30\n' for name in products)
+                + 'Azadpur Mandi,Mustard,2024-05-01,60\n').encode()
+        rows = self.decode('csv', body)
+        self.assertEqual(rows['crop_id'].tolist(), [IDS['Mustard']])
+        self.assertEqual([e['error'] for e in self.encoder.errors],
+                         [f"unknown crop '{name}'" for name in products])
+
+    def test_json_array_streamed_across_chunks(self):
+        records = [{"Market": "Vashi Market", "crop": "Wheat", "date": "2024-05-01",
+                    "price_per_kg": 30 + i, "is_predicted": i % 2 == 0} for i in range(500)]
+        records.insert(3, {"market": ["nested"], "crop": "Wheat", "date": "2024-05-01", "price_per_kg": 1})
+        body = json.dumps(records, indent=2).encode()
+        # Small chunks force elements to straddle buffer boundaries
+        data = b''.join(self.encoder.chunks(read_json_array_feed(io.BytesIO(body), chunk_size=64)))
+        rows = np.frombuffer(data, dtype=FEED_ROW_DTYPE)
+        self.assertEqual(len(rows), 500)
+        self.assertEqual(rows['price'][:3].tolist(), [30.0, 31.0, 32.0])
+        self.assertEqual(rows['is_predicted'][:2].tolist(), [1, 0])
+        self.assertEqual([e['line'] for e in self.encoder.errors], [4])
+
+    def test_json_array_must_be_an_array(self):
+        with self.assertRaises(ValueError):
+            list(read_price_feed(io.BytesIO(b'{"market": "x"}'), 'json'))
+        with self.assertRaises(ValueError):
+            list(read_price_feed(io.BytesIO(b'[{"market": "x"} {"market": "y"}]'), 'json'))
+        self.assertEqual(list(read_price_feed(io.BytesIO(b' [ ] '), 'json')), [])
+
+    def test_jsonl_feed(self):
+        body = b'{"market": "Azadpur Mandi", "crop": "Wheat", "date": "2024-05-01", "price_per_kg": 31.5}\nnope\n'
+        rows = self.decode('jsonl', body)
+        self.assertEqual(rows['price'].tolist(), [31.5])
+        self.assertEqual(self.encoder.errors[0]['line'], 2)
+
+    def test_batches_bound_memory(self):
+        lines = [b'market,crop,date,price_per_kg']
+        lines += [b'Azadpur Mandi,Wheat,2024-05-01,%d' % (i + 1) for i in range(2500)]
+        encoder = PriceFeedEncoder(CropResolver(CROPS), find_market=MARKETS.get, batch_rows=1000)
+        chunks = list(encoder.chunks(read_price_feed(io.BytesIO(b'\n'.join(lines)), 'csv')))
+        self.assertEqual([len(c) // FEED_ROW_DTYPE.itemsize for c in chunks], [1000, 1000, 500])
+        self.assertEqual(encoder.staged, 2500)
+
+
+if __name__ == '__main__':
+    unittest.main()
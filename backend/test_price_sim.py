@@ -0,0 +1,51 @@
+import csv
+import os
+import tempfile
+import unittest
+from datetime import date
+
+import numpy as np
+
+from price_sim import BASE_PRICE_MAP, DEFAULT_BASE, price_dates, simulate_prices, write_csv
+
+CROPS = ['Tomato', 'Wheat', 'Green Chilli', 'Dragon Fruit']
+
+
+class TestPriceSim(unittest.TestCase):
+    def test_same_seed_same_prices(self):
+        first = simulate_prices(CROPS, 3, 30, seed=7)
+        self.assertTrue(np.array_equal(first, simulate_prices(CROPS, 3, 30, seed=7)))
+        self.assertFalse(np.array_equal(first, simulate_prices(CROPS, 3, 30, seed=8)))
+
+    def test_shape_and_dates(self):
+        prices = simulate_prices(CROPS, 5, 11, seed=1)
+        self.assertEqual(prices.shape, (5, len(CROPS), 11))
+        self.assertEqual(prices.dtype, np.float32)
+
+        start = date(2024, 3, 1)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'prices.csv')
+            write_csv(path, prices, [f"Market {m}" for m in range(5)], CROPS, start)
+            with open(path, encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 5 * len(CROPS) * 11)
+        self.assertEqual(rows[0]['date'], '2024-03-01')
+        self.assertEqual(rows[10]['date'], '2024-03-11')
+        self.assertEqual(max(row['date'] for row in rows), price_dates(start, 11)[-1].isoformat())
+        # Actual prices only; forecasts come from forecast.py
+        self.assertEqual({row['is_predicted'] for row in rows}, {'false'})
+
+    def test_prices_stay_within_clamps(self):
+        # Long enough for the volatile crops to run into both bounds
+        prices = simulate_prices(CROPS, 20, 2000, seed=3)
+        for c, crop in enumerate(CROPS):
+            base = BASE_PRICE_MAP.get(crop, DEFAULT_BASE)[0]
+            series = prices[:, c, :]
+            self.assertGreaterEqual(series.min(), np.float32(base * 0.4), crop)
+            self.assertLessEqual(series.max(), np.float32(base * 2.5), crop)
+        chilli = prices[:, CROPS.index('Green Chilli'), :]
+        self.assertAlmostEqual(float(chilli.min()), 60 * 0.4, places=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import datetime
+import time
+import unittest
+
+import numpy as np
+
+from geo_index import unit_vectors
+from profit import (SPOILAGE_RATE_PER_DAY, TRANSPORT_COST_PER_KM, MarketArrays, evaluate_lots,
+                    recommend)
+from seed_db import MARKETS
+
+NO_FARM = np.full((1, 3), np.nan)
+
+
+def market_rows():
+    return [(i, m['name'], m['location'], m['lat'], m['lng'], m['risk'])
+            for i, m in enumerate(MARKETS, 1)]
+
+
+def brute_force(quantity, ready, prices, distance, rates):
+    best = (-np.inf, None, None)
+    for m in range(prices.shape[0]):
+        for day in range(ready, prices.shape[1]):
+            if np.isnan(prices[m, day]) or np.isnan(distance[m]):
+                continue
+            gross = prices[m, day] * quantity
+            spoiled = min(1.0, rates[m] * (day - ready + distance[m] / 400.0))
+            net = gross * (1 - spoiled) - TRANSPORT_COST_PER_KM * distance[m] * np.ceil(quantity / 10000.0)
+            if net > best[0]:
+                best = (net, m, day)
+    return best
+
+
+class TestProfit(unittest.TestCase):
+    def setUp(self):
+        self.markets = MarketArrays(market_rows())
+        self.names = self.markets.names
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(3)
+        num_markets, num_days = len(self.markets.ids), 16
+        cube = rng.uniform(10, 60, (4, num_markets, num_days))
+        cube[rng.random(cube.shape) < 0.2] = np.nan
+        quantity = rng.uniform(50, 25000, 40)
+        ready = rng.integers(0, 5, 40)
+        crops = rng.integers(0, 4, 40)
+        lat, lng = rng.uniform(10, 30, 40), rng.uniform(72, 88, 40)
+        farm_xyz = unit_vectors(lat, lng)
+
+        result = evaluate_lots(quantity, ready, crops, farm_xyz, cube, self.markets.xyz, self.markets.spoilage_rate)
+        for i in range(40):
+            chord = np.sqrt(((self.markets.xyz - farm_xyz[i]) ** 2).sum(axis=1))
+            distance = 2.0 * 6371.0088 * np.arcsin(chord / 2.0)
+            net, m, day = brute_force(quantity[i], ready[i], cube[crops[i]], distance, self.markets.spoilage_rate)
+            self.assertEqual((result["market"][i], result["day"][i]), (m, day))
+            self.assertAlmostEqual(result["net"][i], net, places=4)
+            self.assertAlmostEqual(result["gross"][i] - result["spoilage"][i] - result["transport"][i], net, places=4)
+
+    def test_waits_for_a_better_price_only_when_it_pays(self):
+        cube = np.full((1, len(self.markets.ids), 3), np.nan)
+        azadpur = self.names.index('Azadpur Mandi')
+        cube[0, azadpur] = [20.0, 20.0, 40.0]
+        farm = unit_vectors([28.73], [77.12])
+        result = evaluate_lots(np.array([1000.0]), np.array([0]), np.array([0]), farm, cube,
+                               self.markets.xyz, self.markets.spoilage_rate)
+        self.assertEqual((result["market"][0], result["day"][0]), (azadpur, 2))
+
+        cube[0, azadpur] = [20.0, 20.0, 20.05]
+        result = evaluate_lots(np.array([1000.0]), np.array([0]), np.array([0]), farm, cube,
+                               self.markets.xyz, self.markets.spoilage_rate)
+        self.assertEqual(result["day"][0], 0)
+
+    def test_lot_is_not_sold_before_harvest(self):
+        cube = np.full((1, len(self.markets.ids), 5), 30.0)
+        cube[0, :, :3] = 100.0
+        result = evaluate_lots(np.array([100.0]), np.array([3]), np.array([0]), NO_FARM, cube,
+                               self.markets.xyz, self.markets.spoilage_rate)
+        self.assertEqual(result["day"][0], 3)
+        # Unknown farm position: no transport and no distance reported
+        self.assertEqual(result["transport"][0], 0)
+        self.assertTrue(np.isnan(result["distance"][0]))
+
+    def test_no_usable_price(self):
+        cube = np.full((1, len(self.markets.ids), 4), np.nan)
+        cube[0, 0, 1] = 50.0
+        result = evaluate_lots(np.array([100.0]), np.array([2]), np.array([0]), NO_FARM, cube,
+                               self.markets.xyz, self.markets.spoilage_rate)
+        self.assertEqual(result["net"][0], -np.inf)
+
+    def test_recommend_with_city_fallback(self):
+        today = datetime.date(2024, 3, 1)
+        cube = np.full((1, len(self.markets.ids), 4), np.nan)
+        cube[0, :, 0] = 25.0
+        lots = [
+            (1, 7, 42, 500.0, datetime.date(2024, 2, 20), 'Near Bangalore', None, None),
+            (2, 7, 42, 500.0, today + datetime.timedelta(days=9), 'Nowhere', None, None),
+            (3, 7, 42, 500.0, None, 'Field 4', 19.07, 72.88),
+        ]
+        recs = dict((lot[0], rec) for lot, rec in recommend(lots, self.markets, cube, {42: 0}, today))
+        self.assertEqual(self.markets.ids[self.names.index(recs[1]["market"])], recs[1]["market_id"])
+        self.assertEqual(MARKETS[recs[1]["market_id"] - 1]['location'], 'Bangalore')
+        self.assertEqual(recs[1]["sell_date"], today)
+        self.assertIsNone(recs[2])  # harvested after the horizon
+        self.assertEqual(MARKETS[recs[3]["market_id"] - 1]['location'], 'Mumbai')
+        self.assertLess(recs[3]["distance_km"], 50)
+
+    def test_spoilage_rates_cover_seeded_risks(self):
+        self.assertTrue({m['risk'] for m in MARKETS} <= set(SPOILAGE_RATE_PER_DAY))
+
+    def test_many_lots_are_fast(self):
+        rng = np.random.default_rng(5)
+        num_markets, num_days, lots = 500, 16, 10000
+        cube = rng.uniform(10, 60, (20, num_markets, num_days))
+        market_xyz = unit_vectors(rng.uniform(8, 35, num_markets), rng.uniform(68, 97, num_markets))
+        rates = rng.choice(list(SPOILAGE_RATE_PER_DAY.values()), num_markets)
+        farm_xyz = unit_vectors(rng.uniform(8, 35, lots), rng.uniform(68, 97, lots))
+        started = time.perf_counter()
+        for block in range(0, lots, 250):
+            part = slice(block, block + 250)
+            evaluate_lots(rng.uniform(100, 5000, 250), rng.integers(0, 5, 250), rng.integers(0, 20, 250),
+                          farm_xyz[part], cube, market_xyz, rates)
+        # 10k lots x 500 markets x 16 days = 80M options
+        self.assertLess(time.perf_counter() - started, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
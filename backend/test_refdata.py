@@ -0,0 +1,81 @@
+import threading
+import unittest
+
+from refdata import ReferenceData
+
+
+class FakeListenConnection:
+    def __init__(self):
+        self.autocommit = False
+        self.notifies = []
+        self.polls = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        pass
+
+    def close(self):
+        pass
+
+    def poll(self):
+        self.polls += 1
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestNotificationPolling(unittest.TestCase):
+    def setUp(self):
+        self.made = []
+        self.clock = FakeClock()
+        self.refdata = ReferenceData(poll_interval=1.0, connect=self.connect, clock=self.clock)
+
+    def connect(self):
+        conn = FakeListenConnection()
+        self.made.append(conn)
+        return conn
+
+    def test_polls_at_most_once_per_interval(self):
+        for _ in range(10000):
+            self.refdata._poll_notifications()
+        self.assertEqual(self.made[0].polls, 1)
+
+        self.clock.now += 1.0
+        self.made[0].notifies.append('refdata_changed')
+        self.refdata._poll_notifications()
+        self.assertEqual(self.made[0].polls, 2)
+        self.assertEqual(self.refdata.invalidations, 1)
+        self.assertEqual(self.made[0].notifies, [])
+
+    def test_concurrent_lookups_open_one_connection(self):
+        start = threading.Barrier(8)
+
+        def lookup():
+            start.wait()
+            for _ in range(100):
+                self.refdata._poll_notifications()
+
+        threads = [threading.Thread(target=lookup) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(self.made), 1)
+        self.assertTrue(self.refdata.stats()["listening"])
+
+    def test_failed_connect_backs_off(self):
+        refdata = ReferenceData(poll_interval=0.0, connect=lambda: None, clock=self.clock)
+        refdata._poll_notifications()
+        self.assertEqual(refdata._listen_retry_at, self.clock.now + 30.0)
+        self.assertFalse(refdata.stats()["listening"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from speech_token import SpeechTokenCache, SpeechTokenError
+
+
+class FakeTokenEndpoint:
+    """Local stand-in for Azure's issueToken endpoint: counts calls, optionally slow or failing."""
+
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+        self.status = 200
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                endpoint.calls += 1
+                if endpoint.delay:
+                    time.sleep(endpoint.delay)
+                body = f"token-{endpoint.calls}".encode()
+                self.send_response(endpoint.status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/sts/v1.0/issueToken"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSpeechTokenCache(unittest.TestCase):
+    def setUp(self):
+        self.endpoint = FakeTokenEndpoint()
+        self.clock = FakeClock()
+        self.cache = SpeechTokenCache('key', 'centralindia', url=self.endpoint.url,
+                                      lifetime=600, refresh_after=480, clock=self.clock)
+
+    def tearDown(self):
+        self.endpoint.close()
+
+    def test_token_is_reused(self):
+        self.assertEqual(self.cache.get()[0], 'token-1')
+        self.clock.now += 100
+        token, expires_in = self.cache.get()
+        self.assertEqual(token, 'token-1')
+        self.assertEqual(expires_in, 500)
+        self.assertEqual(self.endpoint.calls, 1)
+
+    def test_concurrent_callers_share_one_fetch(self):
+        self.endpoint.delay = 0.2
+        tokens = []
+        threads = [threading.Thread(target=lambda: tokens.append(self.cache.get()[0])) for _ in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(tokens, ['token-1'] * 20)
+        self.assertEqual(self.endpoint.calls, 1)
+
+    def test_refresh_ahead_runs_in_background(self):
+        self.cache.get()
+        self.clock.now += 500
+        self.endpoint.delay = 0.2
+        started = time.perf_counter()
+        # Still served the current token without waiting on the refresh
+        self.assertEqual(self.cache.get()[0], 'token-1')
+        self.assertEqual(self.cache.get()[0], 'token-1')
+        self.assertLess(time.perf_counter() - started, 0.1)
+
+        self.cache.wait_for_refresh(5)
+        self.assertEqual(self.cache.get()[0], 'token-2')
+        self.assertEqual(self.endpoint.calls, 2)
+
+    def test_expired_token_is_fetched_synchronously(self):
+        self.cache.get()
+        self.clock.now += 601
+        self.assertEqual(self.cache.get()[0], 'token-2')
+
+    def test_failed_background_refresh_keeps_current_token(self):
+        self.cache.get()
+        self.clock.now += 500
+        self.endpoint.status = 429
+        self.assertEqual(self.cache.get()[0], 'token-1')
+        self.cache.wait_for_refresh(5)
+        self.assertEqual(self.cache.refresh_errors, 1)
+        self.assertEqual(self.cache.get()[0], 'token-1')
+
+    def test_upstream_error_without_token(self):
+        self.endpoint.status = 401
+        with self.assertRaises(SpeechTokenError) as ctx:
+            self.cache.get()
+        self.assertEqual(ctx.exception.status_code, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
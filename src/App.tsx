@@ -4,9 +4,22 @@ import Dashboard from './components/Dashboard';
 import { ThemeProvider } from './context/ThemeContext';
 import { LanguageProvider } from './context/LanguageContext';
 import { UserProvider } from './context/UserContext';
+import { clearSession, getSessionToken, SESSION_EXPIRED_EVENT } from './context/session';
 
 export default function App() {
-  const [isLoggedIn, setIsLoggedIn] = useState(false);
+  // A saved, unexpired session skips the login page on reload
+  const [isLoggedIn, setIsLoggedIn] = useState(() => getSessionToken() !== null);
+
+  useEffect(() => {
+    const onExpired = () => setIsLoggedIn(false);
+    window.addEventListener(SESSION_EXPIRED_EVENT, onExpired);
+    return () => window.removeEventListener(SESSION_EXPIRED_EVENT, onExpired);
+  }, []);
+
+  const logout = () => {
+    clearSession();
+    setIsLoggedIn(false);
+  };
 
   return (
     <ThemeProvider>
@@ -15,7 +28,7 @@ export default function App() {
           {!isLoggedIn ? (
             <LoginPage onLogin={() => setIsLoggedIn(true)} />
           ) : (
-            <Dashboard onLogout={() => setIsLoggedIn(false)} />
+            <Dashboard onLogout={logout} />
           )}
         </UserProvider>
       </LanguageProvider>
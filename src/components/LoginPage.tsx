@@ -2,6 +2,7 @@ import { useState } from 'react';
 import { Sun, Moon, Languages, Sprout } from 'lucide-react';
 import { useTheme } from '../context/ThemeContext';
 import { useLanguage } from '../context/LanguageContext';
+import { saveSession } from '../context/session';
 
 interface LoginPageProps {
   onLogin: () => void;
@@ -60,6 +61,7 @@ export default function LoginPage({ onLogin }: LoginPageProps) {
         alert('Account created successfully! Please login.');
         setIsSignup(false);
       } else {
+        saveSession(result.token, result.expires_in);
         onLogin();
       }
     } catch (err: any) {
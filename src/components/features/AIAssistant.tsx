@@ -1,6 +1,7 @@
 import { useState, useRef, useEffect } from 'react';
 import { Send, Mic, MicOff, Volume2, Bot, User, Loader2, Languages } from 'lucide-react';
 import { useUser } from '../../context/UserContext';
+import { authFetch } from '../../context/session';
 import * as SpeechSDK from 'microsoft-cognitiveservices-speech-sdk';
 
 // Language Configuration
@@ -29,6 +30,8 @@ export default function AIAssistant() {
   const [isLoading, setIsLoading] = useState(false);
   const [selectedLang, setSelectedLang] = useState(SUPPORTED_LANGUAGES[0]);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  // The server keeps this conversation's history, so each request only sends the new message
+  const sessionIdRef = useRef<string>(crypto.randomUUID());
 
   // Refs for Speech SDK
   const recognizerRef = useRef<SpeechSDK.SpeechRecognizer | null>(null);
@@ -201,37 +204,89 @@ export default function AIAssistant() {
     setIsLoading(true);
 
     try {
-      const res = await fetch('http://localhost:5000/api/ai/chat', {
+      const res = await authFetch('http://localhost:5000/api/ai/chat', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
           message: userMessage.content,
           // Pass language context to AI so it replies in same language
-          system_prompt_addition: `Reply in ${selectedLang.name}.`
+          system_prompt_addition: `Reply in ${selectedLang.name}.`,
+          session_id: sessionIdRef.current,
+          // Tokens arrive as server-sent events so the reply renders while it is generated
+          stream: true
         })
       });
 
-      const data = await res.json();
-
-      if (data.response) {
-        const aiResponse = {
-          role: 'assistant',
-          content: data.response,
-          timestamp: new Date(),
-        };
-        setMessages(prev => [...prev, aiResponse]);
-        speakText(data.response);
-      } else {
+      if (!res.ok || !res.body) {
+        const data = await res.json().catch(() => ({}));
         throw new Error(data.error || 'Unknown error');
       }
 
+      // Placeholder message that fills in as deltas arrive
+      setMessages(prev => [...prev, { role: 'assistant', content: '', timestamp: new Date() }]);
+      const appendToReply = (text: string) => {
+        setMessages(prev => {
+          const next = [...prev];
+          const last = next[next.length - 1];
+          next[next.length - 1] = { ...last, content: last.content + text };
+          return next;
+        });
+      };
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let reply = '';
+      let finished = false;
+
+      while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+          const block = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+
+          let event = 'message';
+          let payload = '';
+          block.split('\n').forEach(line => {
+            if (line.startsWith('event: ')) event = line.slice(7);
+            else if (line.startsWith('data: ')) payload += line.slice(6);
+          });
+          const data = payload ? JSON.parse(payload) : {};
+
+          if (event === 'message' && data.delta) {
+            reply += data.delta;
+            appendToReply(data.delta);
+            setIsLoading(false);
+          } else if (event === 'error') {
+            throw new Error(data.error || 'Unknown error');
+          } else if (event === 'done') {
+            finished = true;
+          }
+        }
+      }
+
+      if (!reply) {
+        throw new Error('Empty response');
+      }
+      speakText(reply);
+
     } catch (err) {
       console.error(err);
-      setMessages(prev => [...prev, {
-        role: 'assistant',
-        content: 'Sorry, I encountered an error communicating with the AI server.',
-        timestamp: new Date(),
-      }]);
+      setMessages(prev => {
+        // Drop the streaming placeholder if nothing arrived before the error
+        const last = prev[prev.length - 1];
+        const kept = last && last.role === 'assistant' && !last.content ? prev.slice(0, -1) : prev;
+        return [...kept, {
+          role: 'assistant',
+          content: 'Sorry, I encountered an error communicating with the AI server.',
+          timestamp: new Date(),
+        }];
+      });
     } finally {
       setIsLoading(false);
     }
@@ -9,6 +9,7 @@ interface Market {
   location: string;
   coordinates: { lat: number; lng: number };
   spoilageRisk?: string;
+  distanceKm?: number;
 }
 
 interface Crop {
@@ -23,6 +24,19 @@ interface PriceData {
   priceHistory: { date: string; price: number | null; predicted: number | null }[];
 }
 
+interface PriceSummary {
+  market: string;
+  location: string;
+  current_price: number;
+  previous_price: number;
+  max_predicted: number;
+  low: number;
+  high: number;
+  avg: number;
+  history: { date: string; price: number }[];
+  forecast: { date: string; price: number }[];
+}
+
 export default function MarketExplorer() {
   const [searchQuery, setSearchQuery] = useState('');
   const [selectedMarketId, setSelectedMarketId] = useState<number | null>(null); // Store ID only to prevent stale state
@@ -30,6 +44,8 @@ export default function MarketExplorer() {
   const [transportStart, setTransportStart] = useState('');
 
   const [markets, setMarkets] = useState<Market[]>([]);
+  // Closest markets to the user's position, when the browser shares it
+  const [nearbyMarkets, setNearbyMarkets] = useState<Market[] | null>(null);
   const [crops, setCrops] = useState<Crop[]>([]);
   const [selectedCrop, setSelectedCrop] = useState<string>('');
   const [marketPrices, setMarketPrices] = useState<{ [key: string]: PriceData }>({});
@@ -59,6 +75,23 @@ export default function MarketExplorer() {
     fetchData();
   }, []);
 
+  useEffect(() => {
+    if (!navigator.geolocation) return;
+    navigator.geolocation.getCurrentPosition(
+      async (position) => {
+        try {
+          const { latitude, longitude } = position.coords;
+          const res = await fetch(`/api/markets/nearest?lat=${latitude}&lng=${longitude}&k=50`);
+          if (res.ok) setNearbyMarkets(await res.json());
+        } catch (err) {
+          console.error("Error fetching nearby markets:", err);
+        }
+      },
+      // Without a position every market is listed, as before
+      () => {}
+    );
+  }, []);
+
   // Fetch Prices for Selected Crop
   useEffect(() => {
     if (!selectedCrop) return;
@@ -66,46 +99,26 @@ export default function MarketExplorer() {
     const fetchPrices = async () => {
       setLoading(true);
       try {
-        const res = await fetch(`/api/prices?crop=${encodeURIComponent(selectedCrop)}`);
-        const data = await res.json();
+        const res = await fetch(`/api/prices/summary?crop=${encodeURIComponent(selectedCrop)}`);
+        const data: PriceSummary[] = await res.json();
 
-        // Process data by market
+        // The server already trims each market to the last 15 history / next 15 forecast points
         const pricesByMarket: { [key: string]: PriceData } = {};
 
-        const groups: { [key: string]: any[] } = {};
-        data.forEach((d: any) => {
-          if (!groups[d.market]) groups[d.market] = [];
-          groups[d.market].push(d);
-        });
-
-        Object.keys(groups).forEach(mName => {
-          const points = groups[mName];
-          points.sort((a: any, b: any) => new Date(a.date).getTime() - new Date(b.date).getTime());
-
-          const history = points.filter((p: any) => !p.is_predicted);
-          const currentPrice = history.length > 0 ? history[history.length - 1].price : 0;
-
-          const predictions = points.filter((p: any) => p.is_predicted);
-          const predictedPrice = predictions.length > 0 ? Math.max(...predictions.map((p: any) => p.price)) : currentPrice;
-
-          // Format chart data with continuity
-          const recentHistory = history.slice(-15); // Show last 15 days
-          const nearForecast = predictions.slice(0, 15); // Show next 15 days
-
-          const chartData = recentHistory.map((p: any) => ({
+        data.forEach(summary => {
+          const chartData: PriceData['priceHistory'] = summary.history.map(p => ({
             date: new Date(p.date).toLocaleDateString('en-US', { month: 'short', day: 'numeric' }),
             price: p.price,
             predicted: null
           }));
 
           // Continuity bridge
-          if (recentHistory.length > 0) {
-            const lastHist = recentHistory[recentHistory.length - 1];
+          if (chartData.length > 0) {
             // We make the last history point also the start of prediction line
-            chartData[chartData.length - 1].predicted = lastHist.price;
+            chartData[chartData.length - 1].predicted = chartData[chartData.length - 1].price;
           }
 
-          nearForecast.forEach((p: any) => {
+          summary.forecast.forEach(p => {
             chartData.push({
               date: new Date(p.date).toLocaleDateString('en-US', { month: 'short', day: 'numeric' }),
               price: null,
@@ -113,10 +126,10 @@ export default function MarketExplorer() {
             });
           });
 
-          pricesByMarket[mName] = {
-            marketName: mName,
-            currentPrice,
-            predictedPrice,
+          pricesByMarket[summary.market] = {
+            marketName: summary.market,
+            currentPrice: summary.current_price,
+            predictedPrice: summary.max_predicted,
             priceHistory: chartData
           };
         });
@@ -135,7 +148,7 @@ export default function MarketExplorer() {
 
   // Derive display data dynamically so it updates when selectedCrop changes
   const displayMarkets = useMemo(() => {
-    return markets.map(m => {
+    return (nearbyMarkets ?? markets).map(m => {
       const pricing = marketPrices[m.name] || {
         marketName: m.name,
         currentPrice: 0,
@@ -146,9 +159,9 @@ export default function MarketExplorer() {
       const quantityKg = 1000;
       const estimatedProfit = pricing.currentPrice * quantityKg;
 
-      // Seeded random logic for consistency
+      // Real distance when we know where the user is; otherwise a seeded estimate
       const seed = m.id * 123;
-      const distance = (seed % 300) + 20;
+      const distance = m.distanceKm !== undefined ? Math.round(m.distanceKm) : (seed % 300) + 20;
       const transportCost = Math.round(distance * 25);
 
       return {
@@ -160,7 +173,7 @@ export default function MarketExplorer() {
         spoilageRisk: m.spoilageRisk || (distance > 150 ? 'Medium' : 'Low'),
       };
     });
-  }, [markets, marketPrices]);
+  }, [markets, nearbyMarkets, marketPrices]);
 
   const filteredMarkets = displayMarkets.filter(market =>
     market.name.toLowerCase().includes(searchQuery.toLowerCase()) ||
@@ -1,12 +1,13 @@
 import { useState, useEffect } from 'react';
 import { Bell, TrendingUp, Cloud, DollarSign, Truck, AlertTriangle, X, Check } from 'lucide-react';
 import { useUser } from '../../context/UserContext';
+import { authFetch } from '../../context/session';
 
 export default function NotificationsPanel() {
   const { notifications, addNotification, clearNotification } = useUser();
   const [activeFilter, setActiveFilter] = useState('all');
 
-  // Simulate adding notifications
+  // Watchlist alerts from the backend; the samples below only fill an empty feed
   useEffect(() => {
     const sampleNotifications = [
       {
@@ -61,12 +62,34 @@ export default function NotificationsPanel() {
       },
     ];
 
-    // Add initial notifications if empty
-    if (notifications.length === 0) {
+    const fetchNotifications = async () => {
+      try {
+        const res = await authFetch('/api/notifications?limit=50');
+        if (res.ok) {
+          const data = await res.json();
+          if (data.length > 0) {
+            data.forEach((n: any) => addNotification({ ...n, serverId: n.id, actionable: n.marketId != null }));
+            return;
+          }
+        }
+      } catch (error) {
+        console.error('Error fetching notifications:', error);
+      }
       sampleNotifications.forEach(notif => addNotification(notif));
+    };
+
+    if (notifications.length === 0) {
+      fetchNotifications();
     }
   }, []);
 
+  const dismissNotification = (notification: any) => {
+    if (notification.serverId) {
+      authFetch(`/api/notifications/${notification.serverId}/read`, { method: 'POST' }).catch(() => {});
+    }
+    clearNotification(notification.id);
+  };
+
   const getIcon = (type: string) => {
     switch (type) {
       case 'price':
@@ -174,7 +197,7 @@ export default function NotificationsPanel() {
                     <div className="flex items-start justify-between mb-2">
                       <h3 className="font-semibold text-gray-800 dark:text-white">{notification.title}</h3>
                       <button
-                        onClick={() => clearNotification(notification.id)}
+                        onClick={() => dismissNotification(notification)}
                         className="text-gray-400 hover:text-gray-600 dark:hover:text-gray-300 transition-colors"
                       >
                         <X className="w-5 h-5" />
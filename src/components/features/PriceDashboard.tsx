@@ -19,6 +19,20 @@ interface PricePoint {
   is_predicted: boolean;
   market: string;
   crop: string;
+  // Present for week/month resolution, where price is the period average
+  open?: number;
+  high?: number;
+  low?: number;
+  close?: number;
+}
+
+interface PriceSummary {
+  market: string;
+  current_price: number;
+  previous_price: number;
+  low: number;
+  high: number;
+  avg: number;
 }
 
 interface ChartPoint {
@@ -28,6 +42,15 @@ interface ChartPoint {
   predictedPrice: number | null;
 }
 
+const RANGE_RESOLUTION: { [range: string]: string } = {
+  '7d': 'day',
+  '1m': 'day',
+  '3m': 'day',
+  '6m': 'week',
+  '1y': 'week',
+  '3y': 'month'
+};
+
 export default function PriceDashboard() {
   const [selectedCrop, setSelectedCrop] = useState('');
   const [selectedMarket, setSelectedMarket] = useState('');
@@ -72,17 +95,9 @@ export default function PriceDashboard() {
       setLoading(true);
       setError(null);
       try {
-        const res = await fetch(`/api/prices?crop=${encodeURIComponent(selectedCrop)}`);
-        const data: PricePoint[] = await res.json();
-
-        // 1. Chart Data Processing
-        const targetMarket = selectedMarket || (markets.length > 0 ? markets[0].name : (data.length > 0 ? data[0].market : ''));
-        const marketData = data.filter(d => d.market === targetMarket);
-
-        if (marketData.length === 0) {
-          setChartData([]);
-          return;
-        }
+        // Full series only for the charted market; every other market comes back pre-aggregated
+        const targetMarket = selectedMarket || (markets.length > 0 ? markets[0].name : '');
+        const crop = encodeURIComponent(selectedCrop);
 
         // Time Range Filter
         const now = new Date();
@@ -91,11 +106,49 @@ export default function PriceDashboard() {
         if (timeRange === '1m') cutoff.setMonth(now.getMonth() - 1);
         if (timeRange === '3m') cutoff.setMonth(now.getMonth() - 3);
         if (timeRange === '6m') cutoff.setMonth(now.getMonth() - 6);
+        if (timeRange === '1y') cutoff.setFullYear(now.getFullYear() - 1);
+        if (timeRange === '3y') cutoff.setFullYear(now.getFullYear() - 3);
+        const from = cutoff.toISOString().slice(0, 10);
+        // Longer ranges use server-side weekly/monthly candles so the point count stays small
+        const resolution = RANGE_RESOLUTION[timeRange] || 'day';
+
+        const [pricesRes, summaryRes] = await Promise.all([
+          fetch(`/api/prices?crop=${crop}&market=${encodeURIComponent(targetMarket)}&from=${from}&resolution=${resolution}`),
+          fetch(`/api/prices/summary?crop=${crop}&history=2&forecast=0`)
+        ]);
+        const marketData: PricePoint[] = await pricesRes.json();
+        const summaries: PriceSummary[] = await summaryRes.json();
 
-        const filteredRawData = marketData.filter((d) => {
-          const dDate = new Date(d.date);
-          return dDate >= cutoff;
-        }).sort((a, b) => new Date(a.date).getTime() - new Date(b.date).getTime());
+        // 1. Market Stats
+        const summaryByMarket: { [key: string]: PriceSummary } = {};
+        summaries.forEach(s => { summaryByMarket[s.market] = s; });
+
+        const stats = markets.map(m => {
+          const s = summaryByMarket[m.name];
+          if (!s) return null;
+
+          const change = s.previous_price !== 0 ? ((s.current_price - s.previous_price) / s.previous_price) * 100 : 0;
+
+          return {
+            name: m.name,
+            location: m.location,
+            low: s.low.toFixed(2),
+            high: s.high.toFixed(2),
+            avg: s.avg.toFixed(2),
+            change24h: (change > 0 ? '+' : '') + change.toFixed(1) + '%',
+            trend: change >= 0 ? 'up' : 'down'
+          };
+        }).filter(Boolean);
+        setMarketStats(stats);
+
+        // 2. Chart Data Processing
+        if (marketData.length === 0) {
+          setChartData([]);
+          return;
+        }
+
+        // The server applies the time range and returns rows in date order
+        const filteredRawData = marketData;
 
         // Build Chart Data
         const processedChartData: ChartPoint[] = [];
@@ -135,35 +188,6 @@ export default function PriceDashboard() {
 
         setChartData(processedChartData);
 
-        // 2. Compute Market Stats
-        const marketGroups: { [key: string]: PricePoint[] } = {};
-        data.forEach(d => {
-          if (!marketGroups[d.market]) marketGroups[d.market] = [];
-          marketGroups[d.market].push(d);
-        });
-
-        const stats = markets.map(m => {
-          const mPrices = marketGroups[m.name] || [];
-          if (mPrices.length === 0) return null;
-
-          const prices = mPrices.map(d => d.price);
-          const historyPrices = mPrices.filter(d => !d.is_predicted);
-          const current = historyPrices.length > 0 ? historyPrices[historyPrices.length - 1].price : 0;
-          const prev = historyPrices.length > 1 ? historyPrices[historyPrices.length - 2].price : current;
-          const change = prev !== 0 ? ((current - prev) / prev) * 100 : 0;
-
-          return {
-            name: m.name,
-            location: m.location,
-            low: Math.min(...prices).toFixed(2),
-            high: Math.max(...prices).toFixed(2),
-            avg: (prices.reduce((a, b) => a + b, 0) / prices.length).toFixed(2),
-            change24h: (change > 0 ? '+' : '') + change.toFixed(1) + '%',
-            trend: change >= 0 ? 'up' : 'down'
-          };
-        }).filter(Boolean);
-        setMarketStats(stats);
-
       } catch (err: any) {
         console.error("Failed to fetch prices:", err);
         setError("Error loading data");
@@ -219,7 +243,7 @@ export default function PriceDashboard() {
           <div>
             <label className="block text-sm font-medium text-gray-700 dark:text-gray-300 mb-2">Time Range</label>
             <div className="flex gap-2">
-              {['7d', '1m', '3m', '6m'].map((range) => (
+              {['7d', '1m', '3m', '6m', '1y', '3y'].map((range) => (
                 <button
                   key={range}
                   onClick={() => setTimeRange(range)}
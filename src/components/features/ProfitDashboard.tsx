@@ -1,9 +1,37 @@
+import { useEffect, useState } from 'react';
 import { DollarSign, TrendingUp, Calendar, MapPin } from 'lucide-react';
 import { BarChart, Bar, LineChart, Line, PieChart, Pie, Cell, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 import { useUser } from '../../context/UserContext';
+import { authFetch } from '../../context/session';
+
+interface ProfitTotals {
+  gross: number;
+  transport_cost: number;
+  spoilage_cost: number;
+  net: number;
+  by_market: { market: string; net: number }[];
+}
 
 export default function ProfitDashboard() {
   const { confirmedMarkets, farmData } = useUser();
+  const [totals, setTotals] = useState<ProfitTotals | null>(null);
+
+  useEffect(() => {
+    // Best market and sell date for each of the farmer's lots
+    const fetchRecommendations = async () => {
+      try {
+        const res = await authFetch('/api/profit/recommendations');
+        if (!res.ok) return;
+        const data = await res.json();
+        if (data.lots.some((lot: { recommendation: unknown }) => lot.recommendation)) {
+          setTotals(data.totals);
+        }
+      } catch (error) {
+        console.error('Error fetching profit recommendations:', error);
+      }
+    };
+    fetchRecommendations();
+  }, [farmData]);
 
   const monthlyProfits = [
     { month: 'Sep', profit: 45000, cost: 20000 },
@@ -14,14 +42,22 @@ export default function ProfitDashboard() {
     { month: 'Feb', profit: 62000, cost: 25000 },
   ];
 
-  const profitBreakdown = [
+  const profitBreakdown = totals ? [
+    { name: 'Crop Sales', value: Math.round(totals.gross), color: '#10b981' },
+    { name: 'Transport Costs', value: Math.round(totals.transport_cost), color: '#f59e0b' },
+    { name: 'Spoilage Losses', value: Math.round(totals.spoilage_cost), color: '#ef4444' },
+    { name: 'Net Profit', value: Math.round(totals.net), color: '#3b82f6' },
+  ] : [
     { name: 'Crop Sales', value: 180000, color: '#10b981' },
     { name: 'Transport Costs', value: 25000, color: '#f59e0b' },
     { name: 'Storage Costs', value: 15000, color: '#ef4444' },
     { name: 'Net Profit', value: 140000, color: '#3b82f6' },
   ];
 
-  const marketComparison = [
+  const marketComparison = totals ? totals.by_market.slice(0, 6).map(m => ({
+    market: m.market,
+    profit: Math.round(m.net),
+  })) : [
     { market: 'Azadpur', profit: 52000 },
     { market: 'Vashi', profit: 48500 },
     { market: 'Koyambedu', profit: 45200 },
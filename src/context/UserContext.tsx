@@ -30,7 +30,8 @@ export function UserProvider({ children }: { children: ReactNode }) {
   };
 
   const addNotification = (notification: any) => {
-    setNotifications(prev => [...prev, { ...notification, id: Date.now().toString() }]);
+    // Several can arrive in the same millisecond (a page of server alerts)
+    setNotifications(prev => [...prev, { ...notification, id: `${Date.now()}-${prev.length}` }]);
   };
 
   const clearNotification = (id: string) => {
@@ -0,0 +1,39 @@
+// Signed session token from /login. Requests send it instead of credentials,
+// and the backend checks it with an HMAC rather than the password hash.
+const TOKEN_KEY = 'sessionToken';
+const EXPIRES_KEY = 'sessionExpiresAt';
+export const SESSION_EXPIRED_EVENT = 'session-expired';
+
+export function saveSession(token: string, expiresIn: number) {
+  localStorage.setItem(TOKEN_KEY, token);
+  localStorage.setItem(EXPIRES_KEY, String(Date.now() + expiresIn * 1000));
+}
+
+export function clearSession() {
+  localStorage.removeItem(TOKEN_KEY);
+  localStorage.removeItem(EXPIRES_KEY);
+}
+
+export function getSessionToken(): string | null {
+  const token = localStorage.getItem(TOKEN_KEY);
+  const expiresAt = Number(localStorage.getItem(EXPIRES_KEY));
+  if (!token || !expiresAt || expiresAt <= Date.now()) {
+    return null;
+  }
+  return token;
+}
+
+export async function authFetch(input: string, init: RequestInit = {}) {
+  const token = getSessionToken();
+  const headers = new Headers(init.headers);
+  if (token) {
+    headers.set('Authorization', `Bearer ${token}`);
+  }
+  const response = await fetch(input, { ...init, headers });
+  if (response.status === 401 && token) {
+    // Expired or revoked: drop it and send the user back to the login page
+    clearSession();
+    window.dispatchEvent(new Event(SESSION_EXPIRED_EVENT));
+  }
+  return response;
+}